@@ -1,5 +1,6 @@
+import asyncio
 from dataclasses import dataclass, field
-from typing import TypedDict, Union, Literal, Generic, TypeVar
+from typing import TypedDict, Union, Literal, Generic, Optional, TypeVar
 
 import numpy as np
 
@@ -44,6 +45,10 @@ class QueryParam:
     max_token_for_global_context: int = 2000
     # Number of tokens for the entity descriptions
     max_token_for_local_context: int = 2000
+    # If True, the final response is returned as an async iterator of text chunks (see LightRAG.aquery_stream).
+    stream: bool = False
+    # Restrict "naive" mode chunk retrieval to these documents (full_doc_id); None searches all documents.
+    doc_ids: Optional[list[str]] = None
 
 
 @dataclass
@@ -65,15 +70,42 @@ class BaseVectorStorage(StorageNameSpace):
     embedding_func: EmbeddingFunc
     meta_fields: set = field(default_factory=set)
 
-    async def query(self, query: str, top_k: int) -> list[dict]:
+    async def query(
+        self, query: str, top_k: int, filters: Optional[dict] = None
+    ) -> list[dict]:
+        """filters restricts the search to records whose meta_fields match,
+        e.g. {"full_doc_id": ["doc-1", "doc-2"]}; fields are ANDed, values of one field are ORed.
+        """
         raise NotImplementedError
 
+    async def query_batch(
+        self, queries: list[str], top_k: int, filters: Optional[dict] = None
+    ) -> list[list[dict]]:
+        """Query several texts at once, results are in the same order as queries.
+        The default issues one query per text, storages override it to search all texts together.
+        """
+        return list(
+            await asyncio.gather(
+                *[self.query(q, top_k=top_k, filters=filters) for q in queries]
+            )
+        )
+
     async def upsert(self, data: dict[str, dict]):
         """Use 'content' field from value for embedding, use key as id.
         If embedding_func is None, use 'embedding' field from value
         """
         raise NotImplementedError
 
+    def ids_missing_meta(self, name: str) -> set[str]:
+        """ids of records saved without meta field `name`, e.g. written before it was
+        added to meta_fields. Storages keeping metadata in table columns return an empty set.
+        """
+        return set()
+
+    async def update_meta(self, metas: dict[str, dict]):
+        """Set meta_fields of existing records without re-embedding them, unknown ids are ignored"""
+        raise NotImplementedError
+
 
 @dataclass
 class BaseKVStorage(Generic[T], StorageNameSpace):
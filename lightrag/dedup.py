@@ -0,0 +1,326 @@
+"""
+近重复文本块检测。
+
+对文本块内容计算 MinHash 签名（字符 5-gram，128 个哈希函数），并用 LSH（16 个 band，每个 8 行）
+查找相似文本块。估计的 Jaccard 相似度达到阈值时，文本块直接复用相似文本块的实体提取结果，
+不再调用 LLM。
+
+索引与提取结果保存在 near_duplicates_{namespace}.log 中，记录格式与 wal_kv 的 wal.log 相同，
+每个文本块一条记录。文本块的提取结果加入后不再改变，index_done_callback 只追加上次落盘后新增的文本块，
+加载时末尾不完整或校验失败的记录被截断。首次启动时若存在旧的 near_duplicates_{namespace}.json，
+其内容会被导入日志，旧文件保留不变。
+
+MinHash 签名在线程池中计算，prepare_signatures 可以一次计算一批文本块的签名。
+"""
+
+import asyncio
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+import numpy as np
+
+from .base import StorageNameSpace
+from .utils import load_json, logger
+from .wal_kv import _append_records, _decode, _encode, _pack, _read_records
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_PERM // NUM_BANDS
+
+_rng = np.random.default_rng(1)
+# multiply-shift 哈希族：((a * x + b) mod 2^64) >> 32，a 取奇数
+_PERM_A = _rng.integers(1, 2**63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+_SHINGLE_BASE = np.uint64(1000003)
+# 编码后超过该长度的记录以 zlib 压缩
+_COMPRESS_BYTES = 1024
+
+
+def minhash_signature(content: str) -> np.ndarray:
+    """
+    计算文本的 MinHash 签名。文本先转小写并合并空白，再以字符 5-gram 作为 shingle。
+
+    Args:
+        content (str): 文本内容
+
+    Returns:
+        np.ndarray: 长度为 NUM_PERM 的 uint32 签名
+    """
+    text = re.sub(r"\s+", " ", content.lower()).strip()
+    if len(text) < SHINGLE_SIZE:
+        text = text.ljust(SHINGLE_SIZE)
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    n = len(codes) - SHINGLE_SIZE + 1
+    shingles = np.zeros(n, dtype=np.uint64)
+    for i in range(SHINGLE_SIZE):
+        shingles = shingles * _SHINGLE_BASE + codes[i : i + n]
+    shingles = np.unique(shingles)
+
+    signature = np.empty(NUM_PERM, dtype=np.uint32)
+    # 按块计算，避免 NUM_PERM x len(shingles) 的中间矩阵过大
+    block = max(1, (1 << 20) // NUM_PERM)
+    for start in range(0, len(shingles), block):
+        hashed = (
+            (_PERM_A[:, None] * shingles[None, start : start + block] + _PERM_B[:, None])
+            >> np.uint64(32)
+        ).min(axis=1)
+        if start == 0:
+            signature[:] = hashed
+        else:
+            np.minimum(signature, hashed, out=signature)
+    return signature
+
+
+@dataclass
+class NearDuplicateIndex(StorageNameSpace):
+    """
+    近重复文本块索引。
+
+    extract_or_reuse 在提取前查询索引：命中已完成的相似文本块时复用其结果，
+    命中正在提取的相似文本块时等待其完成后复用，否则调用提取函数并把结果加入索引。
+    复用的节点、边的 source_id 改写为当前文本块，合并后相似文本块都会记录在 source_id 中。
+    """
+
+    threshold: float = 0.9
+    # 累计统计：复用相似文本块的文本块数、省下的 LLM 调用数，
+    # 以及再次插入时直接使用自身已有提取结果的文本块数
+    stats: dict = field(
+        default_factory=lambda: {
+            "reused_chunks": 0,
+            "llm_calls_avoided": 0,
+            "cached_chunks": 0,
+        }
+    )
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._file_name = os.path.join(
+            working_dir, f"near_duplicates_{self.namespace}.log"
+        )
+        self.threshold = self.global_config.get(
+            "near_duplicate_threshold", self.threshold
+        )
+        # 文本块 id -> {"signature", "nodes", "edges", "llm_calls"}
+        self._data: dict[str, dict] = {}
+        self._signatures: dict[str, np.ndarray] = {}
+        self._bands: list[dict[bytes, list[str]]] = [{} for _ in range(NUM_BANDS)]
+        # 正在提取的文本块 id -> future
+        self._inflight: dict[str, asyncio.Future] = {}
+        # prepare_signatures 预先算好、尚未使用的签名
+        self._prepared: dict[str, np.ndarray] = {}
+        # 上次落盘后新增的文本块 id
+        self._unsaved: list[str] = []
+        self._lock = asyncio.Lock()
+
+        self._load()
+        logger.info(f"Load near duplicate index {self.namespace} with {len(self._data)} data")
+
+    def _load(self):
+        if not os.path.exists(self._file_name):
+            self._migrate_json()
+            return
+        records, valid_bytes, size = _read_records(self._file_name)
+        for chunk_key, value in records:
+            self._add_entry(chunk_key, _decode(value))
+        if valid_bytes < size:
+            logger.warning(f"Truncating incomplete near duplicate record in {self._file_name}")
+            with open(self._file_name, "r+b") as f:
+                f.truncate(valid_bytes)
+
+    def _migrate_json(self):
+        json_file = os.path.join(
+            self.global_config["working_dir"], f"near_duplicates_{self.namespace}.json"
+        )
+        data = load_json(json_file)
+        if not data:
+            return
+        logger.info(f"Migrating {len(data)} near duplicate entries from {json_file}")
+        for chunk_key, entry in data.items():
+            self._add_entry(chunk_key, entry)
+        _append_records(
+            self._file_name,
+            [_pack(k, _encode(v, _COMPRESS_BYTES)) for k, v in data.items()],
+        )
+
+    def _add_entry(self, chunk_key: str, entry: dict):
+        self._data[chunk_key] = entry
+        self._add_signature(chunk_key, np.array(entry["signature"], dtype=np.uint32))
+
+    async def index_done_callback(self):
+        async with self._lock:
+            if not self._unsaved:
+                return
+            unsaved, self._unsaved = self._unsaved, []
+            records = [
+                _pack(k, _encode(self._data[k], _COMPRESS_BYTES)) for k in unsaved
+            ]
+            await asyncio.get_running_loop().run_in_executor(
+                None, _append_records, self._file_name, records
+            )
+
+    async def prepare_signatures(self, chunks: dict[str, str]):
+        """
+        在线程池中一次计算一批文本块的签名，extract_or_reuse 直接使用算好的签名。
+
+        Args:
+            chunks (dict[str, str]): 文本块 id 到文本块内容的映射
+        """
+        chunks = {
+            k: v
+            for k, v in chunks.items()
+            if k not in self._data and k not in self._prepared
+        }
+        if not chunks:
+            return
+        signatures = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: [minhash_signature(c) for c in chunks.values()]
+        )
+        self._prepared.update(zip(chunks.keys(), signatures))
+
+    def _band_keys(self, signature: np.ndarray) -> list[bytes]:
+        return [
+            signature[i * ROWS_PER_BAND : (i + 1) * ROWS_PER_BAND].tobytes()
+            for i in range(NUM_BANDS)
+        ]
+
+    def _add_signature(self, chunk_key: str, signature: np.ndarray):
+        self._signatures[chunk_key] = signature
+        for band, key in zip(self._bands, self._band_keys(signature)):
+            band.setdefault(key, []).append(chunk_key)
+
+    def _remove_signature(self, chunk_key: str):
+        signature = self._signatures.pop(chunk_key, None)
+        if signature is None:
+            return
+        for band, key in zip(self._bands, self._band_keys(signature)):
+            bucket = band.get(key)
+            if bucket and chunk_key in bucket:
+                bucket.remove(chunk_key)
+                if not bucket:
+                    del band[key]
+
+    def find_near_duplicate(
+        self, signature: np.ndarray, exclude: str = None
+    ) -> Optional[tuple[str, float]]:
+        """
+        查找相似度最高且不低于阈值的文本块。
+
+        Returns:
+            Optional[tuple[str, float]]: 文本块 id 与估计的 Jaccard 相似度
+        """
+        candidates = set()
+        for band, key in zip(self._bands, self._band_keys(signature)):
+            candidates.update(band.get(key, ()))
+        candidates.discard(exclude)
+        best = None
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (candidate, similarity)
+        return best
+
+    def _reuse(self, chunk_key: str, twin_key: str) -> tuple[dict, dict]:
+        entry = self._data[twin_key]
+        if twin_key == chunk_key:
+            self.stats["cached_chunks"] += 1
+        else:
+            self.stats["reused_chunks"] += 1
+            self.stats["llm_calls_avoided"] += entry["llm_calls"]
+        nodes = {
+            name: [{**dp, "source_id": chunk_key} for dp in dps]
+            for name, dps in entry["nodes"].items()
+        }
+        edges = {
+            (src, tgt): [{**dp, "source_id": chunk_key} for dp in dps]
+            for src, tgt, dps in entry["edges"]
+        }
+        return nodes, edges
+
+    async def extract_or_reuse(
+        self,
+        chunk_key: str,
+        content: str,
+        global_config: dict,
+        extract_func: Callable[[dict], Awaitable[tuple[dict, dict]]],
+    ) -> tuple[dict, dict]:
+        """
+        复用相似文本块的提取结果，没有相似文本块时调用 extract_func 提取。
+
+        Args:
+            chunk_key (str): 文本块 id
+            content (str): 文本块内容
+            global_config (dict): 全局配置字典
+            extract_func (Callable): 以全局配置为参数的提取函数，返回节点字典和边字典
+
+        Returns:
+            tuple[dict, dict]: 节点字典和边字典
+        """
+        if chunk_key in self._data:
+            self._prepared.pop(chunk_key, None)
+            return self._reuse(chunk_key, chunk_key)
+
+        signature = self._prepared.pop(chunk_key, None)
+        if signature is None:
+            signature = await asyncio.get_running_loop().run_in_executor(
+                None, minhash_signature, content
+            )
+        while True:
+            twin = self.find_near_duplicate(signature, exclude=chunk_key)
+            if twin is None:
+                break
+            twin_key, similarity = twin
+            if twin_key in self._data:
+                logger.debug(
+                    f"Chunk {chunk_key} reuses extraction of {twin_key} ({similarity:.2f})"
+                )
+                return self._reuse(chunk_key, twin_key)
+            # 等待相似文本块提取完成；其提取失败时已从索引中移除，重新查找即可
+            inflight = self._inflight[twin_key]
+            try:
+                await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+            except Exception:
+                pass
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[chunk_key] = future
+        self._add_signature(chunk_key, signature)
+
+        llm_calls = 0
+        use_llm_func = global_config["llm_model_func"]
+
+        async def counting_llm_func(*args, **kwargs) -> Any:
+            nonlocal llm_calls
+            llm_calls += 1
+            return await use_llm_func(*args, **kwargs)
+
+        try:
+            maybe_nodes, maybe_edges = await extract_func(
+                {**global_config, "llm_model_func": counting_llm_func}
+            )
+        except BaseException as e:
+            self._remove_signature(chunk_key)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # 没有等待者时避免 "exception was never retrieved" 警告
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(chunk_key, None)
+
+        self._data[chunk_key] = {
+            "signature": signature.tolist(),
+            "nodes": maybe_nodes,
+            "edges": [[src, tgt, dps] for (src, tgt), dps in maybe_edges.items()],
+            "llm_calls": llm_calls,
+        }
+        self._unsaved.append(chunk_key)
+        future.set_result(None)
+        return maybe_nodes, maybe_edges
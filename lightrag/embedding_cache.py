@@ -0,0 +1,310 @@
+"""
+embedding 缓存。
+
+以文本内容的 md5 为键缓存 embedding 向量，所有向量库命名空间共用一个缓存，按 LRU 淘汰。
+每个 embedding 模型对应一组文件：
+
+    embedding_cache_{namespace}.bin   定长二进制记录：32 字节的文本哈希 + 向量（float16 或 float32）
+    embedding_cache_{namespace}.json  模型 id、向量维度、数据类型与 LRU 顺序
+
+落盘时只重写变化的记录；命中只调整内存中的 LRU 顺序，顺序随下一次写入或淘汰、或 flush 时保存，
+只读的查询不写文件。加载时以记录中保存的哈希为准，与 LRU 顺序不一致的条目被丢弃，
+因此两个文件之间的写入中断不会导致返回错误的向量。
+"""
+
+import asyncio
+import inspect
+import os
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from .base import StorageNameSpace
+from .utils import EmbeddingFunc, compute_mdhash_id, load_json, logger, write_json
+
+KEY_SIZE = 32
+
+
+# 表示模型名的参数名
+_MODEL_ARG_NAMES = ("model", "model_name", "model_id", "embed_model")
+
+
+def _model_name(value) -> Optional[str]:
+    if isinstance(value, str):
+        return value
+    # transformers 的模型对象
+    return getattr(getattr(value, "config", None), "name_or_path", None) or None
+
+
+def embedding_model_id(embedding_func: EmbeddingFunc) -> Optional[str]:
+    """
+    由 embedding 函数推断模型 id：函数名、模型名加向量维度。
+
+    模型名依次取自 functools.partial 绑定的参数、闭包变量与函数参数的默认值中
+    名为 model、model_name、model_id、embed_model 的值。找不到模型名时返回 None，
+    只用函数名与维度无法区分同维度的不同模型。
+    """
+    func = embedding_func.func
+    keywords = {}
+    while True:
+        if isinstance(func, partial):
+            keywords = {**func.keywords, **keywords}
+            func = func.func
+        elif hasattr(func, "__wrapped__"):
+            func = func.__wrapped__
+        else:
+            break
+    name = getattr(func, "__name__", type(func).__name__)
+
+    candidates = [keywords]
+    if inspect.isfunction(func):
+        candidates.append(inspect.getclosurevars(func).nonlocals)
+    try:
+        candidates.append(
+            {
+                k: p.default
+                for k, p in inspect.signature(func).parameters.items()
+                if p.default is not inspect.Parameter.empty
+            }
+        )
+    except (TypeError, ValueError):
+        pass
+    for values in candidates:
+        for arg in _MODEL_ARG_NAMES:
+            model = _model_name(values.get(arg))
+            if model:
+                return f"{name}-{model}-{embedding_func.embedding_dim}"
+    return None
+
+
+@dataclass
+class EmbeddingCache(StorageNameSpace):
+    """
+    embedding 缓存，namespace 为 embedding 模型 id。
+
+    wrap 返回查询缓存的 EmbeddingFunc：命中的文本直接返回缓存的向量，未命中的文本
+    合并为一次调用交给原函数，结果写入缓存。并发调用中相同的未命中文本只请求一次。
+    """
+
+    max_entries: int = 100000
+    dtype: str = "float16"
+    stats: dict = field(
+        default_factory=lambda: {"hits": 0, "misses": 0, "evictions": 0}
+    )
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self.max_entries = self.global_config.get(
+            "embedding_cache_max_entries", self.max_entries
+        )
+        self.dtype = self.global_config.get("embedding_cache_dtype", self.dtype)
+        self.embedding_dim = self.global_config["embedding_func"]["embedding_dim"]
+        file_prefix = re.sub(r"[^\w.-]", "_", self.namespace)
+        self._file_name = os.path.join(working_dir, f"embedding_cache_{file_prefix}.bin")
+        self._meta_file_name = os.path.join(
+            working_dir, f"embedding_cache_{file_prefix}.json"
+        )
+        self._record_dtype = np.dtype(
+            [("key", f"S{KEY_SIZE}"), ("vector", self.dtype, (self.embedding_dim,))]
+        )
+        # 文本哈希 -> 记录行号，按最近使用排序，最久未使用的在前
+        self._rows: OrderedDict[str, int] = OrderedDict()
+        self._records = np.zeros(0, dtype=self._record_dtype)
+        # 可复用的行号（被淘汰或失效的记录）与下一个未使用的行号
+        self._free_rows: list[int] = []
+        self._next_row = 0
+        # 需要写回文件的行号，以及是否有写入或淘汰（命中引起的顺序变化不触发落盘）
+        self._dirty_rows: set[int] = set()
+        self._order_changed = False
+        # 上次保存 LRU 顺序之后是否有命中
+        self._recency_changed = False
+        # 正在请求的文本哈希 -> future
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._load()
+
+    def _load(self):
+        meta = load_json(self._meta_file_name)
+        if meta is None or not os.path.exists(self._file_name):
+            return
+        if (meta["model_id"], meta["embedding_dim"], meta["dtype"]) != (
+            self.namespace,
+            self.embedding_dim,
+            self.dtype,
+        ):
+            logger.warning(
+                f"Embedding cache {self._file_name} was built with a different "
+                "model or format, ignoring it"
+            )
+            return
+        records = np.fromfile(self._file_name, dtype=self._record_dtype)
+        rows = {key.decode(): row for row, key in enumerate(records["key"]) if key}
+        for key in meta["lru"]:
+            if key in rows:
+                self._rows[key] = rows[key]
+        # 超出上限时淘汰最久未使用的条目
+        while len(self._rows) > self.max_entries:
+            self._rows.popitem(last=False)
+        self._records = records
+        self._next_row = len(records)
+        used_rows = set(self._rows.values())
+        self._free_rows = [row for row in range(len(records)) if row not in used_rows]
+        logger.info(
+            f"Load embedding cache {self.namespace} with {len(self._rows)} data"
+        )
+
+    async def index_done_callback(self):
+        self._save(self._order_changed)
+
+    async def flush(self):
+        """保存全部变化，包括只由命中引起的 LRU 顺序变化"""
+        self._save(self._order_changed or self._recency_changed)
+
+    def _save(self, save_order: bool):
+        if self._dirty_rows:
+            mode = "r+b" if os.path.exists(self._file_name) else "w+b"
+            with open(self._file_name, mode) as f:
+                for row in sorted(self._dirty_rows):
+                    f.seek(row * self._record_dtype.itemsize)
+                    f.write(self._records[row : row + 1].tobytes())
+            self._dirty_rows.clear()
+        if save_order:
+            write_json(
+                {
+                    "model_id": self.namespace,
+                    "embedding_dim": self.embedding_dim,
+                    "dtype": self.dtype,
+                    "lru": list(self._rows),
+                },
+                self._meta_file_name,
+            )
+            self._order_changed = False
+            self._recency_changed = False
+
+    def _get(self, key: str):
+        row = self._rows.get(key)
+        if row is None:
+            return None
+        self._rows.move_to_end(key)
+        self._recency_changed = True
+        return self._records[row]["vector"]
+
+    def _put(self, key: str, vector: np.ndarray):
+        if key in self._rows:
+            row = self._rows[key]
+            self._rows.move_to_end(key)
+        else:
+            if len(self._rows) >= self.max_entries:
+                _, evicted_row = self._rows.popitem(last=False)
+                self._free_rows.append(evicted_row)
+                self.stats["evictions"] += 1
+            if self._free_rows:
+                row = self._free_rows.pop()
+            else:
+                row = self._next_row
+                self._next_row += 1
+                if row >= len(self._records):
+                    grown = np.zeros(
+                        max(64, row + 1, min(self.max_entries, len(self._records) * 2)),
+                        dtype=self._record_dtype,
+                    )
+                    grown[: len(self._records)] = self._records
+                    self._records = grown
+            self._rows[key] = row
+        self._records[row] = (key.encode(), vector)
+        self._dirty_rows.add(row)
+        self._order_changed = True
+
+    async def embed(
+        self,
+        texts: list[str],
+        embedding_func: Callable[[list[str]], Awaitable[np.ndarray]],
+    ) -> np.ndarray:
+        """
+        返回 texts 的向量，未命中缓存的文本通过 embedding_func 计算。
+
+        Args:
+            texts (list[str]): 文本列表
+            embedding_func (Callable): 原始的 embedding 函数
+
+        Returns:
+            np.ndarray: float32 向量矩阵
+        """
+        keys = [compute_mdhash_id(text) for text in texts]
+        result = np.empty((len(texts), self.embedding_dim), dtype=np.float32)
+        # 未命中的文本哈希 -> 在 texts 中的下标
+        missing: dict[str, list[int]] = {}
+        waiting: list[tuple[int, asyncio.Future]] = []
+        for i, key in enumerate(keys):
+            vector = self._get(key)
+            if vector is not None:
+                result[i] = vector
+                self.stats["hits"] += 1
+            elif key in self._inflight:
+                waiting.append((i, self._inflight[key]))
+                self.stats["hits"] += 1
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            self.stats["misses"] += len(missing)
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in missing}
+            self._inflight.update(futures)
+            try:
+                vectors = await embedding_func(
+                    [texts[indices[0]] for indices in missing.values()]
+                )
+            except BaseException as e:
+                for future in futures.values():
+                    if isinstance(e, asyncio.CancelledError):
+                        future.cancel()
+                    else:
+                        future.set_exception(e)
+                        # 没有等待者时避免 "exception was never retrieved" 警告
+                        future.exception()
+                raise
+            finally:
+                for key in futures:
+                    self._inflight.pop(key, None)
+            for (key, indices), vector in zip(missing.items(), vectors):
+                result[indices] = vector
+                self._put(key, vector)
+                futures[key].set_result(vector)
+
+        for i, future in waiting:
+            try:
+                result[i] = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 发起请求的调用被取消时自行请求
+                if not future.cancelled():
+                    raise
+                result[i] = (await self.embed([texts[i]], embedding_func))[0]
+        return result
+
+    def wrap(self, embedding_func: EmbeddingFunc) -> EmbeddingFunc:
+        """
+        返回先查询缓存的 EmbeddingFunc，带有额外参数的调用不经过缓存。
+        """
+
+        async def cached_func(texts: list[str], *args, **kwargs) -> np.ndarray:
+            if args or kwargs:
+                return await embedding_func(texts, *args, **kwargs)
+            return await self.embed(list(texts), embedding_func)
+
+        return EmbeddingFunc(
+            embedding_dim=embedding_func.embedding_dim,
+            max_token_size=embedding_func.max_token_size,
+            func=cached_func,
+        )
+
+    def metrics(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._rows),
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,337 @@
+"""
+HuggingFace 本地推理工作线程。
+
+模型的前向计算与 generate 在专用线程中执行，不阻塞事件循环。并发到达的请求在 max_wait 秒内
+合并为一批，上一批计算期间到达的请求在其完成后立即合并为下一批。批内文本按 token 长度排序后
+分桶，每桶文本数不超过 max_batch_size、补齐后的 token 数不超过 max_batch_tokens，减少补齐浪费。
+CPU 与 GPU 上均可运行，模型所在的设备由模型参数决定。
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+import numpy as np
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from .utils import logger
+
+
+def length_buckets(
+    lengths: list[int], max_batch_size: int, max_batch_tokens: int
+) -> list[list[int]]:
+    """
+    按长度排序后分桶，返回每个桶中文本的下标。
+
+    Args:
+        lengths (list[int]): 各文本的 token 数
+        max_batch_size (int): 每桶最多文本数
+        max_batch_tokens (int): 每桶补齐后最多 token 数（文本数 x 最长文本的 token 数）
+
+    Returns:
+        list[list[int]]: 下标分桶
+    """
+    buckets = []
+    bucket: list[int] = []
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        # 按长度升序加入，当前文本就是桶内最长的文本
+        if bucket and (
+            len(bucket) >= max_batch_size
+            or (len(bucket) + 1) * lengths[i] > max_batch_tokens
+        ):
+            buckets.append(bucket)
+            bucket = []
+        bucket.append(i)
+    if bucket:
+        buckets.append(bucket)
+    return buckets
+
+
+class HFInferenceWorker:
+    """
+    合并并发请求并在专用线程中批量执行的推理工作线程基类。
+
+    子类实现 _process(payloads, options)，在工作线程中处理一批请求，返回与 payloads 对应的结果
+    以及统计：tokens（计入速率的 token 数）、input_tokens 与 padded_input_tokens（补齐前后的输入 token 数）。
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        max_batch_size: int = 16,
+        max_batch_tokens: int = 16384,
+        max_wait: float = 0.01,
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_wait = max_wait
+        self.device = next(model.parameters()).device
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="lightrag-hf"
+        )
+        # 等待合并的请求：(payload, options, future)
+        self._pending: list[tuple[Any, tuple, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._busy = False
+        self._requests = 0
+        self._batches = 0
+        self._tokens = 0
+        self._input_tokens = 0
+        self._padded_input_tokens = 0
+        self._busy_seconds = 0.0
+        # 预热在工作线程中执行，之后的请求排在预热之后
+        self._executor.submit(self._warmup)
+
+    def _warmup(self):
+        start = time.perf_counter()
+        try:
+            self._process(self._warmup_payloads(), ())
+        except Exception as e:
+            logger.warning(f"HF worker warmup failed: {e}")
+            return
+        logger.info(
+            f"HF worker warmed up on {self.device} in {time.perf_counter() - start:.2f}s"
+        )
+
+    def _warmup_payloads(self) -> list:
+        raise NotImplementedError
+
+    def _process(self, payloads: list, options: tuple) -> tuple[list, dict]:
+        raise NotImplementedError
+
+    async def submit(self, payload: Any, options: tuple = ()) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((payload, options, future))
+        self._requests += 1
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.max_wait, self._flush
+            )
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._pending = [p for p in self._pending if not p[2].done()]
+        # 同一时间只有一批在计算，其余请求在这批完成后合并
+        if self._busy or not self._pending:
+            return
+        # 只合并生成参数相同的请求
+        options = self._pending[0][1]
+        batch = [p for p in self._pending if p[1] == options][: self.max_batch_size]
+        batch_futures = {id(p[2]) for p in batch}
+        self._pending = [p for p in self._pending if id(p[2]) not in batch_futures]
+        self._busy = True
+        asyncio.ensure_future(self._run_batch(batch, options))
+
+    async def _run_batch(self, batch: list, options: tuple):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            results, stats = await loop.run_in_executor(
+                self._executor, self._process, [p[0] for p in batch], options
+            )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            self._batches += 1
+            self._tokens += stats["tokens"]
+            self._input_tokens += stats["input_tokens"]
+            self._padded_input_tokens += stats["padded_input_tokens"]
+            self._busy_seconds += time.perf_counter() - start
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._busy = False
+            if self._pending:
+                self._flush()
+
+    def metrics(self) -> dict:
+        """
+        推理统计：tokens_per_second 为计算期间每秒处理的 token 数（embedding 为输入 token，生成为新生成的 token），
+        padding_ratio 为输入中补齐的 token 占比。
+        """
+        return {
+            "device": str(self.device),
+            "requests": self._requests,
+            "batches": self._batches,
+            "avg_batch_size": self._requests / self._batches if self._batches else 0.0,
+            "tokens": self._tokens,
+            "busy_seconds": self._busy_seconds,
+            "tokens_per_second": (
+                self._tokens / self._busy_seconds if self._busy_seconds else 0.0
+            ),
+            "padding_ratio": (
+                1 - self._input_tokens / self._padded_input_tokens
+                if self._padded_input_tokens
+                else 0.0
+            ),
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class HFEmbeddingWorker(HFInferenceWorker):
+    """
+    embedding 工作线程，对最后一层隐藏状态按 attention mask 做平均池化。
+    max_batch_size 为每批最多文本数。
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size: int = 64, **kwargs):
+        super().__init__(model, tokenizer, max_batch_size=max_batch_size, **kwargs)
+
+    def _warmup_payloads(self) -> list:
+        return [["warmup"]]
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        return await self.submit(list(texts))
+
+    @torch.inference_mode()
+    def _process(self, payloads: list[list[str]], options: tuple):
+        texts = [text for payload in payloads for text in payload]
+        encoded = self.tokenizer(texts, truncation=True)
+        lengths = [len(ids) for ids in encoded["input_ids"]]
+        embeddings: list[Optional[np.ndarray]] = [None] * len(texts)
+        padded_tokens = 0
+        for bucket in length_buckets(lengths, self.max_batch_size, self.max_batch_tokens):
+            inputs = self.tokenizer.pad(
+                {
+                    "input_ids": [encoded["input_ids"][i] for i in bucket],
+                    "attention_mask": [encoded["attention_mask"][i] for i in bucket],
+                },
+                return_tensors="pt",
+            ).to(self.device)
+            padded_tokens += inputs["input_ids"].numel()
+            hidden = self.model(**inputs).last_hidden_state
+            mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+            pooled = pooled.to(torch.float32).cpu().numpy()
+            for i, vector in zip(bucket, pooled):
+                embeddings[i] = vector
+
+        results = []
+        offset = 0
+        for payload in payloads:
+            results.append(np.stack(embeddings[offset : offset + len(payload)]))
+            offset += len(payload)
+        stats = {
+            "tokens": sum(lengths),
+            "input_tokens": sum(lengths),
+            "padded_input_tokens": padded_tokens,
+        }
+        return results, stats
+
+
+class HFGenerationWorker(HFInferenceWorker):
+    """
+    文本生成工作线程，生成参数相同的并发请求左侧补齐后合并 generate。
+    max_batch_size 为每批最多请求数。
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size: int = 8, **kwargs):
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        # 仅解码器模型批量生成需要左侧补齐
+        tokenizer.padding_side = "left"
+        super().__init__(model, tokenizer, max_batch_size=max_batch_size, **kwargs)
+
+    @classmethod
+    def from_pretrained(cls, model_name: str, **kwargs) -> "HFGenerationWorker":
+        tokenizer = AutoTokenizer.from_pretrained(
+            model_name, device_map="auto", trust_remote_code=True
+        )
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name, device_map="auto", trust_remote_code=True
+        )
+        return cls(model, tokenizer, **kwargs)
+
+    def _warmup_payloads(self) -> list:
+        return ["warmup"]
+
+    async def generate(self, prompt: str, **generate_kwargs) -> str:
+        return await self.submit(prompt, tuple(sorted(generate_kwargs.items())))
+
+    @torch.inference_mode()
+    def _process(self, payloads: list[str], options: tuple):
+        generate_kwargs = dict(options) or {"max_new_tokens": 1}
+        encoded = self.tokenizer(payloads, truncation=True)
+        lengths = [len(ids) for ids in encoded["input_ids"]]
+        results: list[Optional[str]] = [None] * len(payloads)
+        generated_tokens = 0
+        padded_tokens = 0
+        for bucket in length_buckets(lengths, self.max_batch_size, self.max_batch_tokens):
+            inputs = self.tokenizer.pad(
+                {
+                    "input_ids": [encoded["input_ids"][i] for i in bucket],
+                    "attention_mask": [encoded["attention_mask"][i] for i in bucket],
+                },
+                return_tensors="pt",
+            ).to(self.device)
+            input_length = inputs["input_ids"].shape[1]
+            output = self.model.generate(
+                **inputs, pad_token_id=self.tokenizer.pad_token_id, **generate_kwargs
+            )
+            new_tokens = output[:, input_length:]
+            generated_tokens += int(
+                (new_tokens != self.tokenizer.pad_token_id).sum().item()
+            )
+            padded_tokens += inputs["input_ids"].numel()
+            for i, tokens in zip(bucket, new_tokens):
+                results[i] = self.tokenizer.decode(tokens, skip_special_tokens=True)
+        stats = {
+            "tokens": generated_tokens,
+            "input_tokens": sum(lengths),
+            "padded_input_tokens": padded_tokens,
+        }
+        return results, stats
+
+
+# 模型名或 embedding 模型对象 id -> 工作线程
+_HF_GENERATION_WORKERS: dict[str, HFGenerationWorker] = {}
+_HF_EMBEDDING_WORKERS: dict[int, HFEmbeddingWorker] = {}
+
+
+def get_hf_generation_worker(model_name: str, **kwargs) -> HFGenerationWorker:
+    """获取模型对应的生成工作线程，首次调用时加载模型并预热"""
+    worker = _HF_GENERATION_WORKERS.get(model_name)
+    if worker is None:
+        worker = _HF_GENERATION_WORKERS[model_name] = HFGenerationWorker.from_pretrained(
+            model_name, **kwargs
+        )
+    return worker
+
+
+def get_hf_embedding_worker(tokenizer, embed_model, **kwargs) -> HFEmbeddingWorker:
+    """获取 embedding 模型对应的工作线程，首次调用时创建并预热"""
+    worker = _HF_EMBEDDING_WORKERS.get(id(embed_model))
+    if worker is None or worker.model is not embed_model:
+        worker = _HF_EMBEDDING_WORKERS[id(embed_model)] = HFEmbeddingWorker(
+            embed_model, tokenizer, **kwargs
+        )
+    return worker
+
+
+def hf_worker_metrics() -> dict:
+    """各工作线程的推理统计"""
+    metrics = {
+        f"generation:{name}": w.metrics() for name, w in _HF_GENERATION_WORKERS.items()
+    }
+    metrics.update(
+        {
+            f"embedding:{type(w.model).__name__}:{key}": w.metrics()
+            for key, w in _HF_EMBEDDING_WORKERS.items()
+        }
+    )
+    return metrics
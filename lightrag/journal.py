@@ -0,0 +1,278 @@
+"""
+插入日志。
+
+以追加写入的 JSON Lines 文件记录插入过程中每个文档、文本块的进度，见 insert_journal.jsonl：
+
+    doc        文档已登记，保存全文，用于恢复时重新切分
+    chunked    文本块已切出
+    extracted  文本块已完成实体提取，保存解析出的节点与边
+    merged     文本块的提取结果已合并进知识图谱并写入实体、关系向量库
+    embedded   文本块已写入文本块向量库
+    done       文档已写入 full_docs 与 text_chunks，插入完成
+
+merged、embedded 只在相关存储 index_done_callback 落盘之后写入，
+因此日志中的状态总是不超前于磁盘上的数据。
+
+记录先缓存在内存中，每个阶段结束时由 flush 在执行器中一次写入并 fsync，
+不在事件循环中逐条同步刷盘；未落盘的记录丢失时只会让恢复重做对应的阶段。
+
+内容相同的文本块 id 相同，一个文本块可能属于多个文档，
+每个文档各有一条 chunked 记录，恢复时每个文档都能取回完整的文本块。
+"""
+
+import asyncio
+import json
+import os
+from typing import Optional
+
+from .base import TextChunkSchema
+from .utils import logger
+
+
+class InsertJournal:
+    def __init__(self, file_name: str):
+        self._file_name = file_name
+        # 文档 id -> {"content": str, "done": bool}
+        self._docs: dict[str, dict] = {}
+        # 文本块 id -> {"chunk": dict, "doc_ids": set, "nodes": dict, "edges": dict, "merged": bool, "embedded": bool}
+        self._chunks: dict[str, dict] = {}
+        # 文档 id -> 文本块 id 列表
+        self._doc_chunks: dict[str, list[str]] = {}
+        self._load()
+        self._fp = open(self._file_name, "a", encoding="utf-8")
+        # 尚未写入文件的记录
+        self._buffer: list[str] = []
+        self._lock = asyncio.Lock()
+
+    def _load(self):
+        if not os.path.exists(self._file_name):
+            return
+        with open(self._file_name, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程在写入中途退出时最后一行可能不完整
+                    logger.warning(
+                        f"Ignoring truncated insert journal record at line {line_no}"
+                    )
+                    break
+                self._apply(record)
+        logger.info(
+            f"Load insert journal with {len(self.pending_doc_ids())} pending docs, "
+            f"{len(self._chunks)} chunks"
+        )
+
+    def _apply(self, record: dict):
+        op, key = record["op"], record["id"]
+        if op == "doc":
+            self._docs[key] = {"content": record["content"], "done": False}
+        elif op == "done":
+            if key in self._docs:
+                self._docs[key]["done"] = True
+        elif op == "chunked":
+            doc_key = record["chunk"]["full_doc_id"]
+            if key not in self._chunks:
+                self._chunks[key] = {
+                    "chunk": record["chunk"],
+                    "doc_ids": set(),
+                    "nodes": None,
+                    "edges": None,
+                    "merged": False,
+                    "embedded": False,
+                }
+            elif doc_key in self._chunks[key]["doc_ids"]:
+                return
+            self._chunks[key]["doc_ids"].add(doc_key)
+            self._doc_chunks.setdefault(doc_key, []).append(key)
+        elif key in self._chunks:
+            if op == "extracted":
+                self._chunks[key]["nodes"] = record["nodes"]
+                self._chunks[key]["edges"] = {
+                    (src, tgt): edges for src, tgt, edges in record["edges"]
+                }
+            elif op == "merged":
+                self._chunks[key]["merged"] = True
+            elif op == "embedded":
+                self._chunks[key]["embedded"] = True
+
+    def _append(self, records: list[dict]):
+        for record in records:
+            self._apply(record)
+        self._buffer.extend(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+
+    def _write(self, data: str):
+        self._fp.write(data)
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+
+    async def flush(self):
+        """
+        将缓存的记录写入日志文件并 fsync，写入在执行器中进行。
+        """
+        async with self._lock:
+            if not self._buffer:
+                return
+            data, self._buffer = "".join(self._buffer), []
+            await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+
+    def record_docs(self, docs: dict[str, dict]):
+        self._append(
+            [
+                {"op": "doc", "id": k, "content": v["content"]}
+                for k, v in docs.items()
+                if k not in self._docs or self._docs[k]["done"]
+            ]
+        )
+
+    def record_chunks(self, chunks: dict[str, TextChunkSchema]):
+        self._append(
+            [
+                {"op": "chunked", "id": k, "chunk": v}
+                for k, v in chunks.items()
+                if k not in self._chunks
+                or v["full_doc_id"] not in self._chunks[k]["doc_ids"]
+            ]
+        )
+
+    def record_extracted(self, chunk_key: str, nodes: dict, edges: dict):
+        self._append(
+            [
+                {
+                    "op": "extracted",
+                    "id": chunk_key,
+                    "nodes": nodes,
+                    "edges": [[src, tgt, v] for (src, tgt), v in edges.items()],
+                }
+            ]
+        )
+
+    def record_merged(self, chunk_keys: list[str]):
+        self._append(
+            [
+                {"op": "merged", "id": k}
+                for k in chunk_keys
+                if k in self._chunks and not self._chunks[k]["merged"]
+            ]
+        )
+
+    def record_embedded(self, chunk_keys: list[str]):
+        self._append(
+            [
+                {"op": "embedded", "id": k}
+                for k in chunk_keys
+                if k in self._chunks and not self._chunks[k]["embedded"]
+            ]
+        )
+
+    def record_done(self, doc_keys: list[str]):
+        self._append(
+            [
+                {"op": "done", "id": k}
+                for k in doc_keys
+                if k in self._docs and not self._docs[k]["done"]
+            ]
+        )
+
+    def pending_doc_ids(self) -> list[str]:
+        return [k for k, v in self._docs.items() if not v["done"]]
+
+    def pending_docs(self) -> dict[str, dict]:
+        return {k: {"content": self._docs[k]["content"]} for k in self.pending_doc_ids()}
+
+    def get_chunks(self, doc_key: str) -> Optional[dict[str, TextChunkSchema]]:
+        """
+        返回日志中记录的文档文本块，未记录时返回 None。
+        """
+        chunk_keys = self._doc_chunks.get(doc_key)
+        if not chunk_keys:
+            return None
+        return {
+            k: {**self._chunks[k]["chunk"], "full_doc_id": doc_key} for k in chunk_keys
+        }
+
+    def get_extracted(self, chunk_key: str) -> Optional[tuple[dict, dict]]:
+        state = self._chunks.get(chunk_key)
+        if state is None or state["nodes"] is None:
+            return None
+        return state["nodes"], state["edges"]
+
+    def is_merged(self, chunk_key: str) -> bool:
+        return chunk_key in self._chunks and self._chunks[chunk_key]["merged"]
+
+    def is_embedded(self, chunk_key: str) -> bool:
+        return chunk_key in self._chunks and self._chunks[chunk_key]["embedded"]
+
+    def status(self) -> dict:
+        pending = set(self.pending_doc_ids())
+        chunks = [v for v in self._chunks.values() if v["doc_ids"] & pending]
+        return {
+            "pending_docs": len(pending),
+            "done_docs": len(self._docs) - len(pending),
+            "chunks": {
+                "chunked": len(chunks),
+                "extracted": sum(1 for v in chunks if v["nodes"] is not None),
+                "merged": sum(1 for v in chunks if v["merged"]),
+                "embedded": sum(1 for v in chunks if v["embedded"]),
+            },
+            "pending_doc_ids": sorted(pending),
+        }
+
+    async def compact(self):
+        """
+        重写日志，只保留未完成文档的记录；全部完成时日志被清空。重写在执行器中进行。
+        """
+        async with self._lock:
+            # 缓存的记录已应用到内存状态中，重写后的日志包含它们
+            self._buffer = []
+            await asyncio.get_running_loop().run_in_executor(None, self._compact)
+
+    def _compact(self):
+        pending = set(self.pending_doc_ids())
+        records = [
+            {"op": "doc", "id": k, "content": self._docs[k]["content"]} for k in pending
+        ]
+        for k, v in self._chunks.items():
+            doc_ids = v["doc_ids"] & pending
+            if not doc_ids:
+                continue
+            for doc_key in sorted(doc_ids):
+                records.append(
+                    {"op": "chunked", "id": k, "chunk": {**v["chunk"], "full_doc_id": doc_key}}
+                )
+            if v["nodes"] is not None:
+                records.append(
+                    {
+                        "op": "extracted",
+                        "id": k,
+                        "nodes": v["nodes"],
+                        "edges": [[src, tgt, e] for (src, tgt), e in v["edges"].items()],
+                    }
+                )
+            if v["merged"]:
+                records.append({"op": "merged", "id": k})
+            if v["embedded"]:
+                records.append({"op": "embedded", "id": k})
+
+        tmp_file_name = self._file_name + ".tmp"
+        with open(tmp_file_name, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+            f.flush()
+            os.fsync(f.fileno())
+        self._fp.close()
+        os.replace(tmp_file_name, self._file_name)
+        self._fp = open(self._file_name, "a", encoding="utf-8")
+
+        self._docs = {k: v for k, v in self._docs.items() if k in pending}
+        self._chunks = {k: v for k, v in self._chunks.items() if v["doc_ids"] & pending}
+        for v in self._chunks.values():
+            v["doc_ids"] &= pending
+        self._doc_chunks = {k: v for k, v in self._doc_chunks.items() if k in pending}
+
+    def close(self):
+        if self._buffer:
+            self._write("".join(self._buffer))
+            self._buffer = []
+        self._fp.close()
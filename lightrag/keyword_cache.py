@@ -0,0 +1,136 @@
+"""
+查询关键词缓存。
+
+local、global 与 hybrid 查询共用关键词提取的结果：以规范化后的查询（NFKC、合并空白、小写）为键，
+缓存 LLM 提取出的高层次与低层次关键词。同一查询的并发请求只发起一次提取，其余请求等待同一结果。
+
+缓存保存在 query_keywords_cache.json 中，按 LRU 淘汰，查询结束时落盘。关键词提取提示词变化后旧缓存作废。
+"""
+
+import asyncio
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from .base import StorageNameSpace
+from .utils import compute_args_hash, load_json, logger, write_json
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询文本，仅大小写、全半角或空白不同的查询视为同一查询"""
+    query = unicodedata.normalize("NFKC", query)
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+@dataclass
+class QueryKeywordCache(StorageNameSpace):
+    """
+    查询关键词缓存。值为 {"high_level_keywords": list[str], "low_level_keywords": list[str]}，
+    提取失败（返回 None）的结果不缓存。
+    """
+
+    # 关键词提取提示词的哈希，与缓存文件中记录的不一致时丢弃缓存
+    prompt_hash: str = ""
+    max_entries: int = 10000
+    stats: dict = field(
+        default_factory=lambda: {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "failures": 0,
+            "extraction_seconds": 0.0,
+        }
+    )
+
+    def __post_init__(self):
+        self.max_entries = self.global_config.get(
+            "query_keywords_cache_max_entries", self.max_entries
+        )
+        self._file_name = os.path.join(
+            self.global_config["working_dir"], f"{self.namespace}.json"
+        )
+        data = load_json(self._file_name) or {}
+        if data.get("prompt_hash") != self.prompt_hash:
+            data = {}
+        # 查询哈希 -> 关键词，按最近使用排序
+        self._data: OrderedDict[str, dict] = OrderedDict(data.get("keywords", {}))
+        # 正在提取的查询哈希 -> 提取任务
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._dirty = False
+        logger.info(f"Load query keywords cache with {len(self._data)} entries")
+
+    async def get_or_extract(
+        self, query: str, extract: Callable[[], Awaitable[Optional[dict]]]
+    ) -> Optional[dict]:
+        """
+        返回查询的关键词，未缓存时调用 extract 提取。
+
+        Args:
+            query (str): 用户查询
+            extract (Callable[[], Awaitable[Optional[dict]]]): 提取关键词的协程函数
+
+        Returns:
+            Optional[dict]: 关键词，提取失败时为 None
+        """
+        key = compute_args_hash(normalize_query(query))
+        keywords = self._data.get(key)
+        if keywords is not None:
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return keywords
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["misses"] += 1
+            task = self._inflight[key] = asyncio.ensure_future(
+                self._extract(key, query, extract)
+            )
+        else:
+            self.stats["coalesced"] += 1
+        # 发起提取的请求被取消时，提取继续为其余等待者执行
+        return await asyncio.shield(task)
+
+    async def _extract(
+        self, key: str, query: str, extract: Callable[[], Awaitable[Optional[dict]]]
+    ) -> Optional[dict]:
+        start = time.perf_counter()
+        try:
+            keywords = await extract()
+        finally:
+            self._inflight.pop(key, None)
+            self.stats["extraction_seconds"] += time.perf_counter() - start
+        if keywords is None:
+            self.stats["failures"] += 1
+            return None
+        self._data[key] = {"query": query, **keywords}
+        self._dirty = True
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+        return self._data[key]
+
+    async def index_done_callback(self):
+        if not self._dirty:
+            return
+        write_json(
+            {"prompt_hash": self.prompt_hash, "keywords": self._data}, self._file_name
+        )
+        self._dirty = False
+
+    async def query_done_callback(self):
+        await self.index_done_callback()
+
+    def metrics(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "entries": len(self._data),
+            "hit_rate": (
+                (self.stats["hits"] + self.stats["coalesced"]) / lookups
+                if lookups
+                else 0.0
+            ),
+        }
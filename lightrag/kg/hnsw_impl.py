@@ -0,0 +1,389 @@
+"""
+基于 hnswlib 的近似最近邻向量存储。
+
+每个 namespace 保存两个文件：
+
+    vdb_{namespace}.hnsw.{代数}  HNSW 索引（hnswlib 二进制格式），文件名中的代数为写出时的落盘次数
+    vdb_{namespace}.hnsw.log     每个索引内部标签对应的 id 与 meta_fields，每行一条 JSON 记录
+
+落盘时 .log 只追加上次落盘之后变化的标签，并以带代数的提交记录结束；记录数超过存活向量数的两倍时重写为全量。
+加载时只重放到最后一条提交记录，写了一半的尾部被截掉；索引与 .log 的代数不一致（落盘中途崩溃）时
+按索引中实际存在的向量修正元数据并记录警告。旧版本的 vdb_{namespace}.hnsw 与 vdb_{namespace}.hnsw.json
+在首次落盘时转换为上述格式。
+
+查询不再逐个扫描全部向量，复杂度约为 O(log n)；召回率由 hnsw_m、hnsw_ef_construction 与 hnsw_ef_search 控制，
+ef 越大召回率越高、查询越慢。删除的向量在索引中标记删除，其位置由之后插入的向量复用。
+
+带元数据过滤的查询：满足条件的向量不多于 _EXACT_FILTER_MAX 个时取出这些向量精确计算，
+否则在 HNSW 检索时用 filter 跳过不满足条件的向量。
+"""
+
+import asyncio
+import json
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import hnswlib
+import numpy as np
+
+from ..base import BaseVectorStorage
+from ..meta_index import MetadataFilters, MetadataIndex
+from ..utils import load_json, logger
+
+# 过滤后的向量数不超过该值时精确计算相似度
+_EXACT_FILTER_MAX = 10000
+# .log 的行数超过该值与存活向量数两倍中的较大者时重写为全量
+_LOG_REWRITE_MIN = 1000
+
+
+@dataclass
+class HNSWVectorDBStorage(BaseVectorStorage):
+    """
+    HNSW 向量存储，接口与 NanoVectorDBStorage 相同。
+    """
+
+    cosine_better_than_threshold: float = 0.2
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._index_file = os.path.join(working_dir, f"vdb_{self.namespace}.hnsw")
+        self._log_file = self._index_file + ".log"
+        self._max_batch_size = self.global_config["embedding_batch_num"]
+        self.cosine_better_than_threshold = self.global_config.get(
+            "cosine_better_than_threshold", self.cosine_better_than_threshold
+        )
+        self.m = self.global_config.get("hnsw_m", 16)
+        self.ef_construction = self.global_config.get("hnsw_ef_construction", 200)
+        self.ef_search = self.global_config.get("hnsw_ef_search", 128)
+        dim = self.embedding_func.embedding_dim
+
+        # 标签 -> {"__id__": id, **meta_fields}
+        self._meta: dict[int, dict] = {}
+        self._next_label = 0
+        # .log 最后一次提交的代数与行数，上次落盘之后新增、修改或删除的标签
+        self._generation = 0
+        self._log_lines = 0
+        self._changed_labels: set[int] = set()
+        # 下次落盘时重写完整的 .log（转换旧格式或修正元数据之后）
+        self._rewrite_log = False
+        index_file, index_generation = self._load_meta()
+        # id -> 索引内部标签
+        self._labels: dict[str, int] = {
+            dp["__id__"]: label for label, dp in self._meta.items()
+        }
+
+        self._index = hnswlib.Index(space="cosine", dim=dim)
+        if index_file is not None and self._labels:
+            self._index.load_index(index_file, allow_replace_deleted=True)
+            if index_generation != self._generation:
+                self._reconcile(index_file, index_generation)
+        else:
+            self._index.init_index(
+                max_elements=1024,
+                ef_construction=self.ef_construction,
+                M=self.m,
+                allow_replace_deleted=True,
+            )
+        self._meta_index = MetadataIndex(self.meta_fields)
+        for dp in self._meta.values():
+            self._meta_index.add(dp["__id__"], dp)
+        self._dirty = self._rewrite_log
+        logger.info(
+            f"Load HNSW index {self.namespace} with {len(self._labels)} vectors "
+            f"(M={self.m}, ef_construction={self.ef_construction}, ef={self.ef_search})"
+        )
+
+    def _index_files(self) -> dict[int, str]:
+        """已写出的索引文件：代数 -> 路径，旧格式的 vdb_{namespace}.hnsw 视为第 0 代"""
+        directory, prefix = os.path.split(self._index_file + ".")
+        files = {}
+        for name in os.listdir(directory or "."):
+            suffix = name[len(prefix) :]
+            if name.startswith(prefix) and suffix.isdigit():
+                files[int(suffix)] = os.path.join(directory, name)
+        if os.path.exists(self._index_file):
+            files.setdefault(0, self._index_file)
+        return files
+
+    def _load_meta(self) -> tuple[Optional[str], int]:
+        """读取 .log（或旧格式的 .json），返回最新的索引文件及其代数"""
+        files = self._index_files()
+        index_generation = max(files, default=0)
+        index_file = files.get(index_generation)
+        if not os.path.exists(self._log_file):
+            legacy = load_json(self._index_file + ".json") or {}
+            self._meta = {
+                int(label): data for label, data in legacy.get("meta", {}).items()
+            }
+            self._next_label = legacy.get("next_label", 0)
+            self._rewrite_log = bool(legacy)
+            return index_file, index_generation
+
+        pending, committed_bytes, offset = [], 0, 0
+        with open(self._log_file, "rb") as f:
+            for line in f:
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if "commit" not in record:
+                    pending.append(record)
+                    continue
+                for item in pending:
+                    if "meta" in item:
+                        self._meta[item["label"]] = item["meta"]
+                    else:
+                        self._meta.pop(item["label"], None)
+                self._log_lines += len(pending) + 1
+                pending = []
+                self._generation = record["commit"]
+                self._next_label = record["next_label"]
+                committed_bytes = offset
+        if committed_bytes < os.path.getsize(self._log_file):
+            logger.warning(f"Truncating uncommitted records in {self._log_file}")
+            with open(self._log_file, "r+b") as f:
+                f.truncate(committed_bytes)
+        return index_file, index_generation
+
+    def _reconcile(self, index_file: str, index_generation: int):
+        """索引与 .log 的代数不一致时，以索引中实际存在的向量为准修正元数据"""
+        logger.warning(
+            f"HNSW index {index_file} is generation {index_generation} but "
+            f"{self._log_file} is generation {self._generation}, reconciling metadata"
+        )
+        stored = set(self._index.get_ids_list())
+        for label in list(self._meta):
+            try:
+                if label not in stored:
+                    raise RuntimeError
+                self._index.get_items([label])
+            except RuntimeError:
+                # 向量未写入索引或已在索引中删除
+                del self._labels[self._meta.pop(label)["__id__"]]
+        for label in stored - set(self._meta):
+            try:
+                self._index.mark_deleted(label)
+            except RuntimeError:
+                pass
+        self._next_label = max(self._next_label, max(stored, default=-1) + 1)
+        self._rewrite_log = True
+
+    def _reserve(self, n: int):
+        """保证索引还能容纳 n 个新向量，标记删除的位置可以复用"""
+        deleted = self._index.element_count - len(self._labels)
+        needed = self._index.element_count - deleted + n
+        capacity = self._index.get_max_elements()
+        if needed > capacity:
+            self._index.resize_index(max(needed, capacity * 2))
+
+    async def upsert(self, data: dict[str, dict]):
+        logger.info(f"Inserting {len(data)} vectors to {self.namespace}")
+        if not len(data):
+            logger.warning("You insert an empty data to vector DB")
+            return []
+        contents = [v["content"] for v in data.values()]
+        batches = [
+            contents[i : i + self._max_batch_size]
+            for i in range(0, len(contents), self._max_batch_size)
+        ]
+        embeddings_list = await asyncio.gather(
+            *[self.embedding_func(batch) for batch in batches]
+        )
+        embeddings = np.concatenate(embeddings_list)
+
+        labels = []
+        for k, v in data.items():
+            label = self._labels.get(k)
+            if label is None:
+                label = self._labels[k] = self._next_label
+                self._next_label += 1
+            self._meta[label] = {
+                "__id__": k,
+                **{k1: v1 for k1, v1 in v.items() if k1 in self.meta_fields},
+            }
+            self._meta_index.add(k, self._meta[label])
+            self._changed_labels.add(label)
+            labels.append(label)
+        self._reserve(len(labels))
+        self._index.add_items(embeddings, np.asarray(labels), replace_deleted=True)
+        self._dirty = True
+        return labels
+
+    def _search(
+        self, embeddings: np.ndarray, top_k: int, filters: Optional[MetadataFilters] = None
+    ) -> list[list[dict]]:
+        allowed = None
+        if filters:
+            allowed = [self._labels[id] for id in self._meta_index.match(filters)]
+            if len(allowed) <= _EXACT_FILTER_MAX:
+                return self._search_exact(embeddings, top_k, allowed)
+            allowed = set(allowed)
+        k = min(top_k, len(self._labels) if allowed is None else len(allowed))
+        if k == 0:
+            return [[] for _ in range(len(embeddings))]
+        self._index.set_ef(max(self.ef_search, k))
+        try:
+            labels, distances = self._index.knn_query(
+                embeddings, k=k, filter=None if allowed is None else allowed.__contains__
+            )
+        except RuntimeError:
+            # 删除过多或 ef 过小时 hnswlib 可能找不到 k 个结果，逐个查询并减小 k
+            return [self._search_one(embedding, k, allowed) for embedding in embeddings]
+        return [
+            self._to_results(row_labels, row_distances)
+            for row_labels, row_distances in zip(labels, distances)
+        ]
+
+    def _search_one(
+        self, embedding: np.ndarray, k: int, allowed: Optional[set] = None
+    ) -> list[dict]:
+        while k > 0:
+            try:
+                labels, distances = self._index.knn_query(
+                    embedding, k=k, filter=None if allowed is None else allowed.__contains__
+                )
+                return self._to_results(labels[0], distances[0])
+            except RuntimeError:
+                k //= 2
+        return []
+
+    def _search_exact(
+        self, embeddings: np.ndarray, top_k: int, labels: list[int]
+    ) -> list[list[dict]]:
+        """只与 labels 对应的向量精确计算相似度（索引中的向量已归一化）"""
+        if not labels:
+            return [[] for _ in range(len(embeddings))]
+        labels = np.asarray(labels)
+        vectors = self._index.get_items(labels, return_type="numpy")
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        embeddings = embeddings / np.maximum(
+            np.linalg.norm(embeddings, axis=-1, keepdims=True), 1e-12
+        )
+        scores = embeddings @ vectors.T
+        k = min(top_k, len(labels))
+        top_index = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row_scores, row_index in zip(scores, top_index):
+            row_index = row_index[np.argsort(-row_scores[row_index])]
+            results.append(self._to_results(labels[row_index], 1.0 - row_scores[row_index]))
+        return results
+
+    def _to_results(self, labels: np.ndarray, distances: np.ndarray) -> list[dict]:
+        results = []
+        for label, distance in zip(labels, distances):
+            # hnswlib 的 cosine 距离为 1 - 余弦相似度
+            similarity = float(1.0 - distance)
+            if similarity < self.cosine_better_than_threshold:
+                break
+            dp = self._meta[int(label)]
+            results.append(
+                {
+                    **dp,
+                    "__metrics__": similarity,
+                    "id": dp["__id__"],
+                    "distance": similarity,
+                }
+            )
+        return results
+
+    async def query(self, query: str, top_k=5, filters: Optional[MetadataFilters] = None):
+        return (await self.query_batch([query], top_k, filters))[0]
+
+    async def query_batch(
+        self, queries: list[str], top_k=5, filters: Optional[MetadataFilters] = None
+    ) -> list[list[dict]]:
+        """批量查询：所有查询一次 embedding，一次 knn_query 并行检索"""
+        if not len(queries):
+            return []
+        embeddings = await self.embedding_func(list(queries))
+        return self._search(embeddings, top_k, filters)
+
+    async def delete(self, ids: list[str]):
+        """按 id 删除向量，不存在的 id 被忽略"""
+        for id in ids:
+            label = self._labels.pop(id, None)
+            if label is None:
+                continue
+            self._index.mark_deleted(label)
+            del self._meta[label]
+            self._meta_index.remove(id)
+            self._changed_labels.add(label)
+            self._dirty = True
+
+    def ids_missing_meta(self, name: str) -> set[str]:
+        return self._meta_index.missing(name)
+
+    async def update_meta(self, metas: dict[str, dict]):
+        for id, meta in metas.items():
+            label = self._labels.get(id)
+            if label is None:
+                continue
+            dp = self._meta[label]
+            dp.update({k: v for k, v in meta.items() if k in self.meta_fields})
+            self._meta_index.add(id, dp)
+            self._changed_labels.add(label)
+            self._dirty = True
+
+    async def delete_entity(self, entity_name: str):
+        entity_ids = self._meta_index.lookup("entity_name", entity_name)
+        if entity_ids:
+            await self.delete(list(entity_ids))
+            logger.info(f"Entity {entity_name} have been deleted.")
+        else:
+            logger.info(f"No entity found with name {entity_name}.")
+
+    async def delete_relation(self, entity_name: str):
+        ids_to_delete = self._meta_index.lookup(
+            "src_id", entity_name
+        ) | self._meta_index.lookup("tgt_id", entity_name)
+        if ids_to_delete:
+            await self.delete(list(ids_to_delete))
+            logger.info(f"All relations related to entity {entity_name} have been deleted.")
+        else:
+            logger.info(f"No relations found for entity {entity_name}.")
+
+    async def index_done_callback(self):
+        if not self._dirty:
+            return
+        generation = self._generation + 1
+        records = [
+            {"label": label, "meta": self._meta[label]}
+            if label in self._meta
+            else {"label": label, "deleted": True}
+            for label in sorted(self._changed_labels)
+        ]
+        rewrite = self._rewrite_log or self._log_lines + len(records) > max(
+            _LOG_REWRITE_MIN, 2 * len(self._meta)
+        )
+        if rewrite:
+            records = [
+                {"label": label, "meta": dp} for label, dp in sorted(self._meta.items())
+            ]
+        records.append({"commit": generation, "next_label": self._next_label})
+        lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+
+        # 先提交 .log 再写出带代数的索引，两者之间崩溃时加载会发现代数不一致
+        if rewrite:
+            with open(self._log_file + ".tmp", "w", encoding="utf-8") as f:
+                f.write(lines)
+            os.replace(self._log_file + ".tmp", self._log_file)
+            self._log_lines = len(records)
+        else:
+            with open(self._log_file, "a", encoding="utf-8") as f:
+                f.write(lines)
+            self._log_lines += len(records)
+        index_file = f"{self._index_file}.{generation}"
+        self._index.save_index(index_file + ".tmp")
+        os.replace(index_file + ".tmp", index_file)
+        for old_generation, old_file in self._index_files().items():
+            if old_generation != generation:
+                os.remove(old_file)
+        if os.path.exists(self._index_file + ".json"):
+            os.remove(self._index_file + ".json")
+
+        self._generation = generation
+        self._changed_labels.clear()
+        self._rewrite_log = False
+        self._dirty = False
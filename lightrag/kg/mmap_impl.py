@@ -0,0 +1,390 @@
+"""
+内存映射的向量存储。
+
+每个 namespace 保存三个文件：
+
+    vdb_{namespace}.vectors.npy  向量矩阵（.npy 格式，行数为容量，前 count 行有效），以 mmap 方式打开
+    vdb_{namespace}.scales.npy   int8 量化时每行的缩放系数
+    vdb_{namespace}.index.log    每行的 id 与 meta_fields、已删除的行，每行一条 JSON 记录
+
+.index.log 落盘时只追加上次落盘之后变化的行，并以提交记录结束；记录数超过存活向量数的两倍时重写为全量，
+加载时只重放到最后一条提交记录。删除的行在删除落盘之后由新写入的向量复用。
+旧版本的 vdb_{namespace}.index.json 在首次落盘时转换为 .index.log。
+
+向量写入前归一化，按 mmap_vector_dtype 保存为 float32、float16 或 int8（每行一个缩放系数，
+v ≈ int8 行 * scale）。加载时只读取 .npy 头部与索引文件，向量按需从页缓存读入，多个进程打开
+同一文件时共用页缓存。查询分块计算相似度，每块只临时转换为 float32，再用一次 np.argpartition 取 top-k。
+
+首次启动时若存在旧的 vdb_{namespace}.json（NanoVectorDBStorage），其内容会被导入，旧文件保留不变。
+"""
+
+import asyncio
+import json
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from nano_vectordb.dbs import load_storage
+
+from ..base import BaseVectorStorage
+from ..meta_index import MetadataFilters, MetadataIndex
+from ..utils import load_json, logger
+
+# 查询时每次转换为 float32 的行数，限制临时内存
+_QUERY_CHUNK_ROWS = 8192
+# .index.log 的行数超过该值与存活向量数两倍中的较大者时重写为全量
+_LOG_REWRITE_MIN = 1000
+_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def _open_npy(path: str, dtype, shape: tuple, mode: str) -> np.memmap:
+    if mode == "w+":
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+    return np.load(path, mmap_mode=mode)
+
+
+@dataclass
+class MmapVectorDBStorage(BaseVectorStorage):
+    """
+    内存映射的向量存储，接口与 NanoVectorDBStorage 相同，检索结果是精确的（量化误差除外）。
+    """
+
+    cosine_better_than_threshold: float = 0.2
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        prefix = os.path.join(working_dir, f"vdb_{self.namespace}")
+        self._vectors_file = f"{prefix}.vectors.npy"
+        self._scales_file = f"{prefix}.scales.npy"
+        self._index_file = f"{prefix}.index.log"
+        self._legacy_index_file = f"{prefix}.index.json"
+        self._max_batch_size = self.global_config["embedding_batch_num"]
+        self.cosine_better_than_threshold = self.global_config.get(
+            "cosine_better_than_threshold", self.cosine_better_than_threshold
+        )
+        self._dim = self.embedding_func.embedding_dim
+
+        self._rows: list[Optional[dict]] = []
+        self._vectors: Optional[np.memmap] = None
+        self._scales: Optional[np.memmap] = None
+        # .index.log 的行数，上次落盘之后写入或删除的行
+        self._log_lines = 0
+        self._changed_rows: set[int] = set()
+        # 下次落盘时重写完整的 .index.log
+        self._rewrite_log = False
+        # 可复用的已删除行；删除尚未落盘的行暂存在 _released_rows 中，
+        # 避免崩溃后 .index.log 中的旧 id 指向新写入的向量
+        self._free_rows: list[int] = []
+        self._released_rows: list[int] = []
+
+        index = self._load_index()
+        if index is None:
+            self.dtype = self.global_config.get("mmap_vector_dtype", "float16")
+            self._migrate_json(f"{prefix}.json")
+        else:
+            # 已有文件按保存时的精度打开，与当前配置无关
+            self.dtype = index["dtype"]
+            self._rows = index["rows"]
+            self._vectors = np.load(self._vectors_file, mmap_mode="r+")
+            self._scales = (
+                np.load(self._scales_file, mmap_mode="r+") if self.dtype == "int8" else None
+            )
+        # id -> 行号
+        self._row_of = {
+            row["__id__"]: i for i, row in enumerate(self._rows) if row is not None
+        }
+        self._deleted = np.array([row is None for row in self._rows], dtype=bool)
+        self._free_rows = np.flatnonzero(self._deleted)[::-1].tolist()
+        self._meta_index = MetadataIndex(self.meta_fields)
+        for id, position in self._row_of.items():
+            self._meta_index.add(id, self._rows[position])
+        self._dirty = self._rewrite_log
+        logger.info(
+            f"Load mmap vector storage {self.namespace} with {len(self._row_of)} vectors "
+            f"({self.dtype})"
+        )
+
+    def _migrate_json(self, json_file: str):
+        storage = load_storage(json_file)
+        if not storage or not storage["data"]:
+            return
+        logger.info(f"Migrating {len(storage['data'])} vectors from {json_file}")
+        rows = [
+            {k: v for k, v in dp.items() if k != "__vector__"} for dp in storage["data"]
+        ]
+        self._write_rows(list(range(len(rows))), _normalize(storage["matrix"]))
+        self._rows = rows
+        self._rewrite_log = True
+        self._save_index()
+
+    # ---------------------------------------------------------------- 文件
+
+    def _load_index(self) -> Optional[dict]:
+        """读取 .index.log（或旧格式的 .index.json），返回 {"dtype", "rows"}，都不存在时返回 None"""
+        if not os.path.exists(self._index_file):
+            index = load_json(self._legacy_index_file)
+            self._rewrite_log = index is not None
+            return index
+
+        rows, dtype, pending = [], None, []
+        committed_bytes, offset = 0, 0
+        with open(self._index_file, "rb") as f:
+            for line in f:
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if "commit" not in record:
+                    pending.append(record)
+                    continue
+                del rows[record["count"] :]
+                rows.extend([None] * (record["count"] - len(rows)))
+                for item in pending:
+                    rows[item["row"]] = item.get("meta")
+                self._log_lines += len(pending) + 1
+                pending = []
+                dtype = record["dtype"]
+                committed_bytes = offset
+        if committed_bytes < os.path.getsize(self._index_file):
+            logger.warning(f"Truncating uncommitted records in {self._index_file}")
+            with open(self._index_file, "r+b") as f:
+                f.truncate(committed_bytes)
+        return None if dtype is None else {"dtype": dtype, "rows": rows}
+
+    def _reserve(self, rows: int):
+        """保证矩阵至少有 rows 行，容量按倍数增长"""
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        if rows <= capacity:
+            return
+        capacity = max(rows, capacity * 2, 1024)
+        for name, path, dtype, shape in [
+            ("_vectors", self._vectors_file, _DTYPES[self.dtype], (capacity, self._dim)),
+            ("_scales", self._scales_file, np.float32, (capacity,)),
+        ]:
+            if name == "_scales" and self.dtype != "int8":
+                continue
+            old = getattr(self, name)
+            new = _open_npy(path + ".tmp", dtype, shape, "w+")
+            if old is not None:
+                new[: len(old)] = old
+            new.flush()
+            setattr(self, name, None)
+            del old
+            os.replace(path + ".tmp", path)
+            setattr(self, name, np.load(path, mmap_mode="r+"))
+
+    def _write_rows(self, positions: list[int], vectors: np.ndarray):
+        self._reserve(max(positions) + 1)
+        if self.dtype == "int8":
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            self._vectors[positions] = np.round(vectors / scales[:, None]).astype(np.int8)
+            self._scales[positions] = scales
+        else:
+            self._vectors[positions] = vectors.astype(_DTYPES[self.dtype])
+
+    def _save_index(self):
+        """先写回向量，再追加变化的行与提交记录"""
+        if self._vectors is not None:
+            self._vectors.flush()
+        if self._scales is not None:
+            self._scales.flush()
+        records = [
+            {"row": position, "meta": self._rows[position]}
+            if self._rows[position] is not None
+            else {"row": position}
+            for position in sorted(self._changed_rows)
+        ]
+        rewrite = self._rewrite_log or self._log_lines + len(records) > max(
+            _LOG_REWRITE_MIN, 2 * len(self._row_of)
+        )
+        if rewrite:
+            records = [
+                {"row": position, "meta": row}
+                for position, row in enumerate(self._rows)
+                if row is not None
+            ]
+        records.append({"commit": True, "dtype": self.dtype, "count": len(self._rows)})
+        lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        if rewrite:
+            tmp_file = self._index_file + ".tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                f.write(lines)
+            os.replace(tmp_file, self._index_file)
+            self._log_lines = len(records)
+            if os.path.exists(self._legacy_index_file):
+                os.remove(self._legacy_index_file)
+        else:
+            with open(self._index_file, "a", encoding="utf-8") as f:
+                f.write(lines)
+            self._log_lines += len(records)
+        self._changed_rows.clear()
+        self._rewrite_log = False
+        # 删除已落盘，这些行可以复用
+        self._free_rows.extend(self._released_rows)
+        self._released_rows.clear()
+
+    # ---------------------------------------------------------------- 检索
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """(查询数, 行数) 的余弦相似度，已删除的行为 -inf"""
+        count = len(self._rows)
+        scores = np.empty((len(queries), count), dtype=np.float32)
+        for start in range(0, count, _QUERY_CHUNK_ROWS):
+            end = min(start + _QUERY_CHUNK_ROWS, count)
+            block = np.asarray(self._vectors[start:end], dtype=np.float32)
+            scores[:, start:end] = queries @ block.T
+            if self._scales is not None:
+                scores[:, start:end] *= self._scales[start:end]
+        scores[:, self._deleted] = -np.inf
+        return scores
+
+    def _scores_of(self, queries: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        """(查询数, len(positions)) 的余弦相似度，只读取 positions 对应的行"""
+        block = np.asarray(self._vectors[positions], dtype=np.float32)
+        scores = queries @ block.T
+        if self._scales is not None:
+            scores *= self._scales[positions]
+        return scores
+
+    def _search(
+        self, embeddings: np.ndarray, top_k: int, filters: Optional[MetadataFilters] = None
+    ) -> list[list[dict]]:
+        if filters:
+            positions = np.array(
+                sorted(self._row_of[id] for id in self._meta_index.match(filters)),
+                dtype=np.int64,
+            )
+            if not len(positions):
+                return [[] for _ in range(len(embeddings))]
+            scores = self._scores_of(_normalize(embeddings), positions)
+        else:
+            if not self._row_of:
+                return [[] for _ in range(len(embeddings))]
+            positions = None
+            scores = self._scores(_normalize(embeddings))
+        k = min(top_k, len(self._row_of) if positions is None else len(positions))
+        top_index = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row_scores, row_index in zip(scores, top_index):
+            row_index = row_index[np.argsort(-row_scores[row_index])]
+            row_results = []
+            for i in row_index:
+                score = float(row_scores[i])
+                if score < self.cosine_better_than_threshold:
+                    break
+                dp = self._rows[i if positions is None else positions[i]]
+                row_results.append(
+                    {**dp, "__metrics__": score, "id": dp["__id__"], "distance": score}
+                )
+            results.append(row_results)
+        return results
+
+    # ---------------------------------------------------------------- 向量存储接口
+
+    async def upsert(self, data: dict[str, dict]):
+        logger.info(f"Inserting {len(data)} vectors to {self.namespace}")
+        if not len(data):
+            logger.warning("You insert an empty data to vector DB")
+            return []
+        contents = [v["content"] for v in data.values()]
+        batches = [
+            contents[i : i + self._max_batch_size]
+            for i in range(0, len(contents), self._max_batch_size)
+        ]
+        embeddings_list = await asyncio.gather(
+            *[self.embedding_func(batch) for batch in batches]
+        )
+        embeddings = _normalize(np.concatenate(embeddings_list))
+
+        positions = []
+        for k, v in data.items():
+            row = {"__id__": k, **{k1: v1 for k1, v1 in v.items() if k1 in self.meta_fields}}
+            position = self._row_of.get(k)
+            if position is None:
+                position = self._free_rows.pop() if self._free_rows else len(self._rows)
+                self._row_of[k] = position
+                if position == len(self._rows):
+                    self._rows.append(row)
+            self._rows[position] = row
+            self._meta_index.add(k, row)
+            self._changed_rows.add(position)
+            positions.append(position)
+        self._write_rows(positions, embeddings)
+        self._deleted = np.concatenate(
+            [self._deleted, np.zeros(len(self._rows) - len(self._deleted), dtype=bool)]
+        )
+        self._deleted[positions] = False
+        self._dirty = True
+        return list(data.keys())
+
+    async def query(self, query: str, top_k=5, filters: Optional[MetadataFilters] = None):
+        return (await self.query_batch([query], top_k, filters))[0]
+
+    async def query_batch(
+        self, queries: list[str], top_k=5, filters: Optional[MetadataFilters] = None
+    ) -> list[list[dict]]:
+        """
+        批量查询：所有查询一次 embedding，分块矩阵乘法后一次 argpartition 取 top-k。
+        给出 filters 时只读取满足条件的行。
+        """
+        if not len(queries):
+            return []
+        embeddings = await self.embedding_func(list(queries))
+        return self._search(embeddings, top_k, filters)
+
+    async def delete(self, ids: list[str]):
+        """按 id 删除向量，删除的行不再被检索到，删除落盘后由新写入的向量复用"""
+        for id in ids:
+            position = self._row_of.pop(id, None)
+            if position is None:
+                continue
+            self._rows[position] = None
+            self._deleted[position] = True
+            self._meta_index.remove(id)
+            self._changed_rows.add(position)
+            self._released_rows.append(position)
+            self._dirty = True
+
+    def ids_missing_meta(self, name: str) -> set[str]:
+        return self._meta_index.missing(name)
+
+    async def update_meta(self, metas: dict[str, dict]):
+        for id, meta in metas.items():
+            position = self._row_of.get(id)
+            if position is None:
+                continue
+            row = self._rows[position]
+            row.update({k: v for k, v in meta.items() if k in self.meta_fields})
+            self._meta_index.add(id, row)
+            self._changed_rows.add(position)
+            self._dirty = True
+
+    async def delete_entity(self, entity_name: str):
+        entity_ids = self._meta_index.lookup("entity_name", entity_name)
+        if entity_ids:
+            await self.delete(list(entity_ids))
+            logger.info(f"Entity {entity_name} have been deleted.")
+        else:
+            logger.info(f"No entity found with name {entity_name}.")
+
+    async def delete_relation(self, entity_name: str):
+        ids_to_delete = self._meta_index.lookup(
+            "src_id", entity_name
+        ) | self._meta_index.lookup("tgt_id", entity_name)
+        if ids_to_delete:
+            await self.delete(list(ids_to_delete))
+            logger.info(f"All relations related to entity {entity_name} have been deleted.")
+        else:
+            logger.info(f"No relations found for entity {entity_name}.")
+
+    async def index_done_callback(self):
+        if self._dirty:
+            self._save_index()
+            self._dirty = False
@@ -3,7 +3,7 @@ import asyncio
 # import html
 # import os
 from dataclasses import dataclass
-from typing import Union
+from typing import Optional, Union
 import numpy as np
 import array
 
@@ -300,27 +300,73 @@ class OracleVectorDBStorage(BaseVectorStorage):
         pass
 
     #################### query method ###############
-    async def query(self, query: str, top_k=5) -> Union[dict, list[dict]]:
+    async def query(
+        self, query: str, top_k=5, filters: Optional[dict] = None
+    ) -> Union[dict, list[dict]]:
         """从向量数据库中查询数据"""
-        embeddings = await self.embedding_func([query])
-        embedding = embeddings[0]
+        return (await self.query_batch([query], top_k, filters))[0]
+
+    async def query_batch(
+        self, queries: list[str], top_k=5, filters: Optional[dict] = None
+    ) -> list[list[dict]]:
+        """批量查询：所有查询向量作为一张内联表，与向量表在一条 SQL 中按查询分组取 top_k"""
+        if not len(queries):
+            return []
+        embeddings = await self.embedding_func(list(queries))
         # 转换精度
-        dtype = str(embedding.dtype).upper()
-        dimension = embedding.shape[0]
-        embedding_string = "[" + ", ".join(map(str, embedding.tolist())) + "]"
-
-        SQL = SQL_TEMPLATES[self.namespace].format(dimension=dimension, dtype=dtype)
-        params = {
-            "embedding_string": embedding_string,
-            "workspace": self.db.workspace,
-            "top_k": top_k,
-            "better_than_threshold": self.cosine_better_than_threshold,
-        }
-        # print(SQL)
-        results = await self.db.query(SQL, params=params, multirows=True)
-        # print("vector search result:",results)
+        dtype = str(embeddings.dtype).upper()
+        dimension = embeddings.shape[1]
+        query_table = " UNION ALL ".join(
+            f"SELECT {i} AS qid, vector(:embedding_string_{i},{dimension},{dtype}) AS qv FROM dual"
+            for i in range(len(queries))
+        )
+        filter_sql, params = self._filter_sql(filters)
+        SQL = SQL_TEMPLATES[self.namespace + "_batch"].format(
+            queries=query_table, filters=filter_sql
+        )
+        params.update(
+            {
+                f"embedding_string_{i}": "["
+                + ", ".join(map(str, embedding.tolist()))
+                + "]"
+                for i, embedding in enumerate(embeddings)
+            }
+        )
+        params.update(
+            {
+                "workspace": self.db.workspace,
+                "top_k": top_k,
+                "better_than_threshold": self.cosine_better_than_threshold,
+            }
+        )
+        rows = await self.db.query(SQL, params=params, multirows=True)
+        results = [[] for _ in queries]
+        for row in rows:
+            results[int(row.pop("qid"))].append(row)
         return results
 
+    def _filter_sql(self, filters: Optional[dict]) -> tuple[str, dict]:
+        """把 字段 -> 值或值列表 的过滤条件转换为 AND t.列 IN (...) 与绑定参数"""
+        columns = FILTER_COLUMNS.get(self.namespace, {})
+        conditions, params = [], {}
+        for i, (field_name, field_values) in enumerate((filters or {}).items()):
+            if field_name not in columns:
+                raise ValueError(
+                    f"Field {field_name} cannot be filtered in {self.namespace}, "
+                    f"supported fields: {sorted(columns)}"
+                )
+            if isinstance(field_values, str):
+                field_values = [field_values]
+            names = []
+            for j, value in enumerate(field_values):
+                names.append(f":filter_{i}_{j}")
+                params[f"filter_{i}_{j}"] = value
+            if not names:
+                conditions.append(" AND 1=0")
+            else:
+                conditions.append(f" AND t.{columns[field_name]} IN ({','.join(names)})")
+        return "".join(conditions), params
+
 
 @dataclass
 class OracleGraphStorage(BaseGraphStorage):
@@ -342,16 +388,8 @@ class OracleGraphStorage(BaseGraphStorage):
         logger.debug(f"entity_name:{entity_name}, entity_type:{entity_type}")
 
         content = entity_name + description
-        contents = [content]
-        batches = [
-            contents[i : i + self._max_batch_size]
-            for i in range(0, len(contents), self._max_batch_size)
-        ]
-        embeddings_list = await asyncio.gather(
-            *[self.embedding_func(batch) for batch in batches]
-        )
-        embeddings = np.concatenate(embeddings_list)
-        content_vector = embeddings[0]
+        # 并发合并的节点、边的单条 embedding 调用由 BatchedEmbeddingFunc 合并为批量请求
+        content_vector = (await self.embedding_func([content]))[0]
         merge_sql = SQL_TEMPLATES["merge_node"]
         data = {
             "workspace": self.db.workspace,
@@ -382,16 +420,7 @@ class OracleGraphStorage(BaseGraphStorage):
         )
 
         content = keywords + source_name + target_name + description
-        contents = [content]
-        batches = [
-            contents[i : i + self._max_batch_size]
-            for i in range(0, len(contents), self._max_batch_size)
-        ]
-        embeddings_list = await asyncio.gather(
-            *[self.embedding_func(batch) for batch in batches]
-        )
-        embeddings = np.concatenate(embeddings_list)
-        content_vector = embeddings[0]
+        content_vector = (await self.embedding_func([content]))[0]
         merge_sql = SQL_TEMPLATES["merge_edge"]
         data = {
             "workspace": self.db.workspace,
@@ -554,6 +583,13 @@ N_T = {
     "relationships": "LIGHTRAG_GRAPH_EDGES",
 }
 
+# 向量查询可过滤的元数据字段 -> 表中的列
+FILTER_COLUMNS = {
+    "chunks": {"full_doc_id": "full_doc_id"},
+    "entities": {"entity_name": "name"},
+    "relationships": {"src_id": "source_name", "tgt_id": "target_name"},
+}
+
 TABLES = {
     "LIGHTRAG_DOC_FULL": {
         "ddl": """CREATE TABLE LIGHTRAG_DOC_FULL (
@@ -669,6 +705,23 @@ SQL_TEMPLATES = {
         (SELECT id,VECTOR_DISTANCE(content_vector,vector(:embedding_string,{dimension},{dtype}),COSINE) as distance
         FROM LIGHTRAG_DOC_CHUNKS WHERE workspace=:workspace)
         WHERE distance>:better_than_threshold ORDER BY distance ASC FETCH FIRST :top_k ROWS ONLY""",
+    # 批量查询：{queries} 为 (qid, qv) 内联表，每个查询按距离编号后取前 top_k 行，
+    # {filters} 为元数据过滤条件，见 FILTER_COLUMNS
+    "entities_batch": """SELECT qid, entity_name FROM
+        (SELECT q.qid,t.name as entity_name,ROW_NUMBER() OVER (PARTITION BY q.qid ORDER BY VECTOR_DISTANCE(t.content_vector,q.qv,COSINE) ASC) as rn
+        FROM ({queries}) q CROSS JOIN LIGHTRAG_GRAPH_NODES t
+        WHERE t.workspace=:workspace AND VECTOR_DISTANCE(t.content_vector,q.qv,COSINE)>:better_than_threshold{filters})
+        WHERE rn<=:top_k ORDER BY qid, rn""",
+    "relationships_batch": """SELECT qid, src_id, tgt_id FROM
+        (SELECT q.qid,t.source_name as src_id,t.target_name as tgt_id,ROW_NUMBER() OVER (PARTITION BY q.qid ORDER BY VECTOR_DISTANCE(t.content_vector,q.qv,COSINE) ASC) as rn
+        FROM ({queries}) q CROSS JOIN LIGHTRAG_GRAPH_EDGES t
+        WHERE t.workspace=:workspace AND VECTOR_DISTANCE(t.content_vector,q.qv,COSINE)>:better_than_threshold{filters})
+        WHERE rn<=:top_k ORDER BY qid, rn""",
+    "chunks_batch": """SELECT qid, id FROM
+        (SELECT q.qid,t.id,ROW_NUMBER() OVER (PARTITION BY q.qid ORDER BY VECTOR_DISTANCE(t.content_vector,q.qv,COSINE) ASC) as rn
+        FROM ({queries}) q CROSS JOIN LIGHTRAG_DOC_CHUNKS t
+        WHERE t.workspace=:workspace AND VECTOR_DISTANCE(t.content_vector,q.qv,COSINE)>:better_than_threshold{filters})
+        WHERE rn<=:top_k ORDER BY qid, rn""",
     # SQL for GraphStorage
     "has_node": """SELECT * FROM GRAPH_TABLE (lightrag_graph
         MATCH (a)
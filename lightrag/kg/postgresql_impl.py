@@ -3,7 +3,7 @@ from dataclasses import dataclass
 from datetime import datetime
 import asyncio
 import os
-from typing import AsyncGenerator, TypeVar, Union
+from typing import AsyncGenerator, Optional, TypeVar, Union
 from typing import (
     cast as typing_cast,
 )
@@ -14,13 +14,15 @@ from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy import Text, Integer, DateTime
 from pgvector.sqlalchemy import Vector
 from sqlalchemy import text
-from sqlalchemy import func, select, desc, delete
+from sqlalchemy import func, select, desc, delete, values, column, cast, true
 from sqlalchemy.orm import (
+    aliased,
     scoped_session,
 )
 
 from ..utils import logger
 from ..base import BaseVectorStorage
+from ..meta_index import MetadataFilters
 
 T = TypeVar("T")
 
@@ -186,6 +188,51 @@ class PostgresVectorStorage:
             # 格式化结果
             return [dict(model.__dict__) for model, similarity in result]
 
+    async def search_batch(
+        self,
+        query_vectors: np.ndarray,
+        top_k: int = 5,
+        filters: Optional[MetadataFilters] = None,
+    ) -> list[list[dict]]:
+        """
+        多个查询向量的相似度搜索，每个查询向量的 top_k 通过 LATERAL 子查询在一条 SQL 中完成。
+        filters 为 字段 -> 值或值列表，转换为 WHERE 字段 IN (...)。
+        """
+        queries = values(
+            column("qid", Integer), column("qv", Vector(self.vector_dim)), name="queries"
+        ).data([(i, vector.tolist()) for i, vector in enumerate(query_vectors)])
+        # VALUES 中的参数类型推断为 text，比较前显式转换为 vector
+        distance = self.model.embedding.cosine_distance(
+            cast(queries.c.qv, Vector(self.vector_dim))
+        )
+        conditions = [self.model.workspace == self.workspace]
+        for field_name, field_values in (filters or {}).items():
+            if not hasattr(self.model, field_name):
+                raise ValueError(
+                    f"Field {field_name} not found in model {self.model.__name__}"
+                )
+            if isinstance(field_values, str):
+                field_values = [field_values]
+            conditions.append(getattr(self.model, field_name).in_(list(field_values)))
+        nearest = (
+            select(self.model, (1 - distance).label("similarity"))
+            .where(*conditions)
+            .order_by(distance)
+            .limit(top_k)
+            .lateral("nearest")
+        )
+        stmt = (
+            select(queries.c.qid, aliased(self.model, nearest))
+            .select_from(queries.join(nearest, true()))
+            .order_by(queries.c.qid, desc(nearest.c.similarity))
+        )
+        async with self._make_async_session() as session:
+            result = await session.execute(stmt)
+            results = [[] for _ in query_vectors]
+            for qid, model in result.fetchall():
+                results[qid].append(dict(model.__dict__))
+            return results
+
     async def delete(self, ids: Union[str, list[str]]):
         """删除指定id的记录
 
@@ -264,9 +311,18 @@ class ChunkStorage(BaseVectorStorage):
         embeddings = await self.embedding_func(contents)
         return await self.storage.upsert(data, embeddings)
 
-    async def query(self, query: str, top_k=5) -> list[dict]:
-        embedding = (await self.embedding_func([query]))[0]
-        return await self.storage.search(embedding, top_k)
+    async def query(
+        self, query: str, top_k=5, filters: Optional[MetadataFilters] = None
+    ) -> list[dict]:
+        return (await self.query_batch([query], top_k, filters))[0]
+
+    async def query_batch(
+        self, queries: list[str], top_k=5, filters: Optional[MetadataFilters] = None
+    ) -> list[list[dict]]:
+        if not len(queries):
+            return []
+        embeddings = await self.embedding_func(list(queries))
+        return await self.storage.search_batch(embeddings, top_k, filters)
 
 
 @dataclass
@@ -287,9 +343,18 @@ class EntityStorage(BaseVectorStorage):
         embeddings = await self.embedding_func(contents)
         return await self.storage.upsert(data, embeddings)
 
-    async def query(self, query: str, top_k=5) -> list[dict]:
-        embedding = (await self.embedding_func([query]))[0]
-        return await self.storage.search(embedding, top_k)
+    async def query(
+        self, query: str, top_k=5, filters: Optional[MetadataFilters] = None
+    ) -> list[dict]:
+        return (await self.query_batch([query], top_k, filters))[0]
+
+    async def query_batch(
+        self, queries: list[str], top_k=5, filters: Optional[MetadataFilters] = None
+    ) -> list[list[dict]]:
+        if not len(queries):
+            return []
+        embeddings = await self.embedding_func(list(queries))
+        return await self.storage.search_batch(embeddings, top_k, filters)
 
     async def delete_entity(self, entity_name: str):
         try:
@@ -318,9 +383,18 @@ class RelationshipStorage(BaseVectorStorage):
         embeddings = await self.embedding_func(contents)
         return await self.storage.upsert(data, embeddings)
 
-    async def query(self, query: str, top_k=5) -> list[dict]:
-        embedding = (await self.embedding_func([query]))[0]
-        return await self.storage.search(embedding, top_k)
+    async def query(
+        self, query: str, top_k=5, filters: Optional[MetadataFilters] = None
+    ) -> list[dict]:
+        return (await self.query_batch([query], top_k, filters))[0]
+
+    async def query_batch(
+        self, queries: list[str], top_k=5, filters: Optional[MetadataFilters] = None
+    ) -> list[list[dict]]:
+        if not len(queries):
+            return []
+        embeddings = await self.embedding_func(list(queries))
+        return await self.storage.search_batch(embeddings, top_k, filters)
 
     async def delete_relation(self, entity_name: str):
         try:
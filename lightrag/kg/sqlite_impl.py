@@ -0,0 +1,170 @@
+"""
+基于 SQLite 的 KV 存储，适合单机部署：数据保存在磁盘上，内存占用与数据量无关。
+
+每个 namespace 一个数据库文件 kv_store_{namespace}.sqlite，表 kv(id TEXT PRIMARY KEY, value TEXT)，
+value 为 JSON。数据库使用 WAL 日志模式，所有 SQL 在专用的单线程执行器中执行，不阻塞事件循环。
+
+首次启动时若存在旧的 kv_store_{namespace}.json，其内容会被导入数据库，旧文件保留不变。
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Union
+
+from ..base import BaseKVStorage
+from ..utils import load_json, logger
+
+# IN 查询每批的参数个数，固定长度的批次可以复用已编译的语句
+_IN_CHUNK_SIZE = 256
+
+
+def _chunks(items: list, size: int = _IN_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def _placeholders(n: int) -> str:
+    return ",".join("?" * n)
+
+
+@dataclass
+class SQLiteKVStorage(BaseKVStorage):
+    """
+    SQLite KV 存储，接口与 JsonKVStorage 相同，已存在的 key 不会被覆盖。
+    """
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._file_name = os.path.join(working_dir, f"kv_store_{self.namespace}.sqlite")
+        # sqlite3 连接只在这个线程中使用
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"sqlite-{self.namespace}"
+        )
+        exists = os.path.exists(self._file_name)
+        self._conn = self._executor.submit(self._connect).result()
+        if not exists:
+            self._executor.submit(self._migrate_json).result()
+        count = self._executor.submit(
+            lambda: self._conn.execute("SELECT COUNT(*) FROM kv").fetchone()[0]
+        ).result()
+        logger.info(f"Load KV {self.namespace} with {count} data")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self._file_name, check_same_thread=False, cached_statements=256
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (id TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        conn.commit()
+        return conn
+
+    def _migrate_json(self):
+        json_file = os.path.join(
+            self.global_config["working_dir"], f"kv_store_{self.namespace}.json"
+        )
+        data = load_json(json_file)
+        if not data:
+            return
+        logger.info(f"Migrating {len(data)} KV {self.namespace} entries from {json_file}")
+        self._insert(data)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, func, *args
+        )
+
+    # ---------------------------------------------------------------- 同步实现
+
+    def _existing_ids(self, ids: list[str]) -> set[str]:
+        existing = set()
+        for chunk in _chunks(ids):
+            existing.update(
+                row[0]
+                for row in self._conn.execute(
+                    f"SELECT id FROM kv WHERE id IN ({_placeholders(len(chunk))})", chunk
+                )
+            )
+        return existing
+
+    def _select(self, ids: list[str], fields: Union[set[str], None]) -> dict[str, str]:
+        rows = {}
+        for chunk in _chunks(list(dict.fromkeys(ids))):
+            if fields is None:
+                sql = f"SELECT id, value FROM kv WHERE id IN ({_placeholders(len(chunk))})"
+                params = chunk
+            else:
+                # 在 SQL 中只取出需要的字段，不读出整个 value。json_each 把 JSON 布尔值
+                # 取成整数 1/0，需要按 type 还原，否则 True/False 会变成 1/0
+                sql = (
+                    "SELECT id, (SELECT json_group_object(key, CASE type "
+                    "WHEN 'true' THEN json('true') WHEN 'false' THEN json('false') "
+                    "ELSE value END) FROM json_each(kv.value) "
+                    f"WHERE key IN ({_placeholders(len(fields))})) "
+                    f"FROM kv WHERE id IN ({_placeholders(len(chunk))})"
+                )
+                params = [*fields, *chunk]
+            rows.update(self._conn.execute(sql, params).fetchall())
+        return rows
+
+    def _insert(self, data: dict[str, dict]) -> dict[str, dict]:
+        with self._conn:
+            existing = self._existing_ids(list(data.keys()))
+            left_data = {k: v for k, v in data.items() if k not in existing}
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO kv (id, value) VALUES (?, ?)",
+                (
+                    (k, json.dumps(v, ensure_ascii=False, separators=(",", ":")))
+                    for k, v in left_data.items()
+                ),
+            )
+        return left_data
+
+    # ---------------------------------------------------------------- KV 接口
+
+    async def all_keys(self) -> list[str]:
+        return await self._run(
+            lambda: [row[0] for row in self._conn.execute("SELECT id FROM kv")]
+        )
+
+    async def index_done_callback(self):
+        # upsert 已在事务中提交，这里只把 WAL 合并回数据库文件
+        await self._run(
+            lambda: self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        )
+
+    async def get_by_id(self, id: str) -> Union[dict, None]:
+        return (await self.get_by_ids([id]))[0]
+
+    async def get_by_ids(self, ids, fields=None):
+        fields = None if fields is None else set(fields)
+        rows = await self._run(self._select, list(ids), fields)
+        return [json.loads(rows[id]) if id in rows else None for id in ids]
+
+    async def filter_keys(self, data: list[str]) -> set[str]:
+        existing = await self._run(self._existing_ids, list(data))
+        return set([s for s in data if s not in existing])
+
+    async def upsert(self, data: dict[str, dict]):
+        return await self._run(self._insert, data)
+
+    async def drop(self):
+        def _drop():
+            with self._conn:
+                self._conn.execute("DELETE FROM kv")
+
+        await self._run(_drop)
+
+    async def close(self):
+        """提交 WAL 并关闭连接与执行器，之后不能再使用该存储"""
+        if self._conn is None:
+            return
+        await self._run(self._conn.close)
+        self._conn = None
+        self._executor.shutdown(wait=True)
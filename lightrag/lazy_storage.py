@@ -0,0 +1,72 @@
+"""
+按需加载的存储。
+
+LazyStorage 在首次访问属性时才创建并加载被包装的存储，只用于查询的进程不会读取
+插入时才用到的 full_docs 等 namespace。未加载的存储 index_done_callback、query_done_callback 与 close 为空操作。
+
+每个存储（无论是否延迟加载）加载的耗时与加载前后的 RSS 变化记录在 StorageLoadStats 中。
+"""
+
+import time
+from typing import Any, Callable
+
+from .utils import current_rss_bytes, logger
+
+
+class StorageLoadStats:
+    """namespace -> {"seconds": 加载耗时, "rss_bytes": 加载前后的 RSS 变化, "lazy": 是否延迟加载}"""
+
+    def __init__(self):
+        self.namespaces: dict[str, dict] = {}
+
+    def load(self, namespace: str, factory: Callable[[], Any], lazy: bool = False):
+        rss = current_rss_bytes()
+        start = time.perf_counter()
+        storage = factory()
+        stats = self.namespaces[namespace] = {
+            "seconds": time.perf_counter() - start,
+            "rss_bytes": current_rss_bytes() - rss,
+            "lazy": lazy,
+        }
+        logger.info(
+            f"Loaded storage {namespace} in {stats['seconds']:.3f}s, "
+            f"RSS +{stats['rss_bytes'] / 1024**2:.1f} MB"
+        )
+        return storage
+
+
+class LazyStorage:
+    """
+    首次访问属性时才创建的存储代理，除回调外的属性直接访问被包装的存储。
+    """
+
+    def __init__(self, namespace: str, factory: Callable[[], Any], stats: StorageLoadStats):
+        self._namespace = namespace
+        self._factory = factory
+        self._stats = stats
+        self._storage = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._storage is not None
+
+    def _load(self):
+        if self._storage is None:
+            self._storage = self._stats.load(self._namespace, self._factory, lazy=True)
+        return self._storage
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._load(), name)
+
+    async def index_done_callback(self):
+        if self._storage is not None:
+            await self._storage.index_done_callback()
+
+    async def query_done_callback(self):
+        if self._storage is not None:
+            await self._storage.query_done_callback()
+
+    async def close(self):
+        close = getattr(self._storage, "close", None)
+        if close is not None:
+            await close()
@@ -1,6 +1,8 @@
 import asyncio
+import multiprocessing
 import os
-from dataclasses import asdict, dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
 from datetime import datetime
 from functools import partial
 import sys
@@ -8,11 +10,12 @@ import traceback
 from typing import Type, cast
 
 from .llm import (
+    close_provider_clients,
     gpt_4o_mini_complete,
     openai_embedding,
 )
 from .operate import (
-    chunking_by_token_size,
+    chunking_document,
     extract_entities,
     local_query,
     global_query,
@@ -20,10 +23,29 @@ from .operate import (
     naive_query,
 )
 
+from .dedup import NearDuplicateIndex
+from .embedding_cache import EmbeddingCache, embedding_model_id
+from .journal import InsertJournal
+from .keyword_cache import QueryKeywordCache
+from .lazy_storage import LazyStorage, StorageLoadStats
+from .llm_cache import SegmentedLLMCacheStorage
+from .pipeline import InsertPipeline, PipelineStats
+from .prompt_zh import PROMPTS_ZH
+from .query_batch import BatchedVectorQuery, CachedStorageView
+from .query_cache import SemanticQueryCache
+from .wal_graph import WALNetworkXStorage
+from .wal_kv import WALKVStorage
 from .utils import (
+    BatchedEmbeddingFunc,
     EmbeddingFunc,
+    compute_args_hash,
     compute_mdhash_id,
+    get_rate_limiter,
     limit_async_func_call,
+    priority_scope,
+    rate_limit_async_func_call,
+    track_graph_access,
+    PRIORITY_EXTRACTION,
     convert_response_to_json,
     logger,
     set_logger,
@@ -46,6 +68,9 @@ from .kg.neo4j_impl import Neo4JStorage
 
 from .kg.oracle_impl import OracleKVStorage, OracleGraphStorage, OracleVectorDBStorage
 from .kg.postgresql_impl import PostgresStorageFactory
+from .kg.sqlite_impl import SQLiteKVStorage
+from .kg.hnsw_impl import HNSWVectorDBStorage
+from .kg.mmap_impl import MmapVectorDBStorage
 
 # future KG integrations
 
@@ -84,10 +109,28 @@ class LightRAG:
     chunk_token_size: int = 1200
     chunk_overlap_token_size: int = 100
     tiktoken_model_name: str = "gpt-4o-mini"
+    # 切分文档的进程数，大于 1 时多个文档会分发到进程池中并行切分。
+    # 进程池以 spawn 方式启动子进程，调用 insert 的脚本需放在 if __name__ == "__main__": 下
+    chunking_max_workers: int = 1
 
     # entity extraction
     entity_extract_max_gleaning: int = 1
     entity_summary_to_max_tokens: int = 500
+    # 近重复文本块检测：MinHash 估计的相似度不低于阈值的文本块复用相似文本块的提取结果
+    enable_near_duplicate_detection: bool = False
+    near_duplicate_threshold: float = 0.9
+
+    # insert pipeline
+    # 开启后切分、实体提取、合并、向量化通过有界队列流水线执行，而不是逐阶段等待全部完成
+    insert_pipeline: bool = False
+    insert_pipeline_queue_size: int = 64
+    insert_pipeline_merge_workers: int = 4
+    # 合并与向量化阶段凑批的最长等待时间（秒）
+    insert_pipeline_batch_wait: float = 0.05
+
+    # insert journal
+    # 开启后插入进度记录在 insert_journal.jsonl 中，中断的插入可以通过 aresume_insert 继续
+    enable_insert_journal: bool = False
 
     # node embedding
     node_embedding_algorithm: str = "node2vec"
@@ -106,6 +149,17 @@ class LightRAG:
     embedding_func: EmbeddingFunc = field(default_factory=lambda: openai_embedding)
     embedding_batch_num: int = 32
     embedding_func_max_async: int = 16
+    embedding_rpm: int = None
+    embedding_tpm: int = None
+    # 开启后合并 embedding_batch_wait 秒内并发的小批量 embedding 调用，每次请求最多 embedding_batch_num 条文本
+    embedding_micro_batching: bool = False
+    embedding_batch_wait: float = 0.005
+    # embedding 缓存：以 (模型 id, 文本哈希) 为键缓存向量。模型 id 默认由 embedding 函数名、
+    # 模型名参数（partial 绑定、闭包变量或默认值）与向量维度组成，推断不出模型名时必须设置 embedding_cache_model_id
+    enable_embedding_cache: bool = False
+    embedding_cache_model_id: str = None
+    embedding_cache_max_entries: int = 100000
+    embedding_cache_dtype: str = "float16"
 
     # LLM
     llm_model_func: callable = gpt_4o_mini_complete  # hf_model_complete#
@@ -115,11 +169,44 @@ class LightRAG:
     llm_model_max_token_size: int = 32768
     llm_model_max_async: int = 16
     llm_model_kwargs: dict = field(default_factory=dict)
+    # 服务端的速率限制：每分钟请求数与每分钟 token 数，None 表示不限制
+    llm_model_rpm: int = None
+    llm_model_tpm: int = None
 
     # storage
     vector_db_storage_cls_kwargs: dict = field(default_factory=dict)
+    # HNSWVectorDBStorage：每个节点的邻居数、建索引与查询时的候选集大小，越大召回率越高、越慢
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 200
+    hnsw_ef_search: int = 128
+    # MmapVectorDBStorage：新建的向量文件的保存精度，float32、float16 或 int8
+    mmap_vector_dtype: str = "float16"
+    # 开启后 full_docs、text_chunks 与 LLM 响应缓存在首次访问时才加载，只查询的进程不读取 full_docs
+    lazy_kv_loading: bool = False
+    # WALKVStorage：wal.log 超过快照大小的 compaction_ratio 倍且不小于 compaction_min_bytes 时压缩为新快照，
+    # 编码后不小于 compress_bytes 的 value 以 zlib 压缩保存
+    kv_wal_compaction_ratio: float = 1.0
+    kv_wal_compaction_min_bytes: int = 64 * 1024**2
+    kv_wal_compress_bytes: int = 1024
+    # WALNetworkXStorage：delta.log 超过图快照大小的 compaction_ratio 倍且不小于 compaction_min_bytes 时重写快照
+    graph_wal_compaction_ratio: float = 1.0
+    graph_wal_compaction_min_bytes: int = 64 * 1024**2
 
     enable_llm_cache: bool = True
+    # LLM 响应缓存的存储，None 时与 kv_storage 相同；设为 SegmentedLLMCacheStorage 可限制缓存大小与有效期
+    llm_cache_storage: str = None
+    # SegmentedLLMCacheStorage：缓存大小上限（字节）、记录有效期（秒）与段文件大小，None 表示不限制
+    llm_cache_max_bytes: int = 2 * 1024**3
+    llm_cache_ttl: float = None
+    llm_cache_segment_bytes: int = 64 * 1024**2
+    # 查询关键词缓存：local、global 与 hybrid 查询共用关键词提取的结果，同一查询的并发请求只调用一次 LLM
+    enable_query_keywords_cache: bool = True
+    query_keywords_cache_max_entries: int = 10000
+    # 语义查询缓存：查询参数相同且查询 embedding 的余弦相似度不低于阈值时直接返回缓存的回答，
+    # 插入或删除改动了回答所用的实体或文本块时缓存失效
+    enable_semantic_query_cache: bool = False
+    semantic_query_cache_threshold: float = 0.95
+    semantic_query_cache_max_entries: int = 1000
 
     # extension
     addon_params: dict = field(default_factory=dict)
@@ -156,12 +243,70 @@ class LightRAG:
             logger.info(f"Creating working directory {self.working_dir}")
             os.makedirs(self.working_dir)
 
-        # LLM 响应缓存 kv 存储数据库，存储 LLM 模型的响应结果，见 kv_store_llm_response_cache.json
-        self.llm_response_cache = (
-            self.key_string_value_json_storage_cls(
-                namespace="llm_response_cache",
+        # 在创建存储之前包装 embedding 函数，存储内部的 embedding 调用同样经过调度器
+        embedding_func = self.embedding_func.func
+        if self.embedding_rpm or self.embedding_tpm:
+            embedding_func = rate_limit_async_func_call(
+                get_rate_limiter(
+                    f"embedding:{getattr(embedding_func, '__name__', repr(embedding_func))}",
+                    rpm=self.embedding_rpm,
+                    tpm=self.embedding_tpm,
+                ),
+                kind="embedding",
+                tiktoken_model_name=self.tiktoken_model_name,
+            )(embedding_func)
+        limited_embedding_func = limit_async_func_call(self.embedding_func_max_async)(
+            embedding_func
+        )
+        embedding_func_cls, batch_kwargs = EmbeddingFunc, {}
+        if self.embedding_micro_batching:
+            embedding_func_cls = BatchedEmbeddingFunc
+            batch_kwargs = dict(
+                max_batch_size=self.embedding_batch_num,
+                max_wait=self.embedding_batch_wait,
+            )
+        self.embedding_func = embedding_func_cls(
+            embedding_dim=self.embedding_func.embedding_dim,
+            max_token_size=self.embedding_func.max_token_size,
+            func=limited_embedding_func,
+            **batch_kwargs,
+        )
+        self._embedding_batcher = (
+            self.embedding_func if self.embedding_micro_batching else None
+        )
+
+        # embedding 缓存，所有向量库共用，见 embedding_cache_{模型 id}.bin
+        self.embedding_cache = None
+        if self.enable_embedding_cache:
+            model_id = self.embedding_cache_model_id or embedding_model_id(
+                self.embedding_func
+            )
+            if model_id is None:
+                raise ValueError(
+                    "Cannot infer the embedding model from embedding_func, "
+                    "set embedding_cache_model_id when enable_embedding_cache is True"
+                )
+            self.embedding_cache = EmbeddingCache(
+                namespace=model_id,
                 global_config=asdict(self),
-                embedding_func=None,
+            )
+            self.embedding_func = self.embedding_cache.wrap(self.embedding_func)
+
+        # 各存储的加载耗时与 RSS 变化，见 storage_load_metrics
+        self.storage_load_stats = StorageLoadStats()
+
+        # LLM 响应缓存 kv 存储数据库，存储 LLM 模型的响应结果
+        llm_cache_storage = self.llm_cache_storage or self.kv_storage
+        self.llm_response_cache = (
+            self._open_storage(
+                "llm_response_cache",
+                partial(
+                    self._get_storage_class()[llm_cache_storage],
+                    namespace="llm_response_cache",
+                    global_config=asdict(self),
+                    embedding_func=None,
+                ),
+                lazy=self.lazy_kv_loading,
             )
             if self.enable_llm_cache
             else None
@@ -171,22 +316,67 @@ class LightRAG:
         # add embedding func by walter
         ####
         # 全文 kv 存储数据库表，存储文档的 id 与其内容的映射，见 kv_store_full_docs.json
-        self.full_docs = self.key_string_value_json_storage_cls(
-            namespace="full_docs",
-            global_config=asdict(self),
-            embedding_func=self.embedding_func,
+        self.full_docs = self._open_storage(
+            "full_docs",
+            partial(
+                self.key_string_value_json_storage_cls,
+                namespace="full_docs",
+                global_config=asdict(self),
+                embedding_func=self.embedding_func,
+            ),
+            lazy=self.lazy_kv_loading,
         )
 
         # 文本块 kv 存储数据库表，存储文本块的 id 与其内容的映射，见 kv_store_text_chunks.json
-        self.text_chunks = self.key_string_value_json_storage_cls(
-            namespace="text_chunks",
-            global_config=asdict(self),
-            embedding_func=self.embedding_func,
+        self.text_chunks = self._open_storage(
+            "text_chunks",
+            partial(
+                self.key_string_value_json_storage_cls,
+                namespace="text_chunks",
+                global_config=asdict(self),
+                embedding_func=self.embedding_func,
+            ),
+            lazy=self.lazy_kv_loading,
+        )
+
+        # 文本块近重复索引，存储文本块的 MinHash 签名与提取结果，见 near_duplicates_text_chunks.log
+        self.near_duplicate_index = (
+            NearDuplicateIndex(namespace="text_chunks", global_config=asdict(self))
+            if self.enable_near_duplicate_detection
+            else None
+        )
+
+        # 查询关键词缓存，存储规范化后的查询与其关键词，见 query_keywords_cache.json
+        self.query_keywords_cache = (
+            QueryKeywordCache(
+                namespace="query_keywords_cache",
+                global_config=asdict(self),
+                prompt_hash=compute_args_hash(PROMPTS_ZH["keywords_extraction"]),
+            )
+            if self.enable_query_keywords_cache
+            else None
+        )
+
+        # 语义查询缓存，存储查询的 embedding、回答与回答用到的实体和文本块，见 semantic_query_cache.log
+        self.semantic_query_cache = (
+            SemanticQueryCache(
+                namespace="semantic_query_cache",
+                global_config=asdict(self),
+                embedding_func=self.embedding_func,
+            )
+            if self.enable_semantic_query_cache
+            else None
         )
 
         # 实体关系图数据库表，存储实体之间的关系，见 graph_chunk_entity_relation.graphml
-        self.chunk_entity_relation_graph = self.graph_storage_cls(
-            namespace="chunk_entity_relation", global_config=asdict(self)
+        self.chunk_entity_relation_graph = self._open_storage(
+            "chunk_entity_relation",
+            partial(
+                self.graph_storage_cls,
+                namespace="chunk_entity_relation",
+                global_config=asdict(self),
+                embedding_func=self.embedding_func,
+            ),
         )
         ####
         # add embedding func by walter over
@@ -196,70 +386,132 @@ class LightRAG:
         self.vector_storage_cls = self._get_storage_class()[self.vector_storage]
 
         # 实体数据库
-        self.entities_vdb: Type[BaseVectorStorage] = (
-            self.vector_storage_cls("entities")(namespace="entities", global_config=asdict(self), embedding_func=self.embedding_func)
-            if self.vector_storage == "PostgresVectorDBStorage"
-            else self.vector_storage_cls(
-                namespace="entities",
-                global_config=asdict(self),
-                embedding_func=self.embedding_func,
-                meta_fields=(
-                    {"entity_name"}
-                ),
-            )
+        self.entities_vdb: Type[BaseVectorStorage] = self._open_storage(
+            "entities",
+            lambda: (
+                self.vector_storage_cls("entities")(namespace="entities", global_config=asdict(self), embedding_func=self.embedding_func)
+                if self.vector_storage == "PostgresVectorDBStorage"
+                else self.vector_storage_cls(
+                    namespace="entities",
+                    global_config=asdict(self),
+                    embedding_func=self.embedding_func,
+                    meta_fields=(
+                        {"entity_name"}
+                    ),
+                )
+            ),
         )
 
         # 关系数据库
-        self.relationships_vdb: Type[BaseVectorStorage] = (
-            self.vector_storage_cls("relationships")(namespace="relationships", global_config=asdict(self), embedding_func=self.embedding_func)
-            if self.vector_storage == "PostgresVectorDBStorage"
-            else self.vector_storage_cls(
-                namespace="relationships",
-                global_config=asdict(self),
-                embedding_func=self.embedding_func,
-                meta_fields=(
-                    {"src_id", "tgt_id"}
-                ),
-            )
+        self.relationships_vdb: Type[BaseVectorStorage] = self._open_storage(
+            "relationships",
+            lambda: (
+                self.vector_storage_cls("relationships")(namespace="relationships", global_config=asdict(self), embedding_func=self.embedding_func)
+                if self.vector_storage == "PostgresVectorDBStorage"
+                else self.vector_storage_cls(
+                    namespace="relationships",
+                    global_config=asdict(self),
+                    embedding_func=self.embedding_func,
+                    meta_fields=(
+                        {"src_id", "tgt_id"}
+                    ),
+                )
+            ),
         )
 
         # 文本块数据库
-        self.chunks_vdb: Type[BaseVectorStorage] = (
-            self.vector_storage_cls("chunks")(namespace="chunks", global_config=asdict(self), embedding_func=self.embedding_func)
-            if self.vector_storage == "PostgresVectorDBStorage"
-            else self.vector_storage_cls(
-                namespace="chunks",
-                global_config=asdict(self),
-                embedding_func=self.embedding_func,
-                meta_fields=(
-                    {}
-                ),
-            )
+        self.chunks_vdb: Type[BaseVectorStorage] = self._open_storage(
+            "chunks",
+            lambda: (
+                self.vector_storage_cls("chunks")(namespace="chunks", global_config=asdict(self), embedding_func=self.embedding_func)
+                if self.vector_storage == "PostgresVectorDBStorage"
+                else self.vector_storage_cls(
+                    namespace="chunks",
+                    global_config=asdict(self),
+                    embedding_func=self.embedding_func,
+                    meta_fields=(
+                        {"full_doc_id"}
+                    ),
+                )
+            ),
         )
 
-        self.embedding_func = limit_async_func_call(self.embedding_func_max_async)(
-            self.embedding_func
+        llm_model_func = partial(
+            self.llm_model_func,
+            hashing_kv=self.llm_response_cache,
+            **self.llm_model_kwargs,
         )
-
+        if self.llm_model_rpm or self.llm_model_tpm:
+            llm_model_func = rate_limit_async_func_call(
+                get_rate_limiter(
+                    f"llm:{getattr(self.llm_model_func, '__name__', repr(self.llm_model_func))}:{self.llm_model_name}",
+                    rpm=self.llm_model_rpm,
+                    tpm=self.llm_model_tpm,
+                ),
+                kind="llm",
+                tiktoken_model_name=self.tiktoken_model_name,
+            )(llm_model_func)
         self.llm_model_func = limit_async_func_call(self.llm_model_max_async)(
-            partial(
-                self.llm_model_func,
-                hashing_kv=self.llm_response_cache,
-                **self.llm_model_kwargs,
-            )
+            llm_model_func
+        )
+
+        self._schedulers = {
+            "llm": self.llm_model_func.scheduler,
+            "embedding": limited_embedding_func.scheduler,
+        }
+        self._rate_limiters = {
+            "llm": getattr(llm_model_func, "rate_limiter", None),
+            "embedding": getattr(embedding_func, "rate_limiter", None),
+        }
+
+        # 切分文档的进程池，首次并行切分时创建
+        self._chunking_executor: ProcessPoolExecutor = None
+
+        # 为旧版本写入的文本块向量补齐 full_doc_id 的任务，首次按 doc_ids 查询时启动
+        self._chunk_doc_ids_backfill: asyncio.Future = None
+
+        # 最近一次流水线插入的各阶段统计
+        self.insert_pipeline_stats: PipelineStats = None
+
+        # 插入日志
+        self.insert_journal: InsertJournal = (
+            InsertJournal(os.path.join(self.working_dir, "insert_journal.jsonl"))
+            if self.enable_insert_journal
+            else None
         )
 
+    def _open_storage(self, namespace: str, factory, lazy: bool = False):
+        """创建存储并记录加载耗时与 RSS 变化，lazy 为 True 时推迟到首次访问"""
+        if lazy:
+            return LazyStorage(namespace, factory, self.storage_load_stats)
+        return self.storage_load_stats.load(namespace, factory)
+
+    def storage_load_metrics(self) -> dict:
+        """
+        各存储的加载统计：namespace -> {"seconds", "rss_bytes", "lazy"}，尚未加载的延迟存储不在其中。
+        """
+        return {
+            namespace: dict(stats)
+            for namespace, stats in self.storage_load_stats.namespaces.items()
+        }
+
     def _get_storage_class(self):
         return {
             # kv storage
             "JsonKVStorage": JsonKVStorage,
             "OracleKVStorage": OracleKVStorage,
+            "SQLiteKVStorage": SQLiteKVStorage,
+            "SegmentedLLMCacheStorage": SegmentedLLMCacheStorage,
+            "WALKVStorage": WALKVStorage,
             # vector storage
             "NanoVectorDBStorage": NanoVectorDBStorage,
+            "HNSWVectorDBStorage": HNSWVectorDBStorage,
+            "MmapVectorDBStorage": MmapVectorDBStorage,
             "OracleVectorDBStorage": OracleVectorDBStorage,
             "PostgresVectorDBStorage": PostgresStorageFactory.get_storage_class,
             # graph storage
             "NetworkXStorage": NetworkXStorage,
+            "WALNetworkXStorage": WALNetworkXStorage,
             "Neo4JStorage": Neo4JStorage,
             "OracleGraphStorage": OracleGraphStorage,
             # "ArangoDBStorage": ArangoDBStorage
@@ -279,40 +531,136 @@ class LightRAG:
         Returns:
             None
         """
+        if isinstance(string_or_strings, str):
+            string_or_strings = [string_or_strings]
+
+        new_docs = {
+            compute_mdhash_id(c.strip(), prefix="doc-"): {"content": c.strip()}
+            for c in string_or_strings
+        }
+        # 插入中的 LLM 与 embedding 调用以实体提取优先级排队，不阻塞并发的查询
+        with priority_scope(PRIORITY_EXTRACTION):
+            await self._ainsert_docs(new_docs)
+
+    def resume_insert(self):
+        loop = always_get_an_event_loop()
+        return loop.run_until_complete(self.aresume_insert())
+
+    async def aresume_insert(self):
+        """
+        根据插入日志继续未完成的插入：已提取的文本块不再调用 LLM，已合并、已向量化的文本块跳过对应阶段。
+        需要开启 enable_insert_journal。
+
+        Returns:
+            None
+        """
+        if self.insert_journal is None:
+            logger.warning("Insert journal is disabled, nothing to resume")
+            return
+        pending_docs = self.insert_journal.pending_docs()
+        if not len(pending_docs):
+            logger.info("No pending docs in insert journal")
+            return
+        logger.info(f"[Resume] resuming {len(pending_docs)} docs from insert journal")
+        with priority_scope(PRIORITY_EXTRACTION):
+            await self._ainsert_docs(pending_docs)
+
+    def insert_status(self) -> dict:
+        """
+        查询插入日志中未完成文档与各阶段文本块的数量。
+
+        Returns:
+            dict: 插入进度，未开启 enable_insert_journal 时为空字典
+        """
+        if self.insert_journal is None:
+            return {}
+        return self.insert_journal.status()
+
+    def scheduler_metrics(self) -> dict:
+        """
+        查询 LLM 与 embedding 调度器的并发数、各优先级的排队数与等待时间。
+
+        Returns:
+            dict: {"llm": {...}, "embedding": {...}}
+        """
+        return {name: s.metrics() for name, s in self._schedulers.items()}
+
+    def rate_limiter_metrics(self) -> dict:
+        """
+        查询 LLM 与 embedding 最近一分钟实际的 RPM/TPM 与配置的限额，未配置限速的项为 None。
+
+        Returns:
+            dict: {"llm": {...}, "embedding": {...}}
+        """
+        return {
+            name: limiter.metrics() if limiter is not None else None
+            for name, limiter in self._rate_limiters.items()
+        }
+
+    def embedding_batch_metrics(self) -> dict:
+        """
+        查询 embedding 调用的合并情况：合并的调用数、请求数与平均填充率，未开启合并时返回空字典。
+
+        Returns:
+            dict: 合并统计
+        """
+        if self._embedding_batcher is None:
+            return {}
+        return self._embedding_batcher.metrics()
+
+    def embedding_cache_metrics(self) -> dict:
+        """
+        查询 embedding 缓存的命中数、未命中数、淘汰数、条目数与命中率，未开启缓存时返回空字典。
+
+        Returns:
+            dict: 缓存统计
+        """
+        if self.embedding_cache is None:
+            return {}
+        return self.embedding_cache.metrics()
+
+    async def _ainsert_docs(self, new_docs: dict[str, dict]):
+        """
+        插入文档，new_docs 中已存在于 full_docs 的文档会被跳过。
+        开启语义查询缓存时，用到本次插入改动的实体的缓存回答失效。
+
+        Args:
+            new_docs (dict[str, dict]): 文档 id 到文档内容的映射
+        """
+        with track_graph_access() as touched:
+            try:
+                await self._ainsert_docs_tracked(new_docs)
+            finally:
+                if self.semantic_query_cache is not None:
+                    self.semantic_query_cache.invalidate(**touched)
+                    await self.semantic_query_cache.index_done_callback()
 
+    async def _ainsert_docs_tracked(self, new_docs: dict[str, dict]):
         update_storage = False
+        completed = False
+        journal = self.insert_journal
         try:
-            if isinstance(string_or_strings, str):
-                string_or_strings = [string_or_strings]
-
-            new_docs = {
-                compute_mdhash_id(c.strip(), prefix="doc-"): {"content": c.strip()}
-                for c in string_or_strings
-            }
             _add_doc_keys = await self.full_docs.filter_keys(list(new_docs.keys()))
+            if journal is not None:
+                # 上次插入在写入 full_docs 之后、记录完成之前中断
+                journal.record_done([k for k in new_docs if k not in _add_doc_keys])
+                await journal.flush()
             new_docs = {k: v for k, v in new_docs.items() if k in _add_doc_keys}
             if not len(new_docs):
                 logger.warning("All docs are already in the storage")
                 return
             update_storage = True
             logger.info(f"[New Docs] inserting {len(new_docs)} docs")
+            if journal is not None:
+                journal.record_docs(new_docs)
+                await journal.flush()
+
+            if self.insert_pipeline:
+                completed = await self._ainsert_pipelined(new_docs)
+                return
 
             # chunking
-            inserting_chunks = {}
-            for doc_key, doc in new_docs.items():
-                chunks = {
-                    compute_mdhash_id(dp["content"], prefix="chunk-"): {
-                        **dp,
-                        "full_doc_id": doc_key,
-                    }
-                    for dp in chunking_by_token_size(
-                        doc["content"],
-                        overlap_token_size=self.chunk_overlap_token_size,
-                        max_token_size=self.chunk_token_size,
-                        tiktoken_model=self.tiktoken_model_name,
-                    )
-                }
-                inserting_chunks.update(chunks)
+            inserting_chunks = await self._chunk_documents(new_docs)
             _add_chunk_keys = await self.text_chunks.filter_keys(
                 list(inserting_chunks.keys())
             )
@@ -321,39 +669,259 @@ class LightRAG:
             }
             if not len(inserting_chunks):
                 logger.warning("All chunks are already in the storage")
+                completed = True
                 return
             logger.info(f"[New Chunks] inserting {len(inserting_chunks)} chunks")
 
+            extracting_chunks = {
+                k: v
+                for k, v in inserting_chunks.items()
+                if journal is None or not journal.is_merged(k)
+            }
+            if len(extracting_chunks):
+                logger.info("[Entity Extraction]...")
+                maybe_new_kg = await extract_entities(
+                    extracting_chunks,
+                    knowledge_graph_inst=self.chunk_entity_relation_graph,
+                    entity_vdb=self.entities_vdb,
+                    relationships_vdb=self.relationships_vdb,
+                    global_config=asdict(self),
+                    journal=journal,
+                    near_duplicate_index=self.near_duplicate_index,
+                )
+                if maybe_new_kg is None:
+                    logger.warning("No new entities and relationships found")
+                    return
+                self.chunk_entity_relation_graph = maybe_new_kg
+                if journal is not None:
+                    await self._checkpoint(
+                        [
+                            self.chunk_entity_relation_graph,
+                            self.entities_vdb,
+                            self.relationships_vdb,
+                        ]
+                    )
+                    journal.record_merged(list(extracting_chunks.keys()))
+                    await journal.flush()
 
-            logger.info("[Entity Extraction]...")
-            maybe_new_kg = await extract_entities(
-                inserting_chunks,
-                knowledge_graph_inst=self.chunk_entity_relation_graph,
-                entity_vdb=self.entities_vdb,
-                relationships_vdb=self.relationships_vdb,
-                global_config=asdict(self),
-            )
-            if maybe_new_kg is None:
-                logger.warning("No new entities and relationships found")
-                return
-            self.chunk_entity_relation_graph = maybe_new_kg
-
-            logger.debug(f"[upserting chunks] {inserting_chunks}")
-            await asyncio.gather(
-                # 更新切片数据库
-                self.chunks_vdb.upsert(data=inserting_chunks),
-                # 更新全文数据库
-                self.full_docs.upsert(new_docs),
-                # 更新文本块数据库
-                self.text_chunks.upsert(inserting_chunks)
-            )
+            embedding_chunks = {
+                k: v
+                for k, v in inserting_chunks.items()
+                if journal is None or not journal.is_embedded(k)
+            }
+            logger.debug(f"[upserting chunks] {embedding_chunks}")
+            if journal is not None:
+                # 更新切片数据库，落盘后记录进度
+                await self.chunks_vdb.upsert(data=embedding_chunks)
+                await self._checkpoint([self.chunks_vdb])
+                journal.record_embedded(list(embedding_chunks.keys()))
+                await journal.flush()
+                await asyncio.gather(
+                    self.full_docs.upsert(new_docs),
+                    self.text_chunks.upsert(inserting_chunks),
+                )
+            else:
+                await asyncio.gather(
+                    # 更新切片数据库
+                    self.chunks_vdb.upsert(data=embedding_chunks),
+                    # 更新全文数据库
+                    self.full_docs.upsert(new_docs),
+                    # 更新文本块数据库
+                    self.text_chunks.upsert(inserting_chunks)
+                )
+            completed = True
             
         except Exception as e:
             logger.error(f"Error while inserting line {sys.exc_info()[-1].tb_lineno}: {e}")
             logger.error(f"堆栈信息: {traceback.format_exc()}")
         finally:
             if update_storage:
+                if self.near_duplicate_index is not None:
+                    logger.info(
+                        f"[Near Duplicates] {self.near_duplicate_index.stats['reused_chunks']} chunks reused, "
+                        f"{self.near_duplicate_index.stats['llm_calls_avoided']} LLM calls avoided, "
+                        f"{self.near_duplicate_index.stats['cached_chunks']} chunks already extracted"
+                    )
                 await self._insert_done()
+                if completed and journal is not None:
+                    journal.record_done(list(new_docs.keys()))
+                    await journal.compact()
+                elif journal is not None:
+                    # 中断时保留已缓存的进度，恢复时不必重做
+                    await journal.flush()
+
+    async def _ainsert_pipelined(self, new_docs: dict[str, dict]) -> bool:
+        """
+        以流水线方式插入文档，各阶段的统计保存在 insert_pipeline_stats 中。
+
+        Args:
+            new_docs (dict[str, dict]): 文档 id 到文档内容的映射
+
+        Returns:
+            bool: 文档是否已完成插入
+        """
+        journal = self.insert_journal
+        pipeline = InsertPipeline(
+            chunk_func=self._chunk_document,
+            text_chunks=self.text_chunks,
+            knowledge_graph_inst=self.chunk_entity_relation_graph,
+            entity_vdb=self.entities_vdb,
+            relationships_vdb=self.relationships_vdb,
+            chunks_vdb=self.chunks_vdb,
+            global_config=asdict(self),
+            journal=journal,
+            near_duplicate_index=self.near_duplicate_index,
+        )
+        self.insert_pipeline_stats = pipeline.stats
+        try:
+            inserting_chunks = await pipeline.run(new_docs)
+        finally:
+            self.insert_pipeline_stats = pipeline.stats
+            logger.info(f"[Pipeline] {pipeline.stats.summary()}")
+        if not len(inserting_chunks):
+            logger.warning("All chunks are already in the storage")
+            return True
+        logger.info(f"[New Chunks] inserted {len(inserting_chunks)} chunks")
+
+        if journal is not None:
+            await self._checkpoint(
+                [
+                    self.chunk_entity_relation_graph,
+                    self.entities_vdb,
+                    self.relationships_vdb,
+                    self.chunks_vdb,
+                ]
+            )
+            journal.record_merged(list(inserting_chunks.keys()))
+            journal.record_embedded(list(inserting_chunks.keys()))
+            await journal.flush()
+
+        # 文本块与全文最后写入，作为文档已完成插入的标记
+        await asyncio.gather(
+            self.full_docs.upsert(new_docs),
+            self.text_chunks.upsert(inserting_chunks),
+        )
+        return True
+
+    async def _checkpoint(self, storages: list[StorageNameSpace]):
+        """
+        将存储落盘，之后才能在插入日志中记录对应阶段已完成。
+        """
+        await asyncio.gather(
+            *[
+                cast(StorageNameSpace, storage_inst).index_done_callback()
+                for storage_inst in storages
+                if storage_inst is not None
+            ]
+        )
+
+    async def _chunk_documents(self, new_docs: dict[str, dict]) -> dict[str, dict]:
+        """
+        切分文档。chunking_max_workers 大于 1 且有多个文档时，
+        文档被分发到进程池中并行切分，避免切分阻塞事件循环。
+        开启插入日志时，日志中已有文本块的文档直接复用记录的文本块。
+
+        Args:
+            new_docs (dict[str, dict]): 文档 id 到文档内容的映射
+
+        Returns:
+            dict[str, dict]: 文本块 id 到文本块的映射，按文档顺序排列
+        """
+        chunking_kwargs = self._chunking_kwargs()
+        journal = self.insert_journal
+        journaled_chunks = {}
+        if journal is not None:
+            for doc_key in new_docs:
+                chunks = journal.get_chunks(doc_key)
+                if chunks is not None:
+                    journaled_chunks[doc_key] = chunks
+        chunking_docs = {
+            k: v for k, v in new_docs.items() if k not in journaled_chunks
+        }
+
+        if self.chunking_max_workers <= 1 or len(chunking_docs) <= 1:
+            results = [
+                chunking_document(doc_key, doc["content"], **chunking_kwargs)
+                for doc_key, doc in chunking_docs.items()
+            ]
+        else:
+            loop = asyncio.get_running_loop()
+            results = await asyncio.gather(
+                *[
+                    loop.run_in_executor(
+                        self._get_chunking_executor(),
+                        partial(
+                            chunking_document,
+                            doc_key,
+                            doc["content"],
+                            **chunking_kwargs,
+                        ),
+                    )
+                    for doc_key, doc in chunking_docs.items()
+                ]
+            )
+        chunked = dict(zip(chunking_docs.keys(), results))
+        if journal is not None:
+            for chunks in results:
+                journal.record_chunks(chunks)
+            await journal.flush()
+
+        inserting_chunks = {}
+        for doc_key in new_docs:
+            inserting_chunks.update(
+                journaled_chunks[doc_key]
+                if doc_key in journaled_chunks
+                else chunked[doc_key]
+            )
+        return inserting_chunks
+
+    async def _chunk_document(self, doc_key: str, doc: dict) -> dict[str, dict]:
+        """
+        切分单个文档，供流水线插入使用。切分在执行器中进行，不阻塞事件循环：
+        chunking_max_workers 大于 1 时使用进程池，否则使用默认线程池。
+        开启插入日志时，日志中已有文本块的文档直接复用记录的文本块。
+
+        Args:
+            doc_key (str): 文档 id
+            doc (dict): 文档内容
+
+        Returns:
+            dict[str, dict]: 文本块 id 到文本块的映射
+        """
+        journal = self.insert_journal
+        if journal is not None:
+            chunks = journal.get_chunks(doc_key)
+            if chunks is not None:
+                return chunks
+        executor = (
+            self._get_chunking_executor() if self.chunking_max_workers > 1 else None
+        )
+        chunks = await asyncio.get_running_loop().run_in_executor(
+            executor,
+            partial(
+                chunking_document, doc_key, doc["content"], **self._chunking_kwargs()
+            ),
+        )
+        if journal is not None:
+            journal.record_chunks(chunks)
+            await journal.flush()
+        return chunks
+
+    def _chunking_kwargs(self) -> dict:
+        return dict(
+            overlap_token_size=self.chunk_overlap_token_size,
+            max_token_size=self.chunk_token_size,
+            tiktoken_model=self.tiktoken_model_name,
+        )
+
+    def _get_chunking_executor(self) -> ProcessPoolExecutor:
+        if self._chunking_executor is None:
+            # 不使用 fork：事件循环、存储的锁和后台线程不能安全地复制到子进程中
+            self._chunking_executor = ProcessPoolExecutor(
+                max_workers=self.chunking_max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._chunking_executor
 
     async def _insert_done(self):
         tasks = []
@@ -365,6 +933,8 @@ class LightRAG:
             self.relationships_vdb,
             self.chunks_vdb,
             self.chunk_entity_relation_graph,
+            self.near_duplicate_index,
+            self.embedding_cache,
         ]:
             if storage_inst is None:
                 continue
@@ -376,57 +946,308 @@ class LightRAG:
         return loop.run_until_complete(self.aquery(query, param))
 
     async def aquery(self, query: str, param: QueryParam = QueryParam()):
-        if param.mode == "local":
-            response = await local_query(
-                query,
-                self.chunk_entity_relation_graph,
-                self.entities_vdb,
-                self.relationships_vdb,
-                self.text_chunks,
-                param,
-                asdict(self),
+        response = await self._aquery_cached(query, param)
+        await self._query_done()
+        return response
+
+    async def _aquery_cached(
+        self, query: str, param: QueryParam, storages: dict = None
+    ):
+        cache = self.semantic_query_cache
+        if cache is None or param.only_need_context:
+            return await self._aquery_mode(query, param, storages)
+
+        answer, ticket = await cache.lookup(query, param)
+        if answer is not None:
+            return answer
+        with track_graph_access() as used:
+            response = await self._aquery_mode(query, param, storages)
+        if hasattr(response, "__aiter__"):
+            response = cache.store_stream(ticket, response, used)
+        else:
+            cache.store(ticket, response, used)
+        return response
+
+    def query_batch(
+        self, queries: list[str], param: QueryParam = QueryParam(), max_concurrency: int = 8
+    ):
+        loop = always_get_an_event_loop()
+        results = self.aquery_batch(queries, param, max_concurrency)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(results.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(results.aclose())
+
+    async def aquery_batch(
+        self, queries: list[str], param: QueryParam = QueryParam(), max_concurrency: int = 8
+    ):
+        """
+        并发执行一批查询，按完成顺序产出结果。
+
+        批内的向量查询合并为存储的 query_batch 调用（一次 embedding、一次矩阵乘法服务多个查询），
+        相同的向量查询只执行一次；多个查询共用的实体、关系与文本块只读取一次；
+        相同查询的关键词提取只调用一次 LLM（需开启 enable_query_keywords_cache）。
+        单个查询失败不影响其他查询。
+
+        Args:
+            queries (list[str]): 用户查询列表
+            param (QueryParam): 查询参数，批量查询不支持 stream
+            max_concurrency (int): 同时执行的查询数
+
+        Yields:
+            tuple[int, Optional[str], Optional[Exception]]: (查询下标, 回答, 异常)，查询失败时回答为 None
+        """
+        param = replace(param, stream=False)
+        storages = self._query_storages(batched=True)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run(index: int, query: str):
+            async with semaphore:
+                try:
+                    return index, await self._aquery_cached(query, param, storages), None
+                except Exception as e:
+                    logger.error(f"Query {index} in batch failed: {e}")
+                    return index, None, e
+
+        tasks = [asyncio.ensure_future(run(i, q)) for i, q in enumerate(queries)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # 调用方提前停止迭代时取消未完成的查询
+            for task in tasks:
+                task.cancel()
+            await self._query_done()
+            logger.info(
+                "[Query Batch] "
+                + ", ".join(
+                    f"{name} {view.stats}"
+                    for name, view in storages.items()
+                    if hasattr(view, "stats")
+                )
             )
-        elif param.mode == "global":
-            response = await global_query(
-                query,
-                self.chunk_entity_relation_graph,
-                self.entities_vdb,
-                self.relationships_vdb,
-                self.text_chunks,
-                param,
-                asdict(self),
+
+    def _query_storages(self, batched: bool = False) -> dict:
+        """
+        查询使用的存储与全局配置。batched 为 True 时返回批量查询视图：
+        向量查询合并执行，图与文本块的读取在批内缓存。
+        """
+        storages = {
+            "knowledge_graph_inst": self.chunk_entity_relation_graph,
+            "entities_vdb": self.entities_vdb,
+            "relationships_vdb": self.relationships_vdb,
+            "chunks_vdb": self.chunks_vdb,
+            "text_chunks_db": self.text_chunks,
+            "global_config": asdict(self),
+        }
+        if batched:
+            batch_wait = self.embedding_batch_wait
+            for name in ["entities_vdb", "relationships_vdb", "chunks_vdb"]:
+                storages[name] = BatchedVectorQuery(
+                    storages[name],
+                    max_wait=batch_wait,
+                    max_batch_size=self.embedding_batch_num,
+                )
+            storages["knowledge_graph_inst"] = CachedStorageView(
+                storages["knowledge_graph_inst"],
+                {
+                    "has_node",
+                    "has_edge",
+                    "get_node",
+                    "get_edge",
+                    "node_degree",
+                    "edge_degree",
+                    "get_node_edges",
+                },
+            )
+            storages["text_chunks_db"] = CachedStorageView(
+                storages["text_chunks_db"], {"get_by_id", "get_by_ids"}
             )
-        elif param.mode == "hybrid":
-            response = await hybrid_query(
+        return storages
+
+    def query_stream(self, query: str, param: QueryParam = QueryParam()):
+        loop = always_get_an_event_loop()
+        chunks = self.aquery_stream(query, param)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(chunks.aclose())
+
+    async def aquery_stream(self, query: str, param: QueryParam = QueryParam()):
+        """
+        流式查询，LLM 生成的回答按到达顺序逐块产出。仅返回上下文、查询失败或命中缓存时一次产出完整文本；
+        不支持流式的 LLM 函数同样一次产出完整回答。回答完整产出后写入 LLM 缓存。
+
+        Args:
+            query (str): 用户查询
+            param (QueryParam): 查询参数，stream 固定为 True
+
+        Yields:
+            str: 回答的文本块
+        """
+        response = await self._aquery_cached(query, replace(param, stream=True))
+        try:
+            if isinstance(response, str) or response is None:
+                yield response
+                return
+            async for chunk in response:
+                yield chunk
+        finally:
+            if hasattr(response, "aclose"):
+                await response.aclose()
+            # 回答产出完毕（或调用方提前停止）后统一落盘一次
+            await self._query_done()
+
+    async def _aquery_mode(self, query: str, param: QueryParam, storages: dict = None):
+        storages = storages or self._query_storages()
+        if param.mode in ("local", "global", "hybrid"):
+            query_func = {
+                "local": local_query,
+                "global": global_query,
+                "hybrid": hybrid_query,
+            }[param.mode]
+            response = await query_func(
                 query,
-                self.chunk_entity_relation_graph,
-                self.entities_vdb,
-                self.relationships_vdb,
-                self.text_chunks,
+                storages["knowledge_graph_inst"],
+                storages["entities_vdb"],
+                storages["relationships_vdb"],
+                storages["text_chunks_db"],
                 param,
-                asdict(self),
+                storages["global_config"],
+                keywords_cache=self.query_keywords_cache,
             )
         elif param.mode == "naive":
+            if param.doc_ids:
+                if self._chunk_doc_ids_backfill is None:
+                    self._chunk_doc_ids_backfill = asyncio.ensure_future(
+                        self._backfill_chunk_doc_ids()
+                    )
+                try:
+                    await asyncio.shield(self._chunk_doc_ids_backfill)
+                except Exception:
+                    # 下一次查询重新补齐
+                    self._chunk_doc_ids_backfill = None
+                    raise
             response = await naive_query(
                 query,
-                self.chunks_vdb,
-                self.text_chunks,
+                storages["chunks_vdb"],
+                storages["text_chunks_db"],
                 param,
-                asdict(self),
+                storages["global_config"],
             )
         else:
             raise ValueError(f"Unknown mode {param.mode}")
-        await self._query_done()
         return response
 
+    async def _backfill_chunk_doc_ids(self):
+        """
+        旧版本写入 chunks_vdb 时没有保存 full_doc_id，按 doc_ids 过滤会漏掉这些文本块。
+        从 text_chunks 读取它们的 full_doc_id 写回向量库的元数据，不重新计算向量。
+        """
+        ids = sorted(self.chunks_vdb.ids_missing_meta("full_doc_id"))
+        if not ids:
+            return
+        logger.warning(
+            f"{len(ids)} chunk vectors have no full_doc_id, backfilling from text_chunks"
+        )
+        chunks = await self.text_chunks.get_by_ids(ids, fields={"full_doc_id"})
+        metas = {
+            id: {"full_doc_id": chunk["full_doc_id"]}
+            for id, chunk in zip(ids, chunks)
+            if chunk and chunk.get("full_doc_id")
+        }
+        await self.chunks_vdb.update_meta(metas)
+        await self.chunks_vdb.index_done_callback()
+        if len(metas) < len(ids):
+            logger.warning(
+                f"{len(ids) - len(metas)} chunk vectors have no full_doc_id in text_chunks, "
+                "queries with doc_ids skip them"
+            )
+
+    def query_keywords_cache_metrics(self) -> dict:
+        """
+        查询关键词缓存的命中数、未命中数、合并的并发请求数、提取失败数、提取耗时与命中率，
+        未开启缓存时返回空字典。
+
+        Returns:
+            dict: 缓存统计
+        """
+        if self.query_keywords_cache is None:
+            return {}
+        return self.query_keywords_cache.metrics()
+
+    def semantic_query_cache_metrics(self) -> dict:
+        """
+        查询语义查询缓存的命中数、未命中数、失效数、条目数、命中率，以及查找耗时与命中节省的时间（秒），
+        未开启缓存时返回空字典。
+
+        Returns:
+            dict: 缓存统计
+        """
+        if self.semantic_query_cache is None:
+            return {}
+        return self.semantic_query_cache.metrics()
+
     async def _query_done(self):
         tasks = []
-        for storage_inst in [self.llm_response_cache]:
+        for storage_inst in [
+            self.llm_response_cache,
+            self.embedding_cache,
+            self.query_keywords_cache,
+            self.semantic_query_cache,
+        ]:
             if storage_inst is None:
                 continue
             tasks.append(cast(StorageNameSpace, storage_inst).index_done_callback())
         await asyncio.gather(*tasks)
 
+    def close(self):
+        loop = always_get_an_event_loop()
+        return loop.run_until_complete(self.aclose())
+
+    async def aclose(self):
+        """
+        保存查询期间的缓存变化，关闭提供 close 的存储与当前事件循环中共享的模型服务客户端，
+        停止切分文档的进程池并关闭插入日志。之后不能再使用该实例。
+        """
+        await self._query_done()
+        if self.embedding_cache is not None:
+            await self.embedding_cache.flush()
+        for storage_inst in [
+            self.full_docs,
+            self.text_chunks,
+            self.llm_response_cache,
+            self.entities_vdb,
+            self.relationships_vdb,
+            self.chunks_vdb,
+            self.chunk_entity_relation_graph,
+        ]:
+            close = getattr(storage_inst, "close", None)
+            if close is not None:
+                await close()
+        await close_provider_clients()
+        self._shutdown_chunking_executor(wait=True)
+        if self.insert_journal is not None:
+            self.insert_journal.close()
+
+    def _shutdown_chunking_executor(self, wait: bool):
+        executor, self._chunking_executor = self._chunking_executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def __del__(self):
+        # 未调用 close 时兜底停止进程池，对象未完成初始化时没有该属性
+        if getattr(self, "_chunking_executor", None) is not None:
+            self._shutdown_chunking_executor(wait=False)
+
     def delete_by_entity(self, entity_name: str):
         loop = always_get_an_event_loop()
         return loop.run_until_complete(self.adelete_by_entity(entity_name))
@@ -442,6 +1263,8 @@ class LightRAG:
             logger.info(
                 f"Entity '{entity_name}' and its relationships have been deleted."
             )
+            if self.semantic_query_cache is not None:
+                self.semantic_query_cache.invalidate(entities=[entity_name])
             await self._delete_by_entity_done()
         except Exception as e:
             logger.error(f"Error while deleting entity '{entity_name}': {e}")
@@ -452,6 +1275,7 @@ class LightRAG:
             self.entities_vdb,
             self.relationships_vdb,
             self.chunk_entity_relation_graph,
+            self.semantic_query_cache,
         ]:
             if storage_inst is None:
                 continue
@@ -1,11 +1,16 @@
 import os
+import asyncio
 import copy
+import importlib.util
+from collections import Counter
 from functools import lru_cache
 import json
 import aioboto3
 import aiohttp
+import httpx
 import numpy as np
 import ollama
+from aiobotocore.config import AioConfig
 
 from openai import (
     AsyncOpenAI,
@@ -13,6 +18,7 @@ from openai import (
     RateLimitError,
     Timeout,
     AsyncAzureOpenAI,
+    DefaultAsyncHttpxClient,
 )
 
 import base64
@@ -24,16 +30,238 @@ from tenacity import (
     wait_exponential,
     retry_if_exception_type,
 )
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import torch
 from pydantic import BaseModel, Field
-from typing import List, Dict, Callable, Any
+from typing import List, Dict, Callable, Any, AsyncIterator, Awaitable, Optional
 from .base import BaseKVStorage
-from .utils import compute_args_hash, wrap_embedding_func_with_attrs, logger
+from .hf_worker import get_hf_embedding_worker, get_hf_generation_worker
+from .utils import (
+    compute_args_hash,
+    get_rate_limiter,
+    rate_limit_async_func_call,
+    wait_for_rate_limit,
+    wrap_embedding_func_with_attrs,
+    logger,
+)
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 
+class ProviderClients:
+    """
+    Registry of pooled provider clients, one per (provider, base_url, api_key).
+
+    Clients keep their HTTP connections alive between calls instead of paying a
+    new TCP/TLS handshake per request. Clients are bound to the event loop that
+    created them, so each running loop gets its own set; clients of closed loops
+    are dropped. Call `close_provider_clients()` before the loop shuts down.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+    ):
+        self.configure(
+            max_connections, max_keepalive_connections, keepalive_expiry, http2
+        )
+        # (loop id, provider, base_url, api_key) -> (loop, client, async close func)
+        self._clients: dict[tuple, tuple] = {}
+
+    def configure(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+    ):
+        """Connection limits for clients created from now on."""
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        # HTTP/2 needs the optional h2 package
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+
+    def httpx_kwargs(self) -> dict:
+        return {
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            "http2": self.http2,
+        }
+
+    async def get(
+        self,
+        provider: str,
+        base_url: Optional[str],
+        api_key: Optional[str],
+        factory: Callable[[], Awaitable[tuple[Any, Callable[[], Awaitable]]]],
+    ) -> Any:
+        """Return the shared client, creating it with `factory` -> (client, aclose)."""
+        loop = asyncio.get_running_loop()
+        for key in [k for k, v in self._clients.items() if v[0].is_closed()]:
+            del self._clients[key]
+        key = (id(loop), provider, base_url, api_key)
+        entry = self._clients.get(key)
+        if entry is None:
+            client, aclose = await factory()
+            # another coroutine may have created the client while we awaited
+            entry = self._clients.setdefault(key, (loop, client, aclose))
+            if entry[1] is not client:
+                await aclose()
+        return entry[1]
+
+    async def aclose(self):
+        """Close the clients of the running event loop."""
+        loop = asyncio.get_running_loop()
+        keys = [k for k, v in self._clients.items() if v[0] is loop]
+        for key in keys:
+            _, _, aclose = self._clients.pop(key)
+            try:
+                await aclose()
+            except Exception as e:
+                logger.warning(f"Failed to close {key[1]} client: {e}")
+
+    def metrics(self) -> dict:
+        """Number of live clients per provider."""
+        counts = Counter(key[1] for key, v in self._clients.items() if not v[0].is_closed())
+        return dict(counts)
+
+
+provider_clients = ProviderClients()
+
+
+def configure_provider_clients(**kwargs):
+    """Set connection limits (max_connections, max_keepalive_connections,
+    keepalive_expiry, http2) of the shared provider clients."""
+    provider_clients.configure(**kwargs)
+
+
+async def close_provider_clients():
+    """Close all shared provider clients created in the running event loop."""
+    await provider_clients.aclose()
+
+
+async def get_openai_async_client(
+    base_url: str = None, api_key: str = None
+) -> AsyncOpenAI:
+    api_key = api_key or os.environ.get("OPENAI_API_KEY")
+
+    async def factory():
+        client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=DefaultAsyncHttpxClient(**provider_clients.httpx_kwargs()),
+        )
+        return client, client.close
+
+    return await provider_clients.get("openai", base_url, api_key, factory)
+
+
+async def get_azure_openai_async_client() -> AsyncAzureOpenAI:
+    endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
+    api_key = os.getenv("AZURE_OPENAI_API_KEY")
+    api_version = os.getenv("AZURE_OPENAI_API_VERSION")
+
+    async def factory():
+        client = AsyncAzureOpenAI(
+            azure_endpoint=endpoint,
+            api_key=api_key,
+            api_version=api_version,
+            http_client=DefaultAsyncHttpxClient(**provider_clients.httpx_kwargs()),
+        )
+        return client, client.close
+
+    return await provider_clients.get(
+        "azure_openai", f"{endpoint}?api-version={api_version}", api_key, factory
+    )
+
+
+async def get_aiohttp_session() -> aiohttp.ClientSession:
+    async def factory():
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=provider_clients.max_connections,
+                keepalive_timeout=provider_clients.keepalive_expiry,
+            )
+        )
+        return session, session.close
+
+    return await provider_clients.get("aiohttp", None, None, factory)
+
+
+async def get_bedrock_runtime_client():
+    region = os.environ.get("AWS_REGION") or os.environ.get("AWS_DEFAULT_REGION")
+    # rotated secrets or session tokens must not reuse a client signed with the old ones
+    credentials = compute_args_hash(
+        os.environ.get("AWS_ACCESS_KEY_ID"),
+        os.environ.get("AWS_SECRET_ACCESS_KEY"),
+        os.environ.get("AWS_SESSION_TOKEN"),
+    )
+
+    async def factory():
+        client_context = aioboto3.Session().client(
+            "bedrock-runtime",
+            config=AioConfig(max_pool_connections=provider_clients.max_connections),
+        )
+        client = await client_context.__aenter__()
+
+        async def aclose():
+            await client_context.__aexit__(None, None, None)
+
+        return client, aclose
+
+    return await provider_clients.get("bedrock", region, credentials, factory)
+
+
+async def get_ollama_async_client(
+    host: str = None, timeout=None, **kwargs
+) -> ollama.AsyncClient:
+    async def factory():
+        client = ollama.AsyncClient(
+            host=host, timeout=timeout, **{**provider_clients.httpx_kwargs(), **kwargs}
+        )
+        return client, client._client.aclose
+
+    return await provider_clients.get(
+        "ollama", host, repr((timeout, sorted(kwargs.items()))), factory
+    )
+
+
+async def _cached_stream(text: str) -> AsyncIterator[str]:
+    """Replay a cached response as a single-chunk stream."""
+    yield text
+
+
+async def _stream_and_cache(
+    chunks: AsyncIterator[str], hashing_kv: BaseKVStorage, args_hash: str, model
+) -> AsyncIterator[str]:
+    """Yield streamed response chunks; once the stream completes, cache the assembled response."""
+    parts = []
+    try:
+        async for chunk in chunks:
+            if chunk:
+                parts.append(chunk)
+                yield chunk
+    finally:
+        # release the underlying HTTP response when the consumer stops early
+        await chunks.aclose()
+    if hashing_kv is not None:
+        await hashing_kv.upsert({args_hash: {"return": "".join(parts), "model": model}})
+
+
+async def _openai_stream_deltas(response) -> AsyncIterator[str]:
+    try:
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        await response.close()
+
+
 @retry(
     stop=stop_after_attempt(5),
     wait=wait_exponential(multiplier=1, min=4, max=20),
@@ -51,21 +279,31 @@ async def openai_complete_if_cache(
     if api_key:
         os.environ["OPENAI_API_KEY"] = api_key
 
-    openai_async_client = (
-        AsyncOpenAI() if base_url is None else AsyncOpenAI(base_url=base_url)
-    )
+    openai_async_client = await get_openai_async_client(base_url, api_key)
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
+    stream = kwargs.pop("stream", False)
     messages = []
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
     messages.extend(history_messages)
     messages.append({"role": "user", "content": prompt})
+    args_hash = None
     if hashing_kv is not None:
         args_hash = compute_args_hash(model, messages)
         if_cache_return = await hashing_kv.get_by_id(args_hash)
         if if_cache_return is not None:
+            if stream:
+                return _cached_stream(if_cache_return["return"])
             return if_cache_return["return"]
 
+    await wait_for_rate_limit()
+    if stream:
+        response = await openai_async_client.chat.completions.create(
+            model=model, messages=messages, stream=True, **kwargs
+        )
+        return _stream_and_cache(
+            _openai_stream_deltas(response), hashing_kv, args_hash, model
+        )
     response = await openai_async_client.chat.completions.create(
         model=model, messages=messages, **kwargs
     )
@@ -98,25 +336,33 @@ async def azure_openai_complete_if_cache(
     if base_url:
         os.environ["AZURE_OPENAI_ENDPOINT"] = base_url
 
-    openai_async_client = AsyncAzureOpenAI(
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    )
+    openai_async_client = await get_azure_openai_async_client()
 
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
+    stream = kwargs.pop("stream", False)
     messages = []
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
     messages.extend(history_messages)
     if prompt is not None:
         messages.append({"role": "user", "content": prompt})
+    args_hash = None
     if hashing_kv is not None:
         args_hash = compute_args_hash(model, messages)
         if_cache_return = await hashing_kv.get_by_id(args_hash)
         if if_cache_return is not None:
+            if stream:
+                return _cached_stream(if_cache_return["return"])
             return if_cache_return["return"]
 
+    await wait_for_rate_limit()
+    if stream:
+        response = await openai_async_client.chat.completions.create(
+            model=model, messages=messages, stream=True, **kwargs
+        )
+        return _stream_and_cache(
+            _openai_stream_deltas(response), hashing_kv, args_hash, model
+        )
     response = await openai_async_client.chat.completions.create(
         model=model, messages=messages, **kwargs
     )
@@ -190,6 +436,8 @@ async def bedrock_complete_if_cache(
             )
 
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
+    # The Converse API call is not streamed, the full response is returned
+    kwargs.pop("stream", None)
     if hashing_kv is not None:
         args_hash = compute_args_hash(model, messages)
         if_cache_return = await hashing_kv.get_by_id(args_hash)
@@ -197,45 +445,37 @@ async def bedrock_complete_if_cache(
             return if_cache_return["return"]
 
     # Call model via Converse API
-    session = aioboto3.Session()
-    async with session.client("bedrock-runtime") as bedrock_async_client:
-        try:
-            response = await bedrock_async_client.converse(**args, **kwargs)
-        except Exception as e:
-            raise BedrockError(e)
+    bedrock_async_client = await get_bedrock_runtime_client()
+    try:
+        await wait_for_rate_limit()
+        response = await bedrock_async_client.converse(**args, **kwargs)
+    except Exception as e:
+        raise BedrockError(e)
 
-        if hashing_kv is not None:
-            await hashing_kv.upsert(
-                {
-                    args_hash: {
-                        "return": response["output"]["message"]["content"][0]["text"],
-                        "model": model,
-                    }
+    if hashing_kv is not None:
+        await hashing_kv.upsert(
+            {
+                args_hash: {
+                    "return": response["output"]["message"]["content"][0]["text"],
+                    "model": model,
                 }
-            )
+            }
+        )
 
-        return response["output"]["message"]["content"][0]["text"]
+    return response["output"]["message"]["content"][0]["text"]
 
 
-@lru_cache(maxsize=1)
 def initialize_hf_model(model_name):
-    hf_tokenizer = AutoTokenizer.from_pretrained(
-        model_name, device_map="auto", trust_remote_code=True
-    )
-    hf_model = AutoModelForCausalLM.from_pretrained(
-        model_name, device_map="auto", trust_remote_code=True
-    )
-    if hf_tokenizer.pad_token is None:
-        hf_tokenizer.pad_token = hf_tokenizer.eos_token
-
-    return hf_model, hf_tokenizer
+    worker = get_hf_generation_worker(model_name)
+    return worker.model, worker.tokenizer
 
 
 async def hf_model_if_cache(
     model, prompt, system_prompt=None, history_messages=[], **kwargs
 ) -> str:
     model_name = model
-    hf_model, hf_tokenizer = initialize_hf_model(model_name)
+    worker = get_hf_generation_worker(model_name)
+    hf_tokenizer = worker.tokenizer
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
     messages = []
     if system_prompt:
@@ -281,15 +521,9 @@ async def hf_model_if_cache(
                     + ">\n"
                 )
 
-    input_ids = hf_tokenizer(
-        input_prompt, return_tensors="pt", padding=True, truncation=True
-    ).to("cuda")
-    inputs = {k: v.to(hf_model.device) for k, v in input_ids.items()}
-    output = hf_model.generate(
-        **input_ids, max_new_tokens=512, num_return_sequences=1, early_stopping=True
-    )
-    response_text = hf_tokenizer.decode(
-        output[0][len(inputs["input_ids"][0]) :], skip_special_tokens=True
+    # generate runs in the worker thread, batched with concurrent prompts
+    response_text = await worker.generate(
+        input_prompt, max_new_tokens=512, num_return_sequences=1, early_stopping=True
     )
     if hashing_kv is not None:
         await hashing_kv.upsert({args_hash: {"return": response_text, "model": model}})
@@ -304,20 +538,38 @@ async def ollama_model_if_cache(
     host = kwargs.pop("host", None)
     timeout = kwargs.pop("timeout", None)
 
-    ollama_client = ollama.AsyncClient(host=host, timeout=timeout)
+    ollama_client = await get_ollama_async_client(host, timeout)
     messages = []
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
 
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
+    stream = kwargs.pop("stream", False)
     messages.extend(history_messages)
     messages.append({"role": "user", "content": prompt})
+    args_hash = None
     if hashing_kv is not None:
         args_hash = compute_args_hash(model, messages)
         if_cache_return = await hashing_kv.get_by_id(args_hash)
         if if_cache_return is not None:
+            if stream:
+                return _cached_stream(if_cache_return["return"])
             return if_cache_return["return"]
 
+    await wait_for_rate_limit()
+    if stream:
+        response = await ollama_client.chat(
+            model=model, messages=messages, stream=True, **kwargs
+        )
+
+        async def deltas():
+            try:
+                async for part in response:
+                    yield part["message"]["content"]
+            finally:
+                await response.aclose()
+
+        return _stream_and_cache(deltas(), hashing_kv, args_hash, model)
     response = await ollama_client.chat(model=model, messages=messages, **kwargs)
 
     result = response["message"]["content"]
@@ -397,6 +649,7 @@ async def lmdeploy_model_if_cache(
         raise ImportError("Please install lmdeploy before intialize lmdeploy backend.")
 
     kwargs.pop("response_format", None)
+    stream = kwargs.pop("stream", False)
     max_new_tokens = kwargs.pop("max_tokens", 512)
     tp = kwargs.pop("tp", 1)
     skip_special_tokens = kwargs.pop("skip_special_tokens", True)
@@ -430,10 +683,13 @@ async def lmdeploy_model_if_cache(
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
     messages.extend(history_messages)
     messages.append({"role": "user", "content": prompt})
+    args_hash = None
     if hashing_kv is not None:
         args_hash = compute_args_hash(model, messages)
         if_cache_return = await hashing_kv.get_by_id(args_hash)
         if if_cache_return is not None:
+            if stream:
+                return _cached_stream(if_cache_return["return"])
             return if_cache_return["return"]
 
     gen_config = GenerationConfig(
@@ -442,15 +698,21 @@ async def lmdeploy_model_if_cache(
         **gen_params,
     )
 
+    async def deltas():
+        async for res in lmdeploy_pipe.generate(
+            messages,
+            gen_config=gen_config,
+            do_preprocess=do_preprocess,
+            stream_response=stream,
+            session_id=1,
+        ):
+            yield res.response
+
+    if stream:
+        return _stream_and_cache(deltas(), hashing_kv, args_hash, model)
     response = ""
-    async for res in lmdeploy_pipe.generate(
-        messages,
-        gen_config=gen_config,
-        do_preprocess=do_preprocess,
-        stream_response=False,
-        session_id=1,
-    ):
-        response += res.response
+    async for delta in deltas():
+        response += delta
 
     if hashing_kv is not None:
         await hashing_kv.upsert({args_hash: {"return": response, "model": model}})
@@ -546,9 +808,8 @@ async def openai_embedding(
     if api_key:
         os.environ["OPENAI_API_KEY"] = api_key
 
-    openai_async_client = (
-        AsyncOpenAI() if base_url is None else AsyncOpenAI(base_url=base_url)
-    )
+    openai_async_client = await get_openai_async_client(base_url, api_key)
+    await wait_for_rate_limit()
     response = await openai_async_client.embeddings.create(
         model=model, input=texts, encoding_format="float"
     )
@@ -572,12 +833,9 @@ async def azure_openai_embedding(
     if base_url:
         os.environ["AZURE_OPENAI_ENDPOINT"] = base_url
 
-    openai_async_client = AsyncAzureOpenAI(
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    )
+    openai_async_client = await get_azure_openai_async_client()
 
+    await wait_for_rate_limit()
     response = await openai_async_client.embeddings.create(
         model=model, input=texts, encoding_format="float"
     )
@@ -606,12 +864,13 @@ async def siliconcloud_embedding(
     payload = {"model": model, "input": truncate_texts, "encoding_format": "base64"}
 
     base64_strings = []
-    async with aiohttp.ClientSession() as session:
-        async with session.post(base_url, headers=headers, json=payload) as response:
-            content = await response.json()
-            if "code" in content:
-                raise ValueError(content)
-            base64_strings = [item["embedding"] for item in content["data"]]
+    await wait_for_rate_limit()
+    session = await get_aiohttp_session()
+    async with session.post(base_url, headers=headers, json=payload) as response:
+        content = await response.json()
+        if "code" in content:
+            raise ValueError(content)
+        base64_strings = [item["embedding"] for item in content["data"]]
 
     embeddings = []
     for string in base64_strings:
@@ -634,6 +893,7 @@ async def bedrock_embedding(
     aws_access_key_id=None,
     aws_secret_access_key=None,
     aws_session_token=None,
+    max_concurrency: int = 8,
 ) -> np.ndarray:
     os.environ["AWS_ACCESS_KEY_ID"] = os.environ.get(
         "AWS_ACCESS_KEY_ID", aws_access_key_id
@@ -645,77 +905,98 @@ async def bedrock_embedding(
         "AWS_SESSION_TOKEN", aws_session_token
     )
 
-    session = aioboto3.Session()
-    async with session.client("bedrock-runtime") as bedrock_async_client:
-        if (model_provider := model.split(".")[0]) == "amazon":
-            embed_texts = []
-            for text in texts:
-                if "v2" in model:
-                    body = json.dumps(
-                        {
-                            "inputText": text,
-                            # 'dimensions': embedding_dim,
-                            "embeddingTypes": ["float"],
-                        }
-                    )
-                elif "v1" in model:
-                    body = json.dumps({"inputText": text})
-                else:
-                    raise ValueError(f"Model {model} is not supported!")
-
-                response = await bedrock_async_client.invoke_model(
-                    modelId=model,
-                    body=body,
-                    accept="application/json",
-                    contentType="application/json",
+    if (model_provider := model.split(".")[0]) == "amazon":
+        if "v2" in model:
+            bodies = [
+                json.dumps(
+                    {
+                        "inputText": text,
+                        # 'dimensions': embedding_dim,
+                        "embeddingTypes": ["float"],
+                    }
                 )
-
-                response_body = await response.get("body").json()
-
-                embed_texts.append(response_body["embedding"])
-        elif model_provider == "cohere":
-            body = json.dumps(
-                {"texts": texts, "input_type": "search_document", "truncate": "NONE"}
+                for text in texts
+            ]
+        elif "v1" in model:
+            bodies = [json.dumps({"inputText": text}) for text in texts]
+        else:
+            raise ValueError(f"Model {model} is not supported!")
+    elif model_provider == "cohere":
+        # Cohere 模型一次请求最多 96 条文本
+        bodies = [
+            json.dumps(
+                {
+                    "texts": texts[i : i + 96],
+                    "input_type": "search_document",
+                    "truncate": "NONE",
+                }
             )
+            for i in range(0, len(texts), 96)
+        ]
+    else:
+        raise ValueError(f"Model provider '{model_provider}' is not supported!")
+
+    bedrock_async_client = await get_bedrock_runtime_client()
+    semaphore = asyncio.Semaphore(max_concurrency)
 
+    async def invoke(body: str) -> dict:
+        async with semaphore:
             response = await bedrock_async_client.invoke_model(
-                model=model,
+                modelId=model,
                 body=body,
                 accept="application/json",
                 contentType="application/json",
             )
+            return json.loads(await response["body"].read())
 
-            response_body = json.loads(response.get("body").read())
-
-            embed_texts = response_body["embeddings"]
-        else:
-            raise ValueError(f"Model provider '{model_provider}' is not supported!")
-
-        return np.array(embed_texts)
+    # 一次调用按一次请求计入限速，amazon 模型逐条请求时同样只计一次
+    await wait_for_rate_limit()
+    response_bodies = await asyncio.gather(*[invoke(body) for body in bodies])
+    if model_provider == "amazon":
+        embed_texts = [response_body["embedding"] for response_body in response_bodies]
+    else:
+        embed_texts = [
+            embedding
+            for response_body in response_bodies
+            for embedding in response_body["embeddings"]
+        ]
+    return np.array(embed_texts)
 
 
 async def hf_embedding(texts: list[str], tokenizer, embed_model) -> np.ndarray:
-    device = next(embed_model.parameters()).device
-    input_ids = tokenizer(
-        texts, return_tensors="pt", padding=True, truncation=True
-    ).input_ids.to(device)
-    with torch.no_grad():
-        outputs = embed_model(input_ids)
-        embeddings = outputs.last_hidden_state.mean(dim=1)
-    if embeddings.dtype == torch.bfloat16:
-        return embeddings.detach().to(torch.float32).cpu().numpy()
-    else:
-        return embeddings.detach().cpu().numpy()
-
+    """
+    Embed texts with a local HuggingFace model in its worker thread. Concurrent calls
+    are batched by token length; embeddings are the attention-masked mean of the last
+    hidden state, so padding never changes a text's vector.
+    """
+    worker = get_hf_embedding_worker(tokenizer, embed_model)
+    return await worker.embed(texts)
 
-async def ollama_embedding(texts: list[str], embed_model, **kwargs) -> np.ndarray:
-    embed_text = []
-    ollama_client = ollama.Client(**kwargs)
-    for text in texts:
-        data = ollama_client.embed(model=embed_model, input=text)
-        embed_text.append(data["embeddings"][0])
 
-    return np.array(embed_text)
+async def ollama_embedding(
+    texts: list[str], embed_model, batch_size: int = 64, **kwargs
+) -> np.ndarray:
+    """
+    Embed texts with Ollama's /api/embed, sending up to batch_size texts per request
+    through the shared async client. kwargs are client options (host, timeout, headers).
+    """
+    host = kwargs.pop("host", None)
+    timeout = kwargs.pop("timeout", None)
+    ollama_client = await get_ollama_async_client(host, timeout, **kwargs)
+
+    async def embed_batch(batch: list[str]) -> list[list[float]]:
+        data = await ollama_client.embed(model=embed_model, input=batch)
+        return data["embeddings"]
+
+    # 一次调用按一次请求计入限速
+    await wait_for_rate_limit()
+    batches = await asyncio.gather(
+        *[
+            embed_batch(texts[i : i + batch_size])
+            for i in range(0, len(texts), batch_size)
+        ]
+    )
+    return np.array([embedding for batch in batches for embedding in batch])
 
 
 class Model(BaseModel):
@@ -733,16 +1014,26 @@ class Model(BaseModel):
 
     In this example, 'openai_complete_if_cache' is the callable function that generates the response from the OpenAI model.
     The 'kwargs' dictionary contains the model name and API key to be passed to the function.
+    Set 'rpm' and/or 'tpm' to pace requests to this model under the provider's rate limits.
+    Calls made with stream=True are forwarded as is and return the model's async iterator of text chunks.
     """
 
     gen_func: Callable[[Any], str] = Field(
         ...,
-        description="A function that generates the response from the llm. The response must be a string",
+        description="A function that generates the response from the llm. The response must be a string, or an async iterator of text chunks when called with stream=True",
     )
     kwargs: Dict[str, Any] = Field(
         ...,
         description="The arguments to pass to the callable function. Eg. the api key, model name, etc",
     )
+    rpm: Optional[int] = Field(
+        None,
+        description="Requests per minute allowed for this model/endpoint. None means unlimited",
+    )
+    tpm: Optional[int] = Field(
+        None,
+        description="Tokens per minute allowed for this model/endpoint. None means unlimited",
+    )
 
     class Config:
         arbitrary_types_allowed = True
@@ -776,11 +1067,33 @@ class MultiModel:
     def __init__(self, models: List[Model]):
         self._models = models
         self._current_model = 0
+        self._gen_funcs = [self._rate_limited_gen_func(model) for model in models]
+
+    @staticmethod
+    def _rate_limited_gen_func(model: Model) -> Callable:
+        if not (model.rpm or model.tpm):
+            return model.gen_func
+        # 同一函数、端点、模型与 api key 共用一个限速器
+        key = "llm:" + compute_args_hash(
+            getattr(model.gen_func, "__name__", repr(model.gen_func)),
+            model.kwargs.get("base_url"),
+            model.kwargs.get("model"),
+            model.kwargs.get("api_key"),
+        )
+        limiter = get_rate_limiter(key, rpm=model.rpm, tpm=model.tpm)
+        return rate_limit_async_func_call(limiter, kind="llm")(model.gen_func)
 
     def _next_model(self):
         self._current_model = (self._current_model + 1) % len(self._models)
         return self._models[self._current_model]
 
+    def rate_limiter_metrics(self) -> List[Dict[str, Any]]:
+        """Achieved RPM/TPM against the configured limits, one entry per model."""
+        return [
+            func.rate_limiter.metrics() if hasattr(func, "rate_limiter") else None
+            for func in self._gen_funcs
+        ]
+
     async def llm_model_func(
         self, prompt, system_prompt=None, history_messages=[], **kwargs
     ) -> str:
@@ -794,7 +1107,7 @@ class MultiModel:
             **next_model.kwargs,
         )
 
-        return await next_model.gen_func(**args)
+        return await self._gen_funcs[self._current_model](**args)
 
 
 if __name__ == "__main__":
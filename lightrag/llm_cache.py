@@ -0,0 +1,337 @@
+"""
+分段追加写入的 LLM 响应缓存。
+
+缓存记录追加写入 llm_cache_{namespace}/ 目录下的段文件 segment-{编号}.log，每条记录为
+
+    key 长度 (uint32) | value 长度 (uint32，删除标记为 0xFFFFFFFF) | 写入时间 (float64) | key | value (JSON)
+
+内存中只保留 key 到记录位置的索引，value 在读取时按位置从段文件中读出。落盘只写入新增的记录，
+与缓存大小无关。缓存总大小超过 max_bytes 时按最近最少使用淘汰，设置 ttl 时过期的记录视为未命中；
+被淘汰的记录追加删除标记。已封存的段中失效记录占比过高时，后台压缩把仍有效的记录复制到当前段后删除旧段。
+
+首次启动时若存在旧的 kv_store_{namespace}.json，其内容会被导入段文件。
+"""
+
+import asyncio
+import json
+import os
+import struct
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Union
+
+from .base import BaseKVStorage
+from .utils import load_json, logger
+
+_HEADER = struct.Struct("<IId")
+_TOMBSTONE = 0xFFFFFFFF
+
+
+@dataclass
+class SegmentedLLMCacheStorage(BaseKVStorage):
+    """
+    LLM 响应缓存存储，接口与 JsonKVStorage 相同，已存在的 key 不会被覆盖。
+    """
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._dir = os.path.join(working_dir, f"llm_cache_{self.namespace}")
+        os.makedirs(self._dir, exist_ok=True)
+        self.max_bytes = self.global_config.get("llm_cache_max_bytes") or float("inf")
+        self.ttl = self.global_config.get("llm_cache_ttl")
+        self.segment_bytes = self.global_config.get(
+            "llm_cache_segment_bytes", 64 * 1024 * 1024
+        )
+        # 已封存段中失效记录占比超过该值时压缩
+        self.compaction_threshold = 0.5
+
+        # key -> [段编号, value 偏移, value 长度, 写入时间]，按最近使用排序
+        self._index: OrderedDict[str, list] = OrderedDict()
+        # 段编号 -> [总字节数, 有效字节数]
+        self._segments: dict[int, list[int]] = {}
+        self._live_bytes = 0
+        self._readers: dict[int, object] = {}
+        self._writer = None
+        self._active = 0
+        self._compaction_task: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+        self._load()
+        if not self._segments:
+            self._migrate_json()
+        logger.info(
+            f"Load LLM cache {self.namespace} with {len(self._index)} data "
+            f"in {len(self._segments)} segments"
+        )
+
+    # ---------------------------------------------------------------- 段文件
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self._dir, f"segment-{segment:06d}.log")
+
+    def _load(self):
+        segments = sorted(
+            int(name[8:14])
+            for name in os.listdir(self._dir)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+        for segment in segments:
+            self._segments[segment] = [0, 0]
+            self._scan_segment(segment)
+        self._active = segments[-1] if segments else 0
+        # 启动时按写入时间近似最近使用顺序
+        self._index = OrderedDict(sorted(self._index.items(), key=lambda kv: kv[1][3]))
+        self._evict()
+
+    def _scan_segment(self, segment: int):
+        """读取段中所有记录的头部，跳过 value；末尾不完整的记录被截断"""
+        path = self._segment_path(segment)
+        size = os.path.getsize(path)
+        offset = 0
+        with open(path, "rb") as f:
+            while offset + _HEADER.size <= size:
+                f.seek(offset)
+                key_len, value_len, written = _HEADER.unpack(f.read(_HEADER.size))
+                data_len = key_len + (0 if value_len == _TOMBSTONE else value_len)
+                end = offset + _HEADER.size + data_len
+                if end > size:
+                    break
+                key = f.read(key_len).decode("utf-8")
+                self._drop_entry(key)
+                if value_len != _TOMBSTONE:
+                    entry = [segment, offset + _HEADER.size + key_len, value_len, written]
+                    self._add_entry(key, entry)
+                self._segments[segment][0] += end - offset
+                offset = end
+        if offset < size:
+            logger.warning(f"Truncating incomplete LLM cache record in {path}")
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+
+    def _segment_tombstones(self, segment: int) -> list[str]:
+        keys = []
+        reader = self._reader(segment)
+        size = self._segments[segment][0]
+        offset = 0
+        while offset + _HEADER.size <= size:
+            reader.seek(offset)
+            key_len, value_len, _ = _HEADER.unpack(reader.read(_HEADER.size))
+            if value_len == _TOMBSTONE:
+                keys.append(reader.read(key_len).decode("utf-8"))
+                value_len = 0
+            offset += _HEADER.size + key_len + value_len
+        return keys
+
+    def _migrate_json(self):
+        json_file = os.path.join(
+            self.global_config["working_dir"], f"kv_store_{self.namespace}.json"
+        )
+        data = load_json(json_file)
+        if not data:
+            return
+        logger.info(f"Migrating {len(data)} LLM cache entries from {json_file}")
+        for key, value in data.items():
+            self._append(key, value)
+        self._writer.flush()
+
+    def _open_writer(self):
+        if self._writer is None:
+            self._writer = open(self._segment_path(self._active), "ab")
+            self._segments.setdefault(self._active, [0, 0])
+
+    def _reader(self, segment: int):
+        reader = self._readers.get(segment)
+        if reader is None:
+            reader = self._readers[segment] = open(self._segment_path(segment), "rb")
+        return reader
+
+    def _record_size(self, key: str, entry: list) -> int:
+        return _HEADER.size + len(key.encode("utf-8")) + entry[2]
+
+    def _add_entry(self, key: str, entry: list):
+        self._index[key] = entry
+        size = self._record_size(key, entry)
+        self._segments[entry[0]][1] += size
+        self._live_bytes += size
+
+    def _drop_entry(self, key: str) -> Optional[list]:
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            size = self._record_size(key, entry)
+            self._segments[entry[0]][1] -= size
+            self._live_bytes -= size
+        return entry
+
+    def _write_record(self, key: bytes, value: Optional[bytes], written: float) -> int:
+        """追加一条记录，返回 value 在当前段中的偏移"""
+        self._open_writer()
+        if self._segments[self._active][0] >= self.segment_bytes:
+            # 封存当前段，切换到新段
+            self._writer.close()
+            self._writer = None
+            self._active += 1
+            self._open_writer()
+        value_len = _TOMBSTONE if value is None else len(value)
+        record = _HEADER.pack(len(key), value_len, written) + key + (value or b"")
+        offset = self._segments[self._active][0]
+        self._writer.write(record)
+        self._segments[self._active][0] += len(record)
+        return offset + _HEADER.size + len(key)
+
+    def _append(self, key: str, value: dict, written: float = None):
+        written = time.time() if written is None else written
+        value_bytes = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        key_bytes = key.encode("utf-8")
+        self._drop_entry(key)
+        offset = self._write_record(key_bytes, value_bytes, written)
+        self._add_entry(key, [self._active, offset, len(value_bytes), written])
+
+    def _read(self, entry: list) -> dict:
+        segment, offset, length, _ = entry
+        if segment == self._active and self._writer is not None:
+            # 当前段中尚未落盘的写入对读取可见
+            self._writer.flush()
+        reader = self._reader(segment)
+        reader.seek(offset)
+        return json.loads(reader.read(length).decode("utf-8"))
+
+    def _evict(self):
+        while self._live_bytes > self.max_bytes and self._index:
+            key = next(iter(self._index))
+            self._remove(key)
+            self.stats["evictions"] += 1
+
+    def _remove(self, key: str):
+        if self._drop_entry(key) is not None:
+            self._write_record(key.encode("utf-8"), None, time.time())
+
+    def _lookup(self, key: str) -> Optional[list]:
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        if self.ttl is not None and time.time() - entry[3] > self.ttl:
+            self._remove(key)
+            self.stats["expired"] += 1
+            return None
+        self._index.move_to_end(key)
+        return entry
+
+    # ---------------------------------------------------------------- 压缩
+
+    def _compaction_candidates(self) -> list[int]:
+        return [
+            segment
+            for segment, (total, live) in self._segments.items()
+            if segment != self._active
+            and total > 0
+            and 1 - live / total >= self.compaction_threshold
+        ]
+
+    async def _compact(self):
+        """把待压缩段中仍有效的记录复制到当前段，然后删除旧段"""
+        for segment in self._compaction_candidates():
+            keys = [key for key, entry in self._index.items() if entry[0] == segment]
+            for i, key in enumerate(keys):
+                entry = self._index.get(key)
+                # 复制期间被覆盖、删除的记录跳过
+                if entry is None or entry[0] != segment:
+                    continue
+                reader = self._reader(segment)
+                reader.seek(entry[1])
+                value_bytes = reader.read(entry[2])
+                key_bytes = key.encode("utf-8")
+                self._segments[segment][1] -= self._record_size(key, entry)
+                entry[1] = self._write_record(key_bytes, value_bytes, entry[3])
+                entry[0] = self._active
+                self._segments[self._active][1] += self._record_size(key, entry)
+                if i % 256 == 255:
+                    # 分批让出事件循环
+                    await asyncio.sleep(0)
+            # 更早的段可能还有被删除 key 的旧记录，删除标记需要保留到新段中
+            if any(other < segment for other in self._segments):
+                for key in self._segment_tombstones(segment):
+                    if key not in self._index:
+                        self._write_record(key.encode("utf-8"), None, time.time())
+            # 段中没有有效记录与删除标记时不会打开写入文件（例如重启后直接压缩）
+            if self._writer is not None:
+                self._writer.flush()
+            reader = self._readers.pop(segment, None)
+            if reader is not None:
+                reader.close()
+            del self._segments[segment]
+            os.remove(self._segment_path(segment))
+            logger.info(f"Compacted LLM cache segment {segment}")
+
+    def _schedule_compaction(self):
+        if self._compaction_task is not None and not self._compaction_task.done():
+            return
+        if not self._compaction_candidates():
+            return
+        self._compaction_task = asyncio.ensure_future(self._compact())
+
+    # ---------------------------------------------------------------- KV 接口
+
+    async def all_keys(self) -> list[str]:
+        return list(self._index.keys())
+
+    async def index_done_callback(self):
+        if self._writer is not None:
+            self._writer.flush()
+        self._schedule_compaction()
+
+    async def query_done_callback(self):
+        await self.index_done_callback()
+
+    async def get_by_id(self, id: str) -> Union[dict, None]:
+        entry = self._lookup(id)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return self._read(entry)
+
+    async def get_by_ids(self, ids, fields=None):
+        results = []
+        for id in ids:
+            value = await self.get_by_id(id)
+            if value is not None and fields is not None:
+                value = {k: v for k, v in value.items() if k in fields}
+            results.append(value)
+        return results
+
+    async def filter_keys(self, data: list[str]) -> set[str]:
+        return set([s for s in data if self._lookup(s) is None])
+
+    async def upsert(self, data: dict[str, dict]):
+        left_data = {k: v for k, v in data.items() if self._lookup(k) is None}
+        for key, value in left_data.items():
+            self._append(key, value)
+        self._evict()
+        return left_data
+
+    async def drop(self):
+        if self._compaction_task is not None:
+            self._compaction_task.cancel()
+        for reader in self._readers.values():
+            reader.close()
+        self._readers = {}
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        for segment in self._segments:
+            os.remove(self._segment_path(segment))
+        self._index = OrderedDict()
+        self._segments = {}
+        self._live_bytes = 0
+        self._active = 0
+
+    def metrics(self) -> dict:
+        total = sum(total for total, _ in self._segments.values())
+        return {
+            **self.stats,
+            "entries": len(self._index),
+            "segments": len(self._segments),
+            "live_bytes": self._live_bytes,
+            "file_bytes": total,
+        }
@@ -0,0 +1,81 @@
+"""
+向量存储的元数据倒排索引。
+
+向量存储为 meta_fields 中的每个字段维护 字段值 -> id 集合 的倒排索引：按实体名删除实体、
+按 src_id/tgt_id 删除关系、按 full_doc_id 限定检索范围时只访问匹配的记录，不再扫描全部数据。
+索引只在内存中，存储加载时由已保存的元数据重建。
+"""
+
+from collections import defaultdict
+from typing import Iterable, Union
+
+# 查询时的元数据过滤条件：字段 -> 字段值或字段值集合，字段之间为且，同一字段的多个值之间为或
+MetadataFilters = dict[str, Union[str, Iterable[str]]]
+
+
+class MetadataIndex:
+    """
+    meta_fields 的倒排索引，值为 None 或不可哈希的字段不建索引。
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        self.fields = set(fields)
+        self._index: dict[str, dict] = {name: defaultdict(set) for name in self.fields}
+        # id -> 已建索引的 (字段, 值)，删除时使用
+        self._entries: dict[str, tuple] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, id: str, meta: dict):
+        self.remove(id)
+        entries = []
+        for name in self.fields:
+            value = meta.get(name)
+            if value is None or isinstance(value, (list, dict, set)):
+                continue
+            self._index[name][value].add(id)
+            entries.append((name, value))
+        self._entries[id] = tuple(entries)
+
+    def remove(self, id: str):
+        for name, value in self._entries.pop(id, ()):
+            ids = self._index[name][value]
+            ids.discard(id)
+            if not ids:
+                del self._index[name][value]
+
+    def lookup(self, name: str, value) -> set[str]:
+        """字段 name 等于 value 的 id"""
+        self._check_field(name)
+        return set(self._index[name].get(value, ()))
+
+    def missing(self, name: str) -> set[str]:
+        """字段 name 没有建索引（缺失、为 None 或不可哈希）的 id"""
+        self._check_field(name)
+        return {
+            id
+            for id, entries in self._entries.items()
+            if all(field != name for field, _ in entries)
+        }
+
+    def match(self, filters: MetadataFilters) -> set[str]:
+        """满足全部过滤条件的 id"""
+        result = None
+        for name, values in filters.items():
+            self._check_field(name)
+            if isinstance(values, str):
+                values = [values]
+            ids = set()
+            for value in values:
+                ids.update(self._index[name].get(value, ()))
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+        return set(self._entries) if result is None else result
+
+    def _check_field(self, name: str):
+        if name not in self.fields:
+            raise ValueError(
+                f"Field {name} is not indexed, indexed fields: {sorted(self.fields)}"
+            )
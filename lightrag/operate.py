@@ -1,10 +1,14 @@
 import asyncio
 import json
 import re
-from typing import Any, Generator, Optional, Union
+import unicodedata
+from typing import Any, Generator, Iterable, Optional, Union
 from collections import Counter, defaultdict
+from functools import partial
 import warnings
 
+import numpy as np
+
 from lightrag.prompt_zh import PROMPTS_ZH
 from .utils import (
     logger,
@@ -12,13 +16,18 @@ from .utils import (
     compute_mdhash_id,
     decode_tokens_by_tiktoken,
     encode_string_by_tiktoken,
+    encode_string_with_offsets,
     is_float_regex,
     list_of_list_to_csv,
     pack_user_ass_to_openai_messages,
     split_string_by_multi_markers,
+    tokenizer_split_size,
     truncate_list_by_token_size,
     process_combine_contexts,
     locate_json_string_body_from_string,
+    priority_scope,
+    record_graph_access,
+    PRIORITY_SUMMARY,
 )
 from .base import (
     BaseGraphStorage,
@@ -29,6 +38,9 @@ from .base import (
     RelationshipDict,
     QueryParam,
 )
+from .dedup import NearDuplicateIndex
+from .journal import InsertJournal
+from .keyword_cache import QueryKeywordCache
 from .prompt_zh import GRAPH_FIELD_SEP, PROMPTS_ZH
 
 NOW_PROMPTS = PROMPTS_ZH
@@ -37,28 +49,273 @@ NOW_PROMPTS = PROMPTS_ZH
 def chunking_by_token_size(
     content: str, overlap_token_size=128, max_token_size=1024, tiktoken_model="gpt-4o"
 ) -> Generator[dict[str, Any], Any, None]:
-    tokens = encode_string_by_tiktoken(content, model_name=tiktoken_model)
-    # results = []
+    """
+    按 token 数切分文本，相邻文本块之间保留 overlap_token_size 个 token 的重叠。
+
+    文档只编码一次，并将每个 token 边界映射回字符偏移，文本块直接对原文切片，
+    不再对每个窗口重新解码。分词器不支持偏移映射时退回逐窗口解码。
+
+    Args:
+        content (str): 文档内容
+        overlap_token_size (int): 相邻文本块重叠的 token 数
+        max_token_size (int): 每个文本块的最大 token 数
+        tiktoken_model (str): 分词模型名称
+
+    Returns:
+        Generator[dict[str, Any], Any, None]: 文本块生成器
+    """
+    tokens, offsets, content = encode_string_with_offsets(
+        content, model_name=tiktoken_model
+    )
     for index, start in enumerate(
         range(0, len(tokens), max_token_size - overlap_token_size)
     ):
-        chunk_content = decode_tokens_by_tiktoken(
-            tokens[start : start + max_token_size], model_name=tiktoken_model
-        )
-        
+        end = min(start + max_token_size, len(tokens))
+        if offsets is None:
+            chunk_content = decode_tokens_by_tiktoken(
+                tokens[start:end], model_name=tiktoken_model
+            )
+        else:
+            chunk_content = content[offsets[start] : offsets[end]]
+
         yield {
-            "tokens": min(max_token_size, len(tokens) - start),
+            "tokens": end - start,
             "content": chunk_content.strip(),
             "chunk_order_index": index,
         }
-    #     results.append(
-    #         {
-    #             "tokens": min(max_token_size, len(tokens) - start),
-    #             "content": chunk_content.strip(),
-    #             "chunk_order_index": index,
-    #         }
-    #     )
-    # return results
+
+
+def chunking_document(
+    doc_key: str,
+    content: str,
+    overlap_token_size=128,
+    max_token_size=1024,
+    tiktoken_model="gpt-4o",
+) -> dict[str, TextChunkSchema]:
+    """
+    切分单个文档，返回以 chunk- 前缀 md5 为键的文本块字典。
+
+    函数定义在模块顶层且只依赖可序列化的参数，可以直接提交到进程池中执行。
+
+    Args:
+        doc_key (str): 文档 id
+        content (str): 文档内容
+        overlap_token_size (int): 相邻文本块重叠的 token 数
+        max_token_size (int): 每个文本块的最大 token 数
+        tiktoken_model (str): 分词模型名称
+
+    Returns:
+        dict[str, TextChunkSchema]: 文本块字典
+    """
+    return {
+        compute_mdhash_id(dp["content"], prefix="chunk-"): {
+            **dp,
+            "full_doc_id": doc_key,
+        }
+        for dp in chunking_by_token_size(
+            content,
+            overlap_token_size=overlap_token_size,
+            max_token_size=max_token_size,
+            tiktoken_model=tiktoken_model,
+        )
+    }
+
+
+def _find_stream_cut(text: str, force: bool = False) -> int:
+    """
+    在 text 中寻找一个分词边界，使边界两侧分开编码与整体编码的结果相同。
+
+    换行之后紧跟字母或数字的位置是 tiktoken 预分词的天然边界；
+    force 为 True 且找不到这样的位置时，退而在空格后紧跟字母处或文本末尾切分。
+
+    Returns:
+        int: 切分位置，0 表示暂不切分
+    """
+    pos = len(text) - 1
+    while (pos := text.rfind("\n", 0, pos)) >= 0:
+        if text[pos + 1].isalnum():
+            return pos + 1
+    if not force:
+        return 0
+    pos = len(text) - 1
+    while (pos := text.rfind(" ", 1, pos)) >= 0:
+        if text[pos - 1].isalnum() and text[pos + 1].isalpha():
+            return pos
+    return len(text)
+
+
+def _tiktoken_segments(
+    content_stream: Iterable[str], min_segment_chars: int, max_pending_chars: int
+) -> Generator[str, None, None]:
+    """按 _find_stream_cut 找到的预分词边界把输入切成分段，分段大小约为 min_segment_chars"""
+    pending = ""
+    for piece in content_stream:
+        pending += piece
+        if len(pending) < min_segment_chars:
+            continue
+        cut = _find_stream_cut(pending, force=len(pending) >= max_pending_chars)
+        if cut:
+            yield pending[:cut]
+            pending = pending[cut:]
+    if pending:
+        yield pending
+
+
+def _nfc_stream(content_stream: Iterable[str]) -> Generator[str, None, None]:
+    """
+    流式 NFC 规范化。只在前后两个字符都不是组合字符、且分开规范化与一起规范化结果相同的位置切开，
+    输出拼接起来等于对完整输入做 NFC 规范化。
+    """
+    pending = ""
+    for piece in content_stream:
+        pending += piece
+        for cut in range(len(pending) - 1, max(len(pending) - 64, 0), -1):
+            left, right = pending[cut - 1], pending[cut]
+            if (
+                not unicodedata.combining(left)
+                and not unicodedata.combining(right)
+                and unicodedata.normalize("NFC", left + right)
+                == unicodedata.normalize("NFC", left) + unicodedata.normalize("NFC", right)
+            ):
+                yield unicodedata.normalize("NFC", pending[:cut])
+                pending = pending[cut:]
+                break
+    if pending:
+        yield unicodedata.normalize("NFC", pending)
+
+
+def _split_text_segments(
+    content_stream: Iterable[str], split_size: int
+) -> Generator[str, None, None]:
+    """
+    流式复现 dashscope QwenTokenizer._split_text：每行（除第一行外带上开头的换行）作为一段，
+    超过 split_size 的行按 split_size 截开，再按顺序贪心合并为不超过 split_size 字符的分段。
+    QwenTokenizer 对长文本逐个分段编码，按同样的分段编码才能得到与整体编码相同的 token。
+    """
+    group: list[str] = []
+    group_len = 0
+    line = ""  # 当前行尚未加入分组的部分
+
+    def add(part: str):
+        nonlocal group, group_len
+        if group_len + len(part) <= split_size:
+            group.append(part)
+            group_len += len(part)
+            return None
+        done = "".join(group)
+        group, group_len = [part], len(part)
+        return done
+
+    for text in content_stream:
+        # 换行符属于下一行的开头
+        for n, piece in enumerate(text.split("\n")):
+            if n > 0:
+                # 上一行已完整
+                if line:
+                    done = add(line)
+                    if done:
+                        yield done
+                line = "\n"
+            line += piece
+            # 超长的行：完整的 split_size 字符片段可以提前加入分组
+            while len(line) > split_size:
+                done = add(line[:split_size])
+                if done:
+                    yield done
+                line = line[split_size:]
+    if line:
+        done = add(line)
+        if done:
+            yield done
+    if group:
+        yield "".join(group)
+
+
+def chunking_by_token_size_stream(
+    content_stream: Iterable[str],
+    overlap_token_size=128,
+    max_token_size=1024,
+    tiktoken_model="gpt-4o",
+    min_segment_chars: int = 1 << 16,
+    max_pending_chars: int = 1 << 20,
+) -> Generator[dict[str, Any], Any, None]:
+    """
+    流式切分文本，内存占用只与窗口大小和单个输入片段的大小相关，与文档大小无关。
+
+    content_stream 可以是任意字符串迭代器，例如 open(path, encoding="utf-8")
+    按行读取的文件对象。结果与 chunking_by_token_size 一致：
+
+    - tiktoken：输入在预分词边界（换行后紧跟字母或数字）处分段编码。只有缓冲超过
+      max_pending_chars 仍找不到边界时（如没有换行的超长中文段落）才会强制切分，
+      此时边界附近的分词可能略有不同。
+    - dashscope 的 Qwen 分词器：长文本本身就按行合并为不超过 tokenizer_split_size 字符的分段
+      分别编码，这里按完全相同的分段编码，不受上述限制；min_segment_chars 与 max_pending_chars 不起作用。
+
+    Args:
+        content_stream (Iterable[str]): 文档内容片段
+        overlap_token_size (int): 相邻文本块重叠的 token 数
+        max_token_size (int): 每个文本块的最大 token 数
+        tiktoken_model (str): 分词模型名称
+        min_segment_chars (int): 每次编码的最少字符数，减少小片段反复编码的开销
+        max_pending_chars (int): 找不到分词边界时，未编码文本的最大缓冲字符数
+
+    Returns:
+        Generator[dict[str, Any], Any, None]: 文本块生成器
+    """
+    split_size = tokenizer_split_size(tiktoken_model)
+    if split_size is None:
+        segments = _tiktoken_segments(content_stream, min_segment_chars, max_pending_chars)
+    else:
+        # Qwen 分词器先对整个输入做 NFC 规范化，分段按规范化之后的文本计算
+        segments = _split_text_segments(_nfc_stream(content_stream), split_size)
+
+    step = max_token_size - overlap_token_size
+    index = 0
+    window_text = ""  # 当前窗口内 token 对应的文本
+    tokens: list[int] = []
+    offsets: list[int] = [0]
+
+    def _extend(text: str):
+        nonlocal window_text
+        seg_tokens, seg_offsets, text = encode_string_with_offsets(
+            text, model_name=tiktoken_model
+        )
+        if seg_offsets is None:
+            # 分词器不支持偏移映射，按单个 token 解码长度近似
+            seg_offsets = [0]
+            for t in seg_tokens:
+                t_len = len(decode_tokens_by_tiktoken([t], model_name=tiktoken_model))
+                seg_offsets.append(min(seg_offsets[-1] + t_len, len(text)))
+            seg_offsets = np.array(seg_offsets, dtype=np.int64)
+        tokens.extend(seg_tokens)
+        offsets.extend((seg_offsets[1:] + len(window_text)).tolist())
+        window_text += text
+
+    def _emit(start: int) -> dict[str, Any]:
+        end = min(start + max_token_size, len(tokens))
+        return {
+            "tokens": end - start,
+            "content": window_text[offsets[start] : offsets[end]].strip(),
+            "chunk_order_index": index,
+        }
+
+    for segment in segments:
+        _extend(segment)
+        head = 0
+        while len(tokens) - head >= max_token_size:
+            yield _emit(head)
+            index += 1
+            head += step
+        if head:
+            # 丢弃已经完整输出、且不在重叠区域内的 token
+            drop = offsets[head]
+            window_text = window_text[drop:]
+            del tokens[:head]
+            offsets = [o - drop for o in offsets[head:]]
+
+    for start in range(0, len(tokens), step):
+        yield _emit(start)
+        index += 1
 
 
 async def _handle_entity_relation_summary(
@@ -108,7 +365,8 @@ async def _handle_entity_relation_summary(
     logger.debug(f"Using prompt for summary: {use_prompt}")
 
     # 调用 LLM 生成摘要
-    summary = await use_llm_func(use_prompt, max_tokens=summary_max_tokens)
+    with priority_scope(PRIORITY_SUMMARY):
+        summary = await use_llm_func(use_prompt, max_tokens=summary_max_tokens)
     logger.debug(f"Generated summary for {entity_or_relation_name}: {summary}")
 
     return summary
@@ -255,6 +513,7 @@ async def _merge_nodes_then_upsert(
         node_data=node_data,
     )
     logger.debug(f"Upserted node {entity_name} into knowledge graph.")
+    record_graph_access(entities=[entity_name])
 
     node_data["entity_name"] = entity_name
     return node_data
@@ -349,6 +608,7 @@ async def _merge_edges_then_upsert(
         ),
     )
     logger.debug(f"Upserted edge from {src_id} to {tgt_id} into knowledge graph.")
+    record_graph_access(entities=[src_id, tgt_id])
 
     edge_data = dict(
         src_id=src_id,
@@ -362,12 +622,174 @@ async def _merge_edges_then_upsert(
     return edge_data
 
 
+async def _extract_single_chunk(
+    chunk_key: str,
+    chunk_dp: TextChunkSchema,
+    global_config: dict,
+) -> tuple[dict[str, list[EntityDict]], dict[tuple[str, str], list[RelationshipDict]]]:
+    """
+    处理单个文本块，调用 LLM 提取实体和关系。
+
+    Args:
+        chunk_key (str): 文本块键
+        chunk_dp (TextChunkSchema): 文本块数据
+        global_config (dict): 全局配置字典
+
+    Returns:
+        tuple[dict, dict]: 实体字典（实体名 -> 实体列表）和关系字典（(源, 目标) -> 关系列表）
+    """
+    use_llm_func: callable = global_config["llm_model_func"]
+    entity_extract_max_gleaning = global_config["entity_extract_max_gleaning"]
+
+    entity_extract_prompt = NOW_PROMPTS["entity_extraction"]    # 实体及关系提取
+    context_base = dict(
+        tuple_delimiter=NOW_PROMPTS["DEFAULT_TUPLE_DELIMITER"],
+        record_delimiter=NOW_PROMPTS["DEFAULT_RECORD_DELIMITER"],
+        completion_delimiter=NOW_PROMPTS["DEFAULT_COMPLETION_DELIMITER"],
+        entity_types=",".join(NOW_PROMPTS["DEFAULT_ENTITY_TYPES"]),
+    )
+    continue_prompt = NOW_PROMPTS["entiti_continue_extraction"]   # 继续提取
+    if_loop_prompt = NOW_PROMPTS["entiti_if_loop_extraction"]   # 是否继续提取
+
+    content = chunk_dp["content"]
+    # 生成初始提示，提取实体和关系
+    hint_prompt = entity_extract_prompt.format(**context_base, input_text=content)
+    final_result = await use_llm_func(hint_prompt)
+
+    # 打包用户和助手的历史对话，用于持续提取
+    history = pack_user_ass_to_openai_messages(hint_prompt, final_result)
+    for now_glean_index in range(entity_extract_max_gleaning):
+        # 获取更多的实体和关系信息
+        glean_result = await use_llm_func(continue_prompt, history_messages=history)
+
+        history += pack_user_ass_to_openai_messages(continue_prompt, glean_result)
+        final_result += glean_result
+        if now_glean_index == entity_extract_max_gleaning - 1:
+            break
+
+        # 判断是否需要继续提取
+        if_loop_result: str = await use_llm_func(
+            if_loop_prompt, history_messages=history
+        )
+        if_loop_result = if_loop_result.strip().strip('"').strip("'").lower()
+        if if_loop_result != "yes":
+            break
+
+    # 解析LLM返回的结果，分割成记录
+    records = split_string_by_multi_markers(
+        final_result,
+        [context_base["record_delimiter"], context_base["completion_delimiter"]],
+    )
+
+    maybe_nodes = defaultdict(list)
+    maybe_edges = defaultdict(list)
+    for record in records:
+        record = re.search(r"\((.*)\)", record)
+        if record is None:
+            continue
+        record = record.group(1)
+        record_attributes = split_string_by_multi_markers(
+            record, [context_base["tuple_delimiter"]]
+        )
+        # 处理可能的实体
+        if_entities = await _handle_single_entity_extraction(
+            record_attributes, chunk_key
+        )
+        if if_entities is not None:
+            maybe_nodes[if_entities["entity_name"]].append(if_entities)
+            continue
+
+        # 处理可能的关系
+        if_relation = await _handle_single_relationship_extraction(
+            record_attributes, chunk_key
+        )
+        if if_relation is not None:
+            maybe_edges[(if_relation["src_id"], if_relation["tgt_id"])].append(
+                if_relation
+            )
+    return dict(maybe_nodes), dict(maybe_edges)
+
+
+async def _extract_chunk_with_reuse(
+    chunk_key: str,
+    chunk_dp: TextChunkSchema,
+    global_config: dict,
+    journal: Optional[InsertJournal] = None,
+    near_duplicate_index: Optional[NearDuplicateIndex] = None,
+) -> tuple[dict[str, list[EntityDict]], dict[tuple[str, str], list[RelationshipDict]]]:
+    """
+    提取单个文本块的实体和关系，优先复用插入日志中的提取结果与近重复文本块的提取结果。
+
+    Args:
+        chunk_key (str): 文本块键
+        chunk_dp (TextChunkSchema): 文本块数据
+        global_config (dict): 全局配置字典
+        journal (Optional[InsertJournal]): 插入日志
+        near_duplicate_index (Optional[NearDuplicateIndex]): 近重复文本块索引
+
+    Returns:
+        tuple[dict, dict]: 实体字典和关系字典
+    """
+    extracted = journal.get_extracted(chunk_key) if journal is not None else None
+    if extracted is not None:
+        return extracted
+
+    if near_duplicate_index is not None:
+        maybe_nodes, maybe_edges = await near_duplicate_index.extract_or_reuse(
+            chunk_key,
+            chunk_dp["content"],
+            global_config,
+            partial(_extract_single_chunk, chunk_key, chunk_dp),
+        )
+    else:
+        maybe_nodes, maybe_edges = await _extract_single_chunk(
+            chunk_key, chunk_dp, global_config
+        )
+    if journal is not None:
+        journal.record_extracted(chunk_key, maybe_nodes, maybe_edges)
+    return maybe_nodes, maybe_edges
+
+
+def _entities_to_vdb_data(all_entities_data: list[EntityDict]) -> dict[str, dict]:
+    """
+    将合并后的实体转换为实体向量数据库的写入格式。
+    """
+    return {
+        compute_mdhash_id(dp["entity_name"], prefix="ent-"): {
+            "content": dp["entity_name"] + dp["description"],
+            "entity_name": dp["entity_name"],
+        }
+        for dp in all_entities_data
+    }
+
+
+def _relationships_to_vdb_data(
+    all_relationships_data: list[RelationshipDict],
+) -> dict[str, dict]:
+    """
+    将合并后的关系转换为关系向量数据库的写入格式。
+    """
+    return {
+        compute_mdhash_id(dp["src_id"] + dp["tgt_id"], prefix="rel-"): {
+            "src_id": dp["src_id"],
+            "tgt_id": dp["tgt_id"],
+            "content": dp["keywords"]
+            + dp["src_id"]
+            + dp["tgt_id"]
+            + dp["description"],
+        }
+        for dp in all_relationships_data
+    }
+
+
 async def extract_entities(
     chunks: dict[str, TextChunkSchema],
     knowledge_graph_inst: BaseGraphStorage,
     entity_vdb: BaseVectorStorage,
     relationships_vdb: BaseVectorStorage,
     global_config: dict,
+    journal: Optional[InsertJournal] = None,
+    near_duplicate_index: Optional[NearDuplicateIndex] = None,
 ) -> Union[BaseGraphStorage, None]:
     """
     从文本块中提取实体和关系，更新知识图谱实例和向量数据库。
@@ -378,32 +800,21 @@ async def extract_entities(
         entity_vdb (BaseVectorStorage): 实体向量数据库实例。
         relationships_vdb (BaseVectorStorage): 关系向量数据库实例。
         global_config (dict): 全局配置字典。
+        journal (Optional[InsertJournal]): 插入日志，已记录提取结果的文本块直接复用，新的提取结果写入日志。
+        near_duplicate_index (Optional[NearDuplicateIndex]): 近重复文本块索引，相似文本块复用提取结果。
 
     返回：
         Union[BaseGraphStorage, None]: 更新后的知识图谱实例，如果未提取到任何实体或关系则返回None。
     """
-    use_llm_func: callable = global_config["llm_model_func"]
-    entity_extract_max_gleaning = global_config["entity_extract_max_gleaning"]
-
     ordered_chunks = list(chunks.items())
 
-    entity_extract_prompt = NOW_PROMPTS["entity_extraction"]    # 实体及关系提取
-    context_base = dict(
-        tuple_delimiter=NOW_PROMPTS["DEFAULT_TUPLE_DELIMITER"],
-        record_delimiter=NOW_PROMPTS["DEFAULT_RECORD_DELIMITER"],
-        completion_delimiter=NOW_PROMPTS["DEFAULT_COMPLETION_DELIMITER"],
-        entity_types=",".join(NOW_PROMPTS["DEFAULT_ENTITY_TYPES"]),
-    )
-    continue_prompt = NOW_PROMPTS["entiti_continue_extraction"]   # 继续提取
-    if_loop_prompt = NOW_PROMPTS["entiti_if_loop_extraction"]   # 是否继续提取
-
     already_processed = 0
     already_entities = 0
     already_relations = 0
 
     async def _process_single_content(chunk_key_dp: tuple[str, TextChunkSchema]) -> tuple[dict[Any, list], dict[Any, list]]:
         """
-        处理单个文本块，提取实体和关系。
+        处理单个文本块，提取实体和关系，并打印进度。
         
         Args:
             chunk_key_dp(tuple[str, TextChunkSchema]): 文本块键值对
@@ -413,64 +824,13 @@ async def extract_entities(
         """
         
         nonlocal already_processed, already_entities, already_relations
-        chunk_key = chunk_key_dp[0]
-        chunk_dp = chunk_key_dp[1]
-        content = chunk_dp["content"]
-        # 生成初始提示，提取实体和关系
-        hint_prompt = entity_extract_prompt.format(**context_base, input_text=content)
-        final_result = await use_llm_func(hint_prompt)
-
-        # 打包用户和助手的历史对话，用于持续提取
-        history = pack_user_ass_to_openai_messages(hint_prompt, final_result)
-        for now_glean_index in range(entity_extract_max_gleaning):
-            # 获取更多的实体和关系信息
-            glean_result = await use_llm_func(continue_prompt, history_messages=history)
-
-            history += pack_user_ass_to_openai_messages(continue_prompt, glean_result)
-            final_result += glean_result
-            if now_glean_index == entity_extract_max_gleaning - 1:
-                break
-
-            # 判断是否需要继续提取
-            if_loop_result: str = await use_llm_func(
-                if_loop_prompt, history_messages=history
-            )
-            if_loop_result = if_loop_result.strip().strip('"').strip("'").lower()
-            if if_loop_result != "yes":
-                break
-
-        # 解析LLM返回的结果，分割成记录
-        records = split_string_by_multi_markers(
-            final_result,
-            [context_base["record_delimiter"], context_base["completion_delimiter"]],
+        maybe_nodes, maybe_edges = await _extract_chunk_with_reuse(
+            chunk_key_dp[0],
+            chunk_key_dp[1],
+            global_config,
+            journal=journal,
+            near_duplicate_index=near_duplicate_index,
         )
-
-        maybe_nodes = defaultdict(list)
-        maybe_edges = defaultdict(list)
-        for record in records:
-            record = re.search(r"\((.*)\)", record)
-            if record is None:
-                continue
-            record = record.group(1)
-            record_attributes = split_string_by_multi_markers(
-                record, [context_base["tuple_delimiter"]]
-            )
-            # 处理可能的实体
-            if_entities = await _handle_single_entity_extraction(
-                record_attributes, chunk_key
-            )
-            if if_entities is not None:
-                maybe_nodes[if_entities["entity_name"]].append(if_entities)
-                continue
-
-            # 处理可能的关系
-            if_relation = await _handle_single_relationship_extraction(
-                record_attributes, chunk_key
-            )
-            if if_relation is not None:
-                maybe_edges[(if_relation["src_id"], if_relation["tgt_id"])].append(
-                    if_relation
-                )
         # 更新已处理的统计信息
         already_processed += 1
         already_entities += len(maybe_nodes)
@@ -483,13 +843,20 @@ async def extract_entities(
             end="",
             flush=True,
         )
-        return dict(maybe_nodes), dict(maybe_edges)
+        return maybe_nodes, maybe_edges
 
+    if near_duplicate_index is not None:
+        await near_duplicate_index.prepare_signatures(
+            {k: v["content"] for k, v in ordered_chunks}
+        )
     # 并发处理所有文本块，提取实体和关系
     results = await asyncio.gather(
         *[_process_single_content(c) for c in ordered_chunks]
     )
     print()  # 清除进度条
+    if journal is not None:
+        # 提取结果在合并前一次落盘
+        await journal.flush()
     maybe_nodes = defaultdict(list)
     maybe_edges = defaultdict(list)
     for m_nodes, m_edges in results:
@@ -525,30 +892,14 @@ async def extract_entities(
 
     # 更新实体向量数据库
     if entity_vdb is not None:
-        data_for_vdb = {
-            compute_mdhash_id(dp["entity_name"], prefix="ent-"): {
-                "content": dp["entity_name"] + dp["description"],
-                "entity_name": dp["entity_name"],
-            }
-            for dp in all_entities_data
-        }
+        data_for_vdb = _entities_to_vdb_data(all_entities_data)
         logger.debug(f"[upserting entity] {data_for_vdb}")
         # await entity_vdb.upsert(data_for_vdb)
         tasks.append(entity_vdb.upsert(data_for_vdb))
 
     # 更新关系向量数据库
     if relationships_vdb is not None:
-        data_for_vdb = {
-            compute_mdhash_id(dp["src_id"] + dp["tgt_id"], prefix="rel-"): {
-                "src_id": dp["src_id"],
-                "tgt_id": dp["tgt_id"],
-                "content": dp["keywords"]
-                + dp["src_id"]
-                + dp["tgt_id"]
-                + dp["description"],
-            }
-            for dp in all_relationships_data
-        }
+        data_for_vdb = _relationships_to_vdb_data(all_relationships_data)
         logger.debug(f"[upserting relationship] {data_for_vdb}")
         # await relationships_vdb.upsert(data_for_vdb)
         tasks.append(relationships_vdb.upsert(data_for_vdb))
@@ -559,6 +910,73 @@ async def extract_entities(
     return knowledge_graph_inst
 
 
+def _stream_kwargs(query_param: QueryParam) -> dict:
+    """
+    只在流式查询时向模型函数传入 stream，不支持该参数的自定义模型函数仍可用于普通查询。
+    """
+    return {"stream": True} if query_param.stream else {}
+
+
+async def _extract_keywords_by_llm(query: str, global_config: dict) -> Optional[dict]:
+    """
+    调用 LLM 提取查询的高层次与低层次关键词，LLM 返回的 JSON 格式有误时尝试修正。
+
+    Returns:
+        Optional[dict]: {"high_level_keywords": list, "low_level_keywords": list}，解析失败时为 None
+    """
+    use_model_func = global_config["llm_model_func"]
+    kw_prompt_temp = NOW_PROMPTS["keywords_extraction"]
+    kw_prompt = kw_prompt_temp.format(query=query)
+    result = await use_model_func(kw_prompt)
+    json_text = locate_json_string_body_from_string(result)
+
+    try:
+        keywords_data = json.loads(json_text)
+    except (TypeError, json.JSONDecodeError):
+        try:
+            # 尝试修正LLM返回的格式错误
+            result = (
+                result.replace(kw_prompt[:-1], "")
+                .replace("user", "")
+                .replace("model", "")
+                .strip()
+            )
+            result = "{" + result.split("{")[-1].split("}")[0] + "}"
+            keywords_data = json.loads(result)
+        # Handle parsing error
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON parsing error: {e}")
+            return None
+    return {
+        "high_level_keywords": keywords_data.get("high_level_keywords", []),
+        "low_level_keywords": keywords_data.get("low_level_keywords", []),
+    }
+
+
+async def extract_query_keywords(
+    query: str,
+    global_config: dict,
+    keywords_cache: Optional[QueryKeywordCache] = None,
+) -> Optional[dict]:
+    """
+    提取查询的高层次与低层次关键词，local、global 与 hybrid 查询共用。
+    传入 keywords_cache 时结果按规范化后的查询缓存，同一查询的并发请求只调用一次 LLM。
+
+    Args:
+        query (str): 用户查询
+        global_config (dict): 全局配置字典
+        keywords_cache (Optional[QueryKeywordCache]): 关键词缓存
+
+    Returns:
+        Optional[dict]: {"high_level_keywords": list, "low_level_keywords": list}，解析失败时为 None
+    """
+    if keywords_cache is None:
+        return await _extract_keywords_by_llm(query, global_config)
+    return await keywords_cache.get_or_extract(
+        query, partial(_extract_keywords_by_llm, query, global_config)
+    )
+
+
 async def local_query(
     query,
     knowledge_graph_inst: BaseGraphStorage,
@@ -567,6 +985,7 @@ async def local_query(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
     global_config: dict,
+    keywords_cache: Optional[QueryKeywordCache] = None,
 ) -> str:
     """
     执行本地查询，利用知识图谱和向量数据库回答用户的问题。
@@ -579,6 +998,7 @@ async def local_query(
         text_chunks_db (BaseKVStorage[TextChunkSchema]): 文本块存储数据库。
         query_param (QueryParam): 查询参数配置。
         global_config (dict): 全局配置字典。
+        keywords_cache (Optional[QueryKeywordCache]): 关键词缓存，各查询模式共用。
 
     返回：
         str: 返回给用户的查询结果。
@@ -586,33 +1006,12 @@ async def local_query(
     context = None
     use_model_func = global_config["llm_model_func"]
 
-    kw_prompt_temp = NOW_PROMPTS["keywords_extraction"] # 关键词提取
-    kw_prompt = kw_prompt_temp.format(query=query)
-    result = await use_model_func(kw_prompt)
-    json_text = locate_json_string_body_from_string(result)
-
-    try:
-        keywords_data = json.loads(json_text)
-        keywords = keywords_data.get("low_level_keywords", [])
-        keywords = ", ".join(keywords)
-    except json.JSONDecodeError:
-        try:
-            result = (
-                result.replace(kw_prompt[:-1], "")
-                .replace("user", "")
-                .replace("model", "")
-                .strip()
-            )
-            result = "{" + result.split("{")[-1].split("}")[0] + "}"
+    # 关键词提取
+    keywords_data = await extract_query_keywords(query, global_config, keywords_cache)
+    if keywords_data is None:
+        return NOW_PROMPTS["fail_response"]
+    keywords = ", ".join(keywords_data["low_level_keywords"])
 
-            keywords_data = json.loads(result)
-            keywords = keywords_data.get("low_level_keywords", [])
-            keywords = ", ".join(keywords)
-        # Handle parsing error
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
-            return NOW_PROMPTS["fail_response"]
-        
     if keywords:
         logger.debug(f"local query 提取出的关键词 {keywords}")
         
@@ -635,10 +1034,12 @@ async def local_query(
     response = await use_model_func(
         query,
         system_prompt=sys_prompt,
+        **_stream_kwargs(query_param),
     )
     
     # 意义不明
-    if len(response) > len(sys_prompt):
+    # 流式回复直接返回给调用方，不做后处理
+    if isinstance(response, str) and len(response) > len(sys_prompt):
         response = (
             response.replace(sys_prompt, "")
             .replace("user", "")
@@ -718,6 +1119,10 @@ async def _build_local_query_context(
     logger.info(
         f"Local query uses {len(node_datas)} entites, {len(use_relations)} relations, {len(use_text_units)} text units"
     )
+    record_graph_access(
+        entities=[n["entity_name"] for n in node_datas]
+        + [name for e in use_relations for name in e["src_tgt"]]
+    )
     entites_section_list = [["id", "entity", "type", "description", "rank"]]
     for i, n in enumerate(node_datas):
         entites_section_list.append(
@@ -867,6 +1272,7 @@ async def _find_most_related_text_unit_from_entities(
         max_token_size=query_param.max_token_for_text_unit,
     )
     
+    record_graph_access(chunks=[t["id"] for t in all_text_units])
     # 返回文本单元数据列表
     all_text_units: list[TextChunkSchema] = [t["data"] for t in all_text_units]
     return all_text_units
@@ -937,6 +1343,7 @@ async def global_query(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
     global_config: dict,
+    keywords_cache: Optional[QueryKeywordCache] = None,
 ) -> str:
     """
     执行全局查询，利用高层次的关键词进行查询。
@@ -949,6 +1356,7 @@ async def global_query(
         text_chunks_db (BaseKVStorage[TextChunkSchema]): 文本块存储数据库。
         query_param (QueryParam): 查询参数配置。
         global_config (dict): 全局配置字典。
+        keywords_cache (Optional[QueryKeywordCache]): 关键词缓存，各查询模式共用。
 
     返回：
         str: 返回给用户的查询结果。
@@ -956,36 +1364,12 @@ async def global_query(
     context = None
     use_model_func = global_config["llm_model_func"]
 
-    kw_prompt_temp = NOW_PROMPTS["keywords_extraction"]
-    kw_prompt = kw_prompt_temp.format(query=query)
-    result = await use_model_func(kw_prompt)
-    json_text = locate_json_string_body_from_string(result)
-
-    try:
-        keywords_data = json.loads(json_text)
-        keywords = keywords_data.get("high_level_keywords", [])
-        keywords = ", ".join(keywords)
-    except json.JSONDecodeError:
-        try:
-            # 尝试修正LLM返回的格式错误
-            result = (
-                result.replace(kw_prompt[:-1], "")
-                .replace("user", "")
-                .replace("model", "")
-                .strip()
-            )
-            result = "{" + result.split("{")[-1].split("}")[0] + "}"
-
-            keywords_data = json.loads(result)
-            # 获取高层次关键词
-            keywords = keywords_data.get("high_level_keywords", [])
-            keywords = ", ".join(keywords)
+    # 获取高层次关键词
+    keywords_data = await extract_query_keywords(query, global_config, keywords_cache)
+    if keywords_data is None:
+        return NOW_PROMPTS["fail_response"]
+    keywords = ", ".join(keywords_data["high_level_keywords"])
 
-        except json.JSONDecodeError as e:
-            # 处理解析错误
-            print(f"JSON parsing error: {e}")
-            return NOW_PROMPTS["fail_response"]
-        
     if keywords:
         context = await _build_global_query_context(
             keywords,
@@ -1008,8 +1392,10 @@ async def global_query(
     response = await use_model_func(
         query,
         system_prompt=sys_prompt,
+        **_stream_kwargs(query_param),
     )
-    if len(response) > len(sys_prompt):
+    # 流式回复直接返回给调用方，不做后处理
+    if isinstance(response, str) and len(response) > len(sys_prompt):
         response = (
             response.replace(sys_prompt, "")
             .replace("user", "")
@@ -1094,6 +1480,10 @@ async def _build_global_query_context(
     logger.info(
         f"Global query uses {len(use_entities)} entites, {len(edge_datas)} relations, {len(use_text_units)} text units"
     )
+    record_graph_access(
+        entities=[n["entity_name"] for n in use_entities]
+        + [name for e in edge_datas for name in (e["src_id"], e["tgt_id"])]
+    )
     # 构建关系的表格数据
     relations_section_list = [
         ["id", "source", "target", "description", "keywords", "weight", "rank"]
@@ -1250,6 +1640,7 @@ async def _find_related_text_unit_from_relationships(
         key=lambda x: json.dumps(x, ensure_ascii=False),
         max_token_size=query_param.max_token_for_text_unit,
     )
+    record_graph_access(chunks=[t["id"] for t in all_text_units])
     # 提取文本单元数据
     all_text_units: list[TextChunkSchema] = [t["data"] for t in all_text_units]
 
@@ -1264,6 +1655,7 @@ async def hybrid_query(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
     global_config: dict,
+    keywords_cache: Optional[QueryKeywordCache] = None,
 ) -> str:
     """
     执行混合查询，结合本地和全局查询的结果。
@@ -1276,6 +1668,7 @@ async def hybrid_query(
         text_chunks_db (BaseKVStorage[TextChunkSchema]): 文本块存储数据库。
         query_param (QueryParam): 查询参数配置。
         global_config (dict): 全局配置字典。
+        keywords_cache (Optional[QueryKeywordCache]): 关键词缓存，各查询模式共用。
 
     返回：
         str: 返回给用户的查询结果。
@@ -1284,35 +1677,11 @@ async def hybrid_query(
     high_level_context = None
     use_model_func = global_config["llm_model_func"]
 
-    kw_prompt_temp = NOW_PROMPTS["keywords_extraction"]
-    kw_prompt = kw_prompt_temp.format(query=query)
-
-    result = await use_model_func(kw_prompt)
-    json_text = locate_json_string_body_from_string(result)
-    try:
-        keywords_data = json.loads(json_text)
-        hl_keywords = keywords_data.get("high_level_keywords", [])
-        ll_keywords = keywords_data.get("low_level_keywords", [])
-        hl_keywords = ", ".join(hl_keywords)
-        ll_keywords = ", ".join(ll_keywords)
-    except json.JSONDecodeError:
-        try:
-            result = (
-                result.replace(kw_prompt[:-1], "")
-                .replace("user", "")
-                .replace("model", "")
-                .strip()
-            )
-            result = "{" + result.split("{")[-1].split("}")[0] + "}"
-            keywords_data = json.loads(result)
-            hl_keywords = keywords_data.get("high_level_keywords", [])
-            ll_keywords = keywords_data.get("low_level_keywords", [])
-            hl_keywords = ", ".join(hl_keywords)
-            ll_keywords = ", ".join(ll_keywords)
-        # Handle parsing error
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
-            return NOW_PROMPTS["fail_response"]
+    keywords_data = await extract_query_keywords(query, global_config, keywords_cache)
+    if keywords_data is None:
+        return NOW_PROMPTS["fail_response"]
+    hl_keywords = ", ".join(keywords_data["high_level_keywords"])
+    ll_keywords = ", ".join(keywords_data["low_level_keywords"])
 
     if ll_keywords:
         low_level_context = await _build_local_query_context(
@@ -1348,8 +1717,10 @@ async def hybrid_query(
     response = await use_model_func(
         query,
         system_prompt=sys_prompt,
+        **_stream_kwargs(query_param),
     )
-    if len(response) > len(sys_prompt):
+    # 流式回复直接返回给调用方，不做后处理
+    if isinstance(response, str) and len(response) > len(sys_prompt):
         response = (
             response.replace(sys_prompt, "")
             .replace("user", "")
@@ -1458,7 +1829,15 @@ async def naive_query(
     use_model_func = global_config["llm_model_func"]
     
     # 直接从向量数据库中查询文本块，相当于普通 RAG 
-    results = await chunks_vdb.query(query, top_k=query_param.top_k)
+    if query_param.doc_ids:
+        # 只在指定文档的文本块中检索
+        results = await chunks_vdb.query(
+            query,
+            top_k=query_param.top_k,
+            filters={"full_doc_id": query_param.doc_ids},
+        )
+    else:
+        results = await chunks_vdb.query(query, top_k=query_param.top_k)
     if not len(results):
         return NOW_PROMPTS["fail_response"]
     chunks_ids = [r["id"] for r in results]
@@ -1470,6 +1849,7 @@ async def naive_query(
         max_token_size=query_param.max_token_for_text_unit,
     )
     logger.info(f"Truncate {len(chunks)} to {len(maybe_trun_chunks)} chunks")
+    record_graph_access(chunks=chunks_ids[: len(maybe_trun_chunks)])
     section = "--New Chunk--\n".join([c["content"] for c in maybe_trun_chunks])
     if query_param.only_need_context:
         return section
@@ -1480,9 +1860,11 @@ async def naive_query(
     response = await use_model_func(
         query,
         system_prompt=sys_prompt,
+        **_stream_kwargs(query_param),
     )
 
-    if len(response) > len(sys_prompt):
+    # 流式回复直接返回给调用方，不做后处理
+    if isinstance(response, str) and len(response) > len(sys_prompt):
         response = (
             response[len(sys_prompt) :]
             .replace(sys_prompt, "")
@@ -0,0 +1,443 @@
+"""
+流水线插入。
+
+切分、实体提取、合并、向量化各阶段之间通过有界 asyncio 队列衔接：
+文本块切出后立即进入实体提取与文本块向量化，提取结果分批合并进知识图谱，
+合并完成的实体和关系再以小批量写入向量数据库。各阶段的吞吐统计见 PipelineStats。
+"""
+
+import asyncio
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from .base import (
+    BaseGraphStorage,
+    BaseKVStorage,
+    BaseVectorStorage,
+    EntityDict,
+    RelationshipDict,
+    TextChunkSchema,
+)
+from .dedup import NearDuplicateIndex
+from .journal import InsertJournal
+from .operate import (
+    _entities_to_vdb_data,
+    _extract_chunk_with_reuse,
+    _merge_edges_then_upsert,
+    _merge_nodes_then_upsert,
+    _relationships_to_vdb_data,
+)
+from .utils import logger
+
+# 队列结束标记
+_STOP = object()
+
+
+@dataclass
+class StageStats:
+    name: str
+    # 处理的条目数
+    items: int = 0
+    # 处理耗时（多个 worker 累加）
+    busy: float = 0.0
+    # 等待上游数据的耗时
+    idle: float = 0.0
+    # 等待下游队列空位的耗时，持续偏高说明下游是瓶颈
+    blocked: float = 0.0
+
+    def to_dict(self, elapsed: float) -> dict:
+        return {
+            "items": self.items,
+            "items_per_second": self.items / elapsed if elapsed > 0 else 0.0,
+            "busy": self.busy,
+            "idle": self.idle,
+            "blocked": self.blocked,
+        }
+
+
+@dataclass
+class PipelineStats:
+    stages: dict[str, StageStats] = field(default_factory=dict)
+    started: float = field(default_factory=time.perf_counter)
+    finished: Optional[float] = None
+
+    def stage(self, name: str) -> StageStats:
+        if name not in self.stages:
+            self.stages[name] = StageStats(name)
+        return self.stages[name]
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return end - self.started
+
+    def to_dict(self) -> dict:
+        elapsed = self.elapsed
+        return {
+            "elapsed": elapsed,
+            "stages": {k: v.to_dict(elapsed) for k, v in self.stages.items()},
+        }
+
+    def summary(self) -> str:
+        elapsed = self.elapsed
+        lines = [f"pipeline finished in {elapsed:.2f}s"]
+        for stage in self.stages.values():
+            rate = stage.items / elapsed if elapsed > 0 else 0.0
+            lines.append(
+                f"  {stage.name:<20} {stage.items:>7} items {rate:>9.2f}/s  "
+                f"busy {stage.busy:>8.2f}s  idle {stage.idle:>8.2f}s  "
+                f"blocked {stage.blocked:>8.2f}s"
+            )
+        return "\n".join(lines)
+
+
+class InsertPipeline:
+    """
+    流水线插入的执行器，一次插入对应一个实例。
+
+    阶段及 worker 数：
+        chunk (1) -> extract (llm_model_max_async) -> merge (insert_pipeline_merge_workers)
+                  -> chunk_embed (1)                 -> entity_embed (1) / relationship_embed (1)
+
+    合并阶段按实体名、关系加锁，同一实体的多次合并串行执行；每个向量库只有一个写入 worker，
+    保证同一实体后一次合并的结果不会被先一次的结果覆盖。
+
+    传入插入日志时，已合并的文本块跳过提取与合并，已写入向量库的文本块跳过向量化，
+    已记录提取结果的文本块不再调用 LLM。传入近重复索引时，相似文本块复用提取结果。
+    """
+
+    def __init__(
+        self,
+        chunk_func: Callable[[str, dict], Awaitable[dict[str, TextChunkSchema]]],
+        text_chunks: BaseKVStorage,
+        knowledge_graph_inst: BaseGraphStorage,
+        entity_vdb: BaseVectorStorage,
+        relationships_vdb: BaseVectorStorage,
+        chunks_vdb: BaseVectorStorage,
+        global_config: dict,
+        journal: Optional[InsertJournal] = None,
+        near_duplicate_index: Optional[NearDuplicateIndex] = None,
+    ):
+        self.chunk_func = chunk_func
+        self.text_chunks = text_chunks
+        self.knowledge_graph_inst = knowledge_graph_inst
+        self.entity_vdb = entity_vdb
+        self.relationships_vdb = relationships_vdb
+        self.chunks_vdb = chunks_vdb
+        self.global_config = global_config
+        self.journal = journal
+        self.near_duplicate_index = near_duplicate_index
+
+        queue_size = global_config["insert_pipeline_queue_size"]
+        self.extract_workers = max(1, global_config["llm_model_max_async"])
+        self.merge_workers = max(1, global_config["insert_pipeline_merge_workers"])
+        self.batch_wait = global_config["insert_pipeline_batch_wait"]
+        self.embed_batch_size = max(
+            1,
+            global_config["embedding_batch_num"]
+            * global_config["embedding_func_max_async"],
+        )
+
+        self.extract_queue = asyncio.Queue(maxsize=queue_size)
+        self.merge_queue = asyncio.Queue(maxsize=queue_size)
+        self.chunk_embed_queue = asyncio.Queue(maxsize=queue_size)
+        self.entity_embed_queue = asyncio.Queue(maxsize=queue_size)
+        self.relationship_embed_queue = asyncio.Queue(maxsize=queue_size)
+
+        self._node_locks: dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._edge_locks: dict[tuple[str, str], asyncio.Lock] = defaultdict(
+            asyncio.Lock
+        )
+
+        self.stats = PipelineStats()
+        self.chunks: dict[str, TextChunkSchema] = {}
+        self.entity_count = 0
+        self.relationship_count = 0
+
+    async def run(self, new_docs: dict[str, dict]) -> dict[str, TextChunkSchema]:
+        """
+        执行流水线插入。
+
+        Args:
+            new_docs (dict[str, dict]): 文档 id 到文档内容的映射
+
+        Returns:
+            dict[str, TextChunkSchema]: 本次新插入的文本块
+        """
+        self.stats = PipelineStats()
+        for name in [
+            "chunk",
+            "extract",
+            "merge",
+            "chunk_embed",
+            "entity_embed",
+            "relationship_embed",
+        ]:
+            self.stats.stage(name)
+        tasks = [
+            asyncio.ensure_future(coro)
+            for coro in [
+                self._run_stage(
+                    [self._chunk_worker(new_docs)],
+                    [self.extract_queue, self.chunk_embed_queue],
+                ),
+                self._run_stage(
+                    [self._extract_worker() for _ in range(self.extract_workers)],
+                    [self.merge_queue],
+                ),
+                self._run_stage(
+                    [self._merge_worker() for _ in range(self.merge_workers)],
+                    [self.entity_embed_queue, self.relationship_embed_queue],
+                ),
+                self._embed_worker(
+                    "chunk_embed",
+                    self.chunk_embed_queue,
+                    self.chunks_vdb,
+                    dict,
+                ),
+                self._embed_worker(
+                    "entity_embed",
+                    self.entity_embed_queue,
+                    self.entity_vdb,
+                    _entities_to_vdb_data,
+                ),
+                self._embed_worker(
+                    "relationship_embed",
+                    self.relationship_embed_queue,
+                    self.relationships_vdb,
+                    _relationships_to_vdb_data,
+                ),
+            ]
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # 任一阶段失败时取消其余阶段，避免它们阻塞在队列上
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self.stats.finished = time.perf_counter()
+
+        extracted = self.stats.stage("extract").items
+        if extracted and not self.entity_count:
+            logger.warning("Didn't extract any entities, maybe your LLM is not working")
+        elif extracted and not self.relationship_count:
+            logger.warning(
+                "Didn't extract any relationships, maybe your LLM is not working"
+            )
+        return self.chunks
+
+    async def _run_stage(
+        self, workers: list[Awaitable], downstream: list[asyncio.Queue]
+    ):
+        tasks = [asyncio.ensure_future(worker) for worker in workers]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        for queue in downstream:
+            await queue.put(_STOP)
+
+    async def _get(self, stats: StageStats, queue: asyncio.Queue) -> Any:
+        start = time.perf_counter()
+        item = await queue.get()
+        stats.idle += time.perf_counter() - start
+        return item
+
+    async def _put(self, stats: StageStats, queue: asyncio.Queue, item: Any):
+        start = time.perf_counter()
+        await queue.put(item)
+        stats.blocked += time.perf_counter() - start
+
+    async def _get_batch(
+        self, stats: StageStats, queue: asyncio.Queue, max_items: int
+    ) -> tuple[list, bool]:
+        """
+        阻塞获取第一个条目，之后在 batch_wait 时间内尽量凑满一批。
+
+        Returns:
+            tuple[list, bool]: 本批条目，以及是否已读到结束标记
+        """
+        item = await self._get(stats, queue)
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_wait
+        start = time.perf_counter()
+        try:
+            while len(batch) < max_items:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    # 轮询而不是 wait_for(queue.get())，后者在取消时可能吞掉 CancelledError
+                    await asyncio.sleep(min(remaining, self.batch_wait / 10))
+                    continue
+                if item is _STOP:
+                    return batch, True
+                batch.append(item)
+            return batch, False
+        finally:
+            stats.idle += time.perf_counter() - start
+
+    async def _chunk_worker(self, new_docs: dict[str, dict]):
+        stats = self.stats.stage("chunk")
+        # 最多 chunking_max_workers 个文档同时在执行器中切分，结果按文档顺序进入下游
+        window = max(1, self.global_config["chunking_max_workers"])
+        docs = iter(new_docs.items())
+        running = deque()
+        try:
+            while True:
+                for doc_key, doc in docs:
+                    running.append(asyncio.ensure_future(self.chunk_func(doc_key, doc)))
+                    if len(running) >= window:
+                        break
+                if not running:
+                    return
+                start = time.perf_counter()
+                chunks = await running.popleft()
+                _add_chunk_keys = await self.text_chunks.filter_keys(list(chunks.keys()))
+                chunks = {
+                    k: v
+                    for k, v in chunks.items()
+                    if k in _add_chunk_keys and k not in self.chunks
+                }
+                self.chunks.update(chunks)
+                if self.near_duplicate_index is not None:
+                    await self.near_duplicate_index.prepare_signatures(
+                        {k: v["content"] for k, v in chunks.items()}
+                    )
+                stats.busy += time.perf_counter() - start
+                stats.items += len(chunks)
+                journal = self.journal
+                for chunk_key_dp in chunks.items():
+                    if journal is None or not journal.is_merged(chunk_key_dp[0]):
+                        await self._put(stats, self.extract_queue, chunk_key_dp)
+                    if journal is None or not journal.is_embedded(chunk_key_dp[0]):
+                        await self._put(stats, self.chunk_embed_queue, chunk_key_dp)
+        finally:
+            # 下游失败或被取消时不再等待未完成的切分
+            for task in running:
+                task.cancel()
+
+    async def _extract_worker(self):
+        stats = self.stats.stage("extract")
+        while True:
+            item = await self._get(stats, self.extract_queue)
+            if item is _STOP:
+                # 放回结束标记，通知同阶段的其他 worker
+                self.extract_queue.put_nowait(_STOP)
+                return
+            start = time.perf_counter()
+            maybe_nodes, maybe_edges = await _extract_chunk_with_reuse(
+                item[0],
+                item[1],
+                self.global_config,
+                journal=self.journal,
+                near_duplicate_index=self.near_duplicate_index,
+            )
+            stats.busy += time.perf_counter() - start
+            stats.items += 1
+            await self._put(stats, self.merge_queue, (maybe_nodes, maybe_edges))
+
+    async def _merge_worker(self):
+        stats = self.stats.stage("merge")
+        while True:
+            batch, stopped = await self._get_batch(
+                stats, self.merge_queue, self.extract_workers
+            )
+            if batch:
+                start = time.perf_counter()
+                if self.journal is not None:
+                    # 这一批的提取结果在合并前一次落盘
+                    await self.journal.flush()
+                entities, relationships = await self._merge_batch(batch)
+                stats.busy += time.perf_counter() - start
+                stats.items += len(batch)
+                self.entity_count += len(entities)
+                self.relationship_count += len(relationships)
+                for dp in entities:
+                    await self._put(stats, self.entity_embed_queue, dp)
+                for dp in relationships:
+                    await self._put(stats, self.relationship_embed_queue, dp)
+            if stopped:
+                self.merge_queue.put_nowait(_STOP)
+                return
+
+    async def _merge_batch(
+        self, batch: list[tuple[dict, dict]]
+    ) -> tuple[list[EntityDict], list[RelationshipDict]]:
+        """
+        合并一批文本块的提取结果：先合并节点，再合并边。
+        """
+        maybe_nodes = defaultdict(list)
+        maybe_edges = defaultdict(list)
+        for m_nodes, m_edges in batch:
+            for k, v in m_nodes.items():
+                maybe_nodes[k].extend(v)
+            for k, v in m_edges.items():
+                maybe_edges[tuple(sorted(k))].extend(v)
+
+        entities = await asyncio.gather(
+            *[self._merge_node(k, v) for k, v in maybe_nodes.items()]
+        )
+        relationships = await asyncio.gather(
+            *[self._merge_edge(k, v) for k, v in maybe_edges.items()]
+        )
+        return entities, relationships
+
+    async def _merge_node(self, entity_name: str, nodes_data: list[dict]) -> EntityDict:
+        async with self._node_locks[entity_name]:
+            return await _merge_nodes_then_upsert(
+                entity_name, nodes_data, self.knowledge_graph_inst, self.global_config
+            )
+
+    async def _merge_edge(
+        self, edge_key: tuple[str, str], edges_data: list[dict]
+    ) -> RelationshipDict:
+        # 合并边时可能补插缺失的端点，因此同时持有端点的锁；
+        # 端点锁按排序顺序获取，节点合并只持有单个节点锁，不会形成死锁
+        async with self._edge_locks[edge_key]:
+            node_locks = [self._node_locks[k] for k in sorted(set(edge_key))]
+            for lock in node_locks:
+                await lock.acquire()
+            try:
+                return await _merge_edges_then_upsert(
+                    edge_key[0],
+                    edge_key[1],
+                    edges_data,
+                    self.knowledge_graph_inst,
+                    self.global_config,
+                )
+            finally:
+                for lock in reversed(node_locks):
+                    lock.release()
+
+    async def _embed_worker(
+        self,
+        name: str,
+        queue: asyncio.Queue,
+        vdb: Optional[BaseVectorStorage],
+        to_vdb_data: Callable[[list], dict[str, dict]],
+    ):
+        stats = self.stats.stage(name)
+        while True:
+            batch, stopped = await self._get_batch(stats, queue, self.embed_batch_size)
+            if batch and vdb is not None:
+                start = time.perf_counter()
+                data_for_vdb = to_vdb_data(batch)
+                logger.debug(f"[upserting {name}] {len(data_for_vdb)} items")
+                await vdb.upsert(data_for_vdb)
+                stats.busy += time.perf_counter() - start
+                stats.items += len(data_for_vdb)
+            if stopped:
+                return
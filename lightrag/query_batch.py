@@ -0,0 +1,136 @@
+"""
+批量查询共用的存储视图。
+
+LightRAG.aquery_batch 中并发执行的查询通过这些视图访问存储：
+
+    BatchedVectorQuery  合并 max_wait 秒内并发的向量查询，交给存储的 query_batch 一次完成，
+                        相同 (查询文本, top_k) 的查询只执行一次；带 filters 的查询不合并
+    CachedStorageView   批内缓存图与文本块的读取结果，多个查询共用的实体、关系与文本块只读取一次
+
+视图只在一个批次内有效，批次之间的插入不会读到旧数据。
+"""
+
+import asyncio
+from typing import Any, Optional
+
+from .base import BaseVectorStorage
+from .meta_index import MetadataFilters
+
+
+class BatchedVectorQuery:
+    """
+    合并并发向量查询的存储视图，除 query 外的属性直接访问原存储。
+    """
+
+    def __init__(
+        self, storage: BaseVectorStorage, max_wait: float = 0.002, max_batch_size: int = 64
+    ):
+        self._storage = storage
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        # (查询文本, top_k) -> 结果 future，批内复用
+        self._results: dict[tuple[str, int], asyncio.Future] = {}
+        # top_k -> 等待合并的查询文本
+        self._pending: dict[int, list[str]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.stats = {"queries": 0, "deduplicated": 0, "batches": 0}
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._storage, name)
+
+    async def query(
+        self, query: str, top_k: int = 5, filters: Optional[MetadataFilters] = None
+    ) -> list[dict]:
+        self.stats["queries"] += 1
+        if filters:
+            return await self._storage.query(query, top_k=top_k, filters=filters)
+        key = (query, top_k)
+        future = self._results.get(key)
+        if future is None:
+            future = self._results[key] = asyncio.get_running_loop().create_future()
+            pending = self._pending.setdefault(top_k, [])
+            pending.append(query)
+            if len(pending) >= self.max_batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(
+                    self.max_wait, self._flush
+                )
+        else:
+            self.stats["deduplicated"] += 1
+        # 结果由多个查询共用，单个查询被取消时不取消 future
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        for top_k, queries in pending.items():
+            asyncio.ensure_future(self._run_batch(queries, top_k))
+
+    async def _run_batch(self, queries: list[str], top_k: int):
+        self.stats["batches"] += 1
+        futures = [self._results[(query, top_k)] for query in queries]
+        try:
+            results = await self._storage.query_batch(queries, top_k=top_k)
+        except Exception as e:
+            for query, future in zip(queries, futures):
+                # 失败的查询不复用，之后的相同查询重新执行
+                self._results.pop((query, top_k), None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class CachedStorageView:
+    """
+    缓存只读方法结果的存储视图：以 (方法名, 参数) 为键，并发的相同读取只执行一次。
+    未列在 methods 中的属性直接访问原存储。
+    """
+
+    def __init__(self, storage, methods: set[str]):
+        self._storage = storage
+        self._methods = methods
+        self._results: dict[tuple, asyncio.Task] = {}
+        self.stats = {"reads": 0, "deduplicated": 0}
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._storage, name)
+        if name not in self._methods:
+            return attr
+
+        async def cached(*args, **kwargs):
+            self.stats["reads"] += 1
+            key = (
+                name,
+                tuple(_hashable(a) for a in args),
+                tuple(sorted((k, _hashable(v)) for k, v in kwargs.items())),
+            )
+            task = self._results.get(key)
+            if task is None:
+                task = self._results[key] = asyncio.ensure_future(attr(*args, **kwargs))
+                task.add_done_callback(lambda t: self._forget_failed(key, t))
+            else:
+                self.stats["deduplicated"] += 1
+            result = await asyncio.shield(task)
+            # 返回副本，调用方修改结果不影响其他查询
+            return dict(result) if isinstance(result, dict) else result
+
+        return cached
+
+    def _forget_failed(self, key: tuple, task: asyncio.Task):
+        # 失败的读取不复用，之后的相同读取重新执行
+        if task.cancelled() or task.exception() is not None:
+            self._results.pop(key, None)
+
+
+def _hashable(value):
+    if isinstance(value, list):
+        return tuple(value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
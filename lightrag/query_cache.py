@@ -0,0 +1,376 @@
+"""
+语义查询缓存。
+
+在 LightRAG.aquery 之前按查询的 embedding 查找相似的历史查询：查询模式与其余 QueryParam 参数
+相同（指纹相同）、且余弦相似度不低于阈值时直接返回缓存的回答。每条缓存记录回答用到的实体与
+文本块，插入或删除改动了其中任一实体或文本块时记录失效。
+
+缓存按 LRU 淘汰，查询与插入结束时在线程池中落盘，只写入上次落盘后的变化：
+
+    semantic_query_cache.log          记录的增删，每行一个 JSON，只追加写入；失效行过多时重写
+    semantic_query_cache.vectors.npy  查询向量矩阵，每条记录占一行，删除的行在删除落盘后复用
+
+旧版本的 semantic_query_cache.json 在首次启动时被导入。
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator, Iterable, Optional
+
+import numpy as np
+
+from .base import QueryParam, StorageNameSpace
+from .prompt_zh import PROMPTS_ZH
+from .utils import EmbeddingFunc, compute_args_hash, load_json, logger
+
+
+def query_param_fingerprint(param: QueryParam) -> str:
+    """QueryParam 的指纹，参数不同的查询不共用缓存；是否流式返回不影响回答"""
+    params = asdict(param)
+    params.pop("stream", None)
+    return compute_args_hash(json.dumps(params, sort_keys=True))
+
+
+@dataclass
+class SemanticQueryCache(StorageNameSpace):
+    """
+    语义查询缓存。lookup 返回命中的回答（未命中为 None）与本次查询的凭据，
+    未命中时查询完成后用凭据调用 store 写入缓存。
+    """
+
+    embedding_func: EmbeddingFunc = None
+    threshold: float = 0.95
+    max_entries: int = 1000
+    stats: dict = field(
+        default_factory=lambda: {
+            "hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "evictions": 0,
+            "lookup_seconds": 0.0,
+            "saved_seconds": 0.0,
+        }
+    )
+
+    def __post_init__(self):
+        self.threshold = self.global_config.get(
+            "semantic_query_cache_threshold", self.threshold
+        )
+        self.max_entries = self.global_config.get(
+            "semantic_query_cache_max_entries", self.max_entries
+        )
+        working_dir = self.global_config["working_dir"]
+        self._log_file = os.path.join(working_dir, f"{self.namespace}.log")
+        self._vectors_file = os.path.join(working_dir, f"{self.namespace}.vectors.npy")
+        # 记录 id -> 记录，按最近使用排序，最久未使用的在前
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        # 指纹 -> 记录 id 列表与对应的单位向量矩阵，矩阵在记录变化后重建
+        self._by_fingerprint: dict[str, list[str]] = defaultdict(list)
+        self._matrices: dict[str, np.ndarray] = {}
+        # 实体名、文本块 id -> 用到它的记录 id
+        self._by_entity: dict[str, set[str]] = defaultdict(set)
+        self._by_chunk: dict[str, set[str]] = defaultdict(set)
+        # 每次失效加一；查询期间发生过失效的回答可能基于旧数据，不写入缓存
+        self._generation = 0
+
+        # 向量矩阵（以 mmap 方式打开，只在落盘时访问）、下一个未用过的行号、可复用的行号
+        self._vectors: Optional[np.memmap] = None
+        self._next_row = 0
+        self._free_rows: list[int] = []
+        # 上次落盘后的变化：日志行、待写入的 行号 -> 向量、删除后待落盘才能复用的行号
+        self._pending: list[dict] = []
+        self._pending_vectors: dict[int, np.ndarray] = {}
+        self._released_rows: list[int] = []
+        self._log_lines = 0
+        self._lock = asyncio.Lock()
+
+        self._load()
+        logger.info(f"Load semantic query cache with {len(self._entries)} entries")
+
+    # ---------------------------------------------------------------- 文件
+
+    def _load(self):
+        if not os.path.exists(self._log_file):
+            self._migrate_json()
+            return
+        entries: dict[str, dict] = {}
+        with open(self._log_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 写入中断的最后一行
+                    break
+                self._log_lines += 1
+                if record["op"] == "add":
+                    entries[record["id"]] = record["entry"]
+                else:
+                    entries.pop(record["id"], None)
+        if entries:
+            self._vectors = np.load(self._vectors_file, mmap_mode="r+")
+        used = set()
+        # 日志按写入顺序排列，最近写入的在后，与 LRU 顺序近似
+        for entry_id, entry in entries.items():
+            entry["vector"] = np.array(self._vectors[entry["row"]], dtype=np.float32)
+            used.add(entry["row"])
+            self._add(entry_id, entry)
+        self._next_row = max(used) + 1 if used else 0
+        self._free_rows = sorted(set(range(self._next_row)) - used, reverse=True)
+
+    def _migrate_json(self):
+        json_file = os.path.join(self.global_config["working_dir"], f"{self.namespace}.json")
+        for entry_id, entry in (load_json(json_file) or {}).items():
+            entry["row"] = self._allocate_row()
+            self._add(entry_id, entry)
+            self._log_add(entry_id, entry)
+        if self._entries:
+            logger.info(f"Migrating {len(self._entries)} semantic query cache entries")
+
+    def _allocate_row(self) -> int:
+        if self._free_rows:
+            return self._free_rows.pop()
+        self._next_row += 1
+        return self._next_row - 1
+
+    def _log_add(self, entry_id: str, entry: dict):
+        self._pending.append(
+            {
+                "op": "add",
+                "id": entry_id,
+                "entry": {k: v for k, v in entry.items() if k != "vector"},
+            }
+        )
+        self._pending_vectors[entry["row"]] = entry["vector"]
+
+    def _write_vectors(self, vectors: dict[int, np.ndarray]):
+        if not vectors:
+            return
+        rows = max(vectors) + 1
+        dim = len(next(iter(vectors.values())))
+        if self._vectors is None or self._vectors.shape[0] < rows:
+            # 容量按倍数增长
+            capacity = max(rows, 1024, 0 if self._vectors is None else 2 * len(self._vectors))
+            new = np.lib.format.open_memmap(
+                self._vectors_file + ".tmp",
+                mode="w+",
+                dtype=np.float32,
+                shape=(capacity, dim),
+            )
+            if self._vectors is not None:
+                new[: len(self._vectors)] = self._vectors
+            new.flush()
+            del new
+            self._vectors = None
+            os.replace(self._vectors_file + ".tmp", self._vectors_file)
+            self._vectors = np.load(self._vectors_file, mmap_mode="r+")
+        for row, vector in vectors.items():
+            self._vectors[row] = vector
+        self._vectors.flush()
+
+    def _write_log(self, records: list[dict], rewrite: bool):
+        lines = "".join(
+            json.dumps(record, ensure_ascii=False) + "\n" for record in records
+        )
+        if rewrite:
+            with open(self._log_file + ".tmp", "w", encoding="utf-8") as f:
+                f.write(lines)
+            os.replace(self._log_file + ".tmp", self._log_file)
+        else:
+            with open(self._log_file, "a", encoding="utf-8") as f:
+                f.write(lines)
+
+    # ---------------------------------------------------------------- 记录
+
+    def _add(self, entry_id: str, entry: dict):
+        entry["vector"] = np.asarray(entry["vector"], dtype=np.float32)
+        self._entries[entry_id] = entry
+        self._by_fingerprint[entry["fingerprint"]].append(entry_id)
+        self._matrices.pop(entry["fingerprint"], None)
+        for name in entry["entities"]:
+            self._by_entity[name].add(entry_id)
+        for chunk_id in entry["chunks"]:
+            self._by_chunk[chunk_id].add(entry_id)
+
+    def _remove(self, entry_id: str):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        fingerprint = entry["fingerprint"]
+        self._by_fingerprint[fingerprint].remove(entry_id)
+        if not self._by_fingerprint[fingerprint]:
+            del self._by_fingerprint[fingerprint]
+        self._matrices.pop(fingerprint, None)
+        for name in entry["entities"]:
+            self._by_entity[name].discard(entry_id)
+            if not self._by_entity[name]:
+                del self._by_entity[name]
+        for chunk_id in entry["chunks"]:
+            self._by_chunk[chunk_id].discard(entry_id)
+            if not self._by_chunk[chunk_id]:
+                del self._by_chunk[chunk_id]
+        self._pending.append({"op": "remove", "id": entry_id})
+        self._released_rows.append(entry["row"])
+
+    def _matrix(self, fingerprint: str) -> np.ndarray:
+        matrix = self._matrices.get(fingerprint)
+        if matrix is None:
+            matrix = self._matrices[fingerprint] = np.stack(
+                [self._entries[i]["vector"] for i in self._by_fingerprint[fingerprint]]
+            )
+        return matrix
+
+    async def lookup(self, query: str, param: QueryParam) -> tuple[Optional[str], dict]:
+        """
+        查找相似的历史查询。
+
+        Args:
+            query (str): 用户查询
+            param (QueryParam): 查询参数
+
+        Returns:
+            tuple[Optional[str], dict]: 命中的回答（未命中为 None）与传给 store 的凭据
+        """
+        start = time.perf_counter()
+        vector = np.asarray((await self.embedding_func([query]))[0], dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        fingerprint = query_param_fingerprint(param)
+        ticket = {
+            "query": query,
+            "fingerprint": fingerprint,
+            "vector": vector,
+            "generation": self._generation,
+            "start": start,
+        }
+
+        answer = None
+        if fingerprint in self._by_fingerprint:
+            similarities = self._matrix(fingerprint) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                entry_id = self._by_fingerprint[fingerprint][best]
+                self._entries.move_to_end(entry_id)
+                entry = self._entries[entry_id]
+                answer = entry["answer"]
+                logger.info(
+                    f"Semantic query cache hit ({similarities[best]:.3f}): "
+                    f"{query!r} -> {entry['query']!r}"
+                )
+
+        elapsed = time.perf_counter() - start
+        self.stats["lookup_seconds"] += elapsed
+        if answer is None:
+            self.stats["misses"] += 1
+        else:
+            self.stats["hits"] += 1
+            self.stats["saved_seconds"] += max(0.0, entry["latency"] - elapsed)
+        return answer, ticket
+
+    def store(self, ticket: dict, answer: str, used: dict):
+        """
+        写入查询的回答。失败回答、以及查询期间缓存发生过失效的回答不写入。
+
+        Args:
+            ticket (dict): lookup 返回的凭据
+            answer (str): 回答
+            used (dict): 回答用到的实体与文本块，{"entities": set, "chunks": set}
+        """
+        if not isinstance(answer, str) or answer == PROMPTS_ZH["fail_response"]:
+            return
+        if ticket["generation"] != self._generation:
+            return
+        entry_id = compute_args_hash(ticket["fingerprint"], ticket["query"])
+        self._remove(entry_id)
+        entry = {
+            "query": ticket["query"],
+            "fingerprint": ticket["fingerprint"],
+            "vector": ticket["vector"],
+            "answer": answer,
+            "entities": sorted(used["entities"]),
+            "chunks": sorted(used["chunks"]),
+            "latency": time.perf_counter() - ticket["start"],
+            "created": time.time(),
+            "row": self._allocate_row(),
+        }
+        self._add(entry_id, entry)
+        self._log_add(entry_id, entry)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+    async def store_stream(
+        self, ticket: dict, chunks: AsyncIterator[str], used: dict
+    ) -> AsyncIterator[str]:
+        """逐块产出流式回答，完整产出后写入缓存"""
+        parts = []
+        try:
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        finally:
+            if hasattr(chunks, "aclose"):
+                await chunks.aclose()
+        self.store(ticket, "".join(parts), used)
+
+    def invalidate(
+        self, entities: Iterable[str] = (), chunks: Iterable[str] = ()
+    ) -> int:
+        """
+        删除用到给定实体或文本块的缓存记录。
+
+        Returns:
+            int: 删除的记录数
+        """
+        self._generation += 1
+        entry_ids = set()
+        for name in entities:
+            entry_ids.update(self._by_entity.get(name, ()))
+        for chunk_id in chunks:
+            entry_ids.update(self._by_chunk.get(chunk_id, ()))
+        for entry_id in entry_ids:
+            self._remove(entry_id)
+        self.stats["invalidations"] += len(entry_ids)
+        if entry_ids:
+            logger.info(f"Invalidated {len(entry_ids)} semantic query cache entries")
+        return len(entry_ids)
+
+    async def index_done_callback(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            loop = asyncio.get_running_loop()
+            records, self._pending = self._pending, []
+            vectors, self._pending_vectors = self._pending_vectors, {}
+            released, self._released_rows = self._released_rows, []
+            self._log_lines += len(records)
+            rewrite = self._log_lines > max(1000, 2 * len(self._entries))
+            if rewrite:
+                # 失效行过多时按当前记录重写日志
+                records = [
+                    {
+                        "op": "add",
+                        "id": entry_id,
+                        "entry": {k: v for k, v in entry.items() if k != "vector"},
+                    }
+                    for entry_id, entry in self._entries.items()
+                ]
+                self._log_lines = len(records)
+            # 先写向量再写日志，日志中的记录引用的行总是已经写好
+            await loop.run_in_executor(None, self._write_vectors, vectors)
+            await loop.run_in_executor(None, self._write_log, records, rewrite)
+            # 删除已落盘，这些行可以分配给新记录
+            self._free_rows.extend(released)
+
+    async def query_done_callback(self):
+        await self.index_done_callback()
+
+    def metrics(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+        }
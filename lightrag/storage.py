@@ -2,7 +2,7 @@ import asyncio
 import html
 import os
 from dataclasses import dataclass
-from typing import Any, Union, cast
+from typing import Any, Optional, Union, cast
 import networkx as nx
 import numpy as np
 from nano_vectordb import NanoVectorDB
@@ -11,7 +11,6 @@ from .utils import (
     logger,
     load_json,
     write_json,
-    compute_mdhash_id,
 )
 
 from .base import (
@@ -19,6 +18,7 @@ from .base import (
     BaseKVStorage,
     BaseVectorStorage,
 )
+from .meta_index import MetadataFilters, MetadataIndex
 
 
 @dataclass
@@ -85,6 +85,12 @@ class NanoVectorDBStorage(BaseVectorStorage):
         self.cosine_better_than_threshold = self.global_config.get(
             "cosine_better_than_threshold", self.cosine_better_than_threshold
         )
+        # meta_fields 的倒排索引，按元数据删除与过滤时只访问匹配的记录
+        self._meta_index = MetadataIndex(self.meta_fields)
+        for dp in self.client_storage["data"]:
+            self._meta_index.add(dp["__id__"], dp)
+        # id -> 在矩阵中的行号，数据变化后在下次过滤查询时重建
+        self._positions: Optional[dict[str, int]] = None
 
     async def upsert(self, data: dict[str, dict]):
         logger.info(f"Inserting {len(data)} vectors to {self.namespace}")
@@ -110,31 +116,87 @@ class NanoVectorDBStorage(BaseVectorStorage):
         for i, d in enumerate(list_data):
             d["__vector__"] = embeddings[i]
         results = self._client.upsert(datas=list_data)
+        for d in list_data:
+            self._meta_index.add(d["__id__"], d)
+        self._positions = None
         return results
 
-    async def query(self, query: str, top_k=5):
-        embedding = await self.embedding_func([query])
-        embedding = embedding[0]
-        results = self._client.query(
-            query=embedding,
-            top_k=top_k,
-            better_than_threshold=self.cosine_better_than_threshold,
+    async def query(self, query: str, top_k=5, filters: Optional[MetadataFilters] = None):
+        return (await self.query_batch([query], top_k, filters))[0]
+
+    async def query_batch(
+        self, queries: list[str], top_k=5, filters: Optional[MetadataFilters] = None
+    ) -> list[list[dict]]:
+        """
+        批量查询：所有查询一次 embedding，与向量矩阵做一次矩阵乘法得到全部相似度。
+        给出 filters 时只与满足条件的行计算相似度。
+        """
+        if not len(queries):
+            return []
+        storage = self.client_storage
+        data, matrix = storage["data"], storage["matrix"]
+        if filters:
+            if self._positions is None:
+                self._positions = {dp["__id__"]: i for i, dp in enumerate(data)}
+            rows = sorted(self._positions[id] for id in self._meta_index.match(filters))
+            data, matrix = [data[i] for i in rows], matrix[rows]
+        if not len(data):
+            return [[] for _ in queries]
+        embeddings = await self.embedding_func(list(queries))
+        embeddings = embeddings / np.maximum(
+            np.linalg.norm(embeddings, axis=-1, keepdims=True), 1e-12
         )
-        results = [
-            {**dp, "id": dp["__id__"], "distance": dp["__metrics__"]} for dp in results
-        ]
+        # (查询数, 向量数)
+        scores = embeddings @ matrix.T
+        k = min(top_k, scores.shape[1])
+        top_index = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row_scores, row_index in zip(scores, top_index):
+            row_index = row_index[np.argsort(-row_scores[row_index])]
+            row_results = []
+            for i in row_index:
+                if row_scores[i] < self.cosine_better_than_threshold:
+                    break
+                dp = data[i]
+                row_results.append(
+                    {
+                        **dp,
+                        "__metrics__": row_scores[i],
+                        "id": dp["__id__"],
+                        "distance": row_scores[i],
+                    }
+                )
+            results.append(row_results)
         return results
 
+    def ids_missing_meta(self, name: str) -> set[str]:
+        return self._meta_index.missing(name)
+
+    async def update_meta(self, metas: dict[str, dict]):
+        for dp in self.client_storage["data"]:
+            meta = metas.get(dp["__id__"])
+            if meta is None:
+                continue
+            dp.update({k: v for k, v in meta.items() if k in self.meta_fields})
+            self._meta_index.add(dp["__id__"], dp)
+
     @property
     def client_storage(self):
         return getattr(self._client, "_NanoVectorDB__storage")
 
+    async def delete(self, ids: list[str]):
+        """按 id 删除向量，不存在的 id 被忽略"""
+        self._client.delete(list(ids))
+        for id in ids:
+            self._meta_index.remove(id)
+        self._positions = None
+
     async def delete_entity(self, entity_name: str):
         try:
-            entity_id = [compute_mdhash_id(entity_name, prefix="ent-")]
+            entity_ids = self._meta_index.lookup("entity_name", entity_name)
 
-            if self._client.get(entity_id):
-                self._client.delete(entity_id)
+            if entity_ids:
+                await self.delete(list(entity_ids))
                 logger.info(f"Entity {entity_name} have been deleted.")
             else:
                 logger.info(f"No entity found with name {entity_name}.")
@@ -143,15 +205,12 @@ class NanoVectorDBStorage(BaseVectorStorage):
 
     async def delete_relation(self, entity_name: str):
         try:
-            relations = [
-                dp
-                for dp in self.client_storage["data"]
-                if dp["src_id"] == entity_name or dp["tgt_id"] == entity_name
-            ]
-            ids_to_delete = [relation["__id__"] for relation in relations]
+            ids_to_delete = self._meta_index.lookup(
+                "src_id", entity_name
+            ) | self._meta_index.lookup("tgt_id", entity_name)
 
             if ids_to_delete:
-                self._client.delete(ids_to_delete)
+                await self.delete(list(ids_to_delete))
                 logger.info(
                     f"All relations related to entity {entity_name} have been deleted."
                 )
@@ -2,15 +2,23 @@ import asyncio
 import html
 import io
 import csv
+import heapq
+import inspect
+import itertools
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 from itertools import zip_longest
 import json
 import logging
 import os
 import re
+import time
+import unicodedata
 from dataclasses import dataclass
 from functools import wraps
 from hashlib import md5
-from typing import Any, Union, List
+from typing import Any, Callable, Iterable, List, Optional, Union
 import xml.etree.ElementTree as ET
 from dashscope import get_tokenizer
 
@@ -76,28 +84,530 @@ def compute_mdhash_id(content, prefix: str = ""):
     return prefix + md5(content.encode()).hexdigest()
 
 
+# 调用优先级，数值越小越优先：交互查询 > 描述摘要 > 实体提取
+PRIORITY_QUERY = 0
+PRIORITY_SUMMARY = 1
+PRIORITY_EXTRACTION = 2
+PRIORITY_NAMES = {
+    PRIORITY_QUERY: "query",
+    PRIORITY_SUMMARY: "summary",
+    PRIORITY_EXTRACTION: "extraction",
+}
+
+# 当前上下文中发起调用的优先级，未设置时视为交互查询
+call_priority: ContextVar[int] = ContextVar("call_priority", default=PRIORITY_QUERY)
+
+
+@contextmanager
+def priority_scope(priority: int):
+    """在当前上下文中以指定优先级发起 LLM 与 embedding 调用"""
+    token = call_priority.set(priority)
+    try:
+        yield
+    finally:
+        call_priority.reset(token)
+
+
+# 当前上下文中查询用到、或插入改动的实体名与文本块 id，未在记录范围内时为 None
+graph_access: ContextVar[Optional[dict]] = ContextVar("graph_access", default=None)
+
+
+@contextmanager
+def track_graph_access():
+    """在当前上下文中记录查询用到或插入改动的实体与文本块，产出 {"entities": set, "chunks": set}"""
+    access = {"entities": set(), "chunks": set()}
+    token = graph_access.set(access)
+    try:
+        yield access
+    finally:
+        graph_access.reset(token)
+
+
+def record_graph_access(entities: Iterable[str] = (), chunks: Iterable[str] = ()):
+    access = graph_access.get()
+    if access is not None:
+        access["entities"].update(entities)
+        access["chunks"].update(chunks)
+
+
+class PriorityScheduler:
+    """
+    带优先级的并发限制器：最多 max_size 个调用同时执行，其余调用按 (优先级, 到达顺序) 排队，
+    同一优先级内先到先得。排队中的调用被取消时直接出队，不占用并发名额。
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._active = 0
+        self._seq = itertools.count()
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._queue_depth: Counter = Counter()
+        self._wait_count: Counter = Counter()
+        self._wait_total: Counter = Counter()
+        self._wait_max: dict[int, float] = {}
+
+    def _record_wait(self, priority: int, waited: float):
+        self._wait_count[priority] += 1
+        self._wait_total[priority] += waited
+        self._wait_max[priority] = max(self._wait_max.get(priority, 0.0), waited)
+
+    async def acquire(self, priority: int = PRIORITY_QUERY):
+        if self._active < self.max_size and not any(self._queue_depth.values()):
+            self._active += 1
+            self._record_wait(priority, 0.0)
+            return
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._queue_depth[priority] += 1
+        start = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self._queue_depth[priority] -= 1
+            else:
+                # 名额已转交给本调用但调用被取消，转交给下一个等待者
+                self.release()
+            raise
+        self._record_wait(priority, time.perf_counter() - start)
+
+    def release(self):
+        while self._waiters:
+            priority, _, future = heapq.heappop(self._waiters)
+            if future.cancelled():
+                continue
+            # 名额直接转交给下一个等待者，_active 不变
+            self._queue_depth[priority] -= 1
+            future.set_result(None)
+            return
+        self._active -= 1
+
+    def metrics(self) -> dict:
+        return {
+            "max_size": self.max_size,
+            "active": self._active,
+            "queue_depth": {
+                name: self._queue_depth[p] for p, name in PRIORITY_NAMES.items()
+            },
+            "wait_time": {
+                name: {
+                    "count": self._wait_count[p],
+                    "total": self._wait_total[p],
+                    "mean": self._wait_total[p] / self._wait_count[p]
+                    if self._wait_count[p]
+                    else 0.0,
+                    "max": self._wait_max.get(p, 0.0),
+                }
+                for p, name in PRIORITY_NAMES.items()
+            },
+        }
+
+
+class _WatchedStream:
+    """Async iterator over a streamed LLM response that calls on_done(assembled text) exactly once:
+    when the stream ends or fails, is closed, or is garbage collected without being consumed."""
+
+    def __init__(self, stream, on_done: Callable[[str], None]):
+        self._stream = stream
+        self._iterator = stream.__aiter__()
+        self._on_done = on_done
+        self._parts = []
+        self._finished = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            chunk = await self._iterator.__anext__()
+        except BaseException:
+            self._finish()
+            raise
+        self._parts.append(chunk)
+        return chunk
+
+    async def aclose(self):
+        try:
+            if hasattr(self._stream, "aclose"):
+                await self._stream.aclose()
+        finally:
+            self._finish()
+
+    def _finish(self):
+        if not self._finished:
+            self._finished = True
+            self._on_done("".join(self._parts))
+
+    def __del__(self):
+        self._finish()
+
+
 def limit_async_func_call(max_size: int, waitting_time: float = 0.0001):
-    """Add restriction of maximum async calling times for a async func"""
+    """Add restriction of maximum async calling times for a async func.
+
+    Calls beyond max_size wait in a PriorityScheduler ordered by the priority in
+    `call_priority`, FIFO within a priority. The scheduler is exposed as
+    `wait_func.scheduler` for metrics. waitting_time is kept for compatibility.
+    A call returning an async iterator (a streamed LLM response) holds its slot
+    until the stream is exhausted or closed.
+    """
 
     def final_decro(func):
-        """Not using async.Semaphore to aovid use nest-asyncio"""
-        __current_size = 0
+        scheduler = PriorityScheduler(max_size)
+
+        @wraps(func)
+        async def wait_func(*args, **kwargs):
+            await scheduler.acquire(call_priority.get())
+            try:
+                result = await func(*args, **kwargs)
+            except BaseException:
+                scheduler.release()
+                raise
+            if hasattr(result, "__aiter__"):
+                return _WatchedStream(result, lambda _: scheduler.release())
+            scheduler.release()
+            return result
+
+        wait_func.scheduler = scheduler
+        return wait_func
+
+    return final_decro
+
 
+class _TokenBucket:
+    """
+    按分钟配额持续补充的令牌桶。取用时先扣减，余量为负表示需要等待的欠额，
+    后来的调用看到更大的欠额，因此按到达顺序排队。
+    """
+
+    def __init__(self, per_minute: float, burst_fraction: float):
+        self.per_minute = per_minute
+        # 任意 60 秒内的用量不超过 capacity + rate * 60 = per_minute
+        self.capacity = max(1.0, per_minute * burst_fraction)
+        self.rate = (
+            (per_minute - self.capacity) if per_minute > self.capacity else per_minute
+        ) / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: float, now: float) -> float:
+        """扣减用量，返回需要等待的秒数"""
+        self._refill(now)
+        self.level -= amount
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def give(self, amount: float):
+        self._refill(time.monotonic())
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    令牌桶限速器，同时限制每分钟请求数（RPM）与每分钟 token 数（TPM），未配置的维度不限制。
+    调用前按估计的 token 数预留额度，调用完成后再按实际用量修正。
+    """
+
+    def __init__(
+        self, rpm: int = None, tpm: int = None, burst_fraction: float = 0.05
+    ):
+        self.burst_fraction = burst_fraction
+        self.configure(rpm, tpm)
+        self._window: deque = deque()
+        self._requests = 0
+        self._tokens = 0
+        self._throttled = 0.0
+
+    def configure(self, rpm: int = None, tpm: int = None):
+        self.rpm, self.tpm = rpm, tpm
+        self._request_bucket = _TokenBucket(rpm, self.burst_fraction) if rpm else None
+        self._token_bucket = _TokenBucket(tpm, self.burst_fraction) if tpm else None
+
+    async def acquire(self, tokens: int = 0) -> list:
+        """
+        预留一次请求和 tokens 个 token 的额度，额度不足时等待。
+
+        Returns:
+            list: 用量记录，传给 adjust 修正实际 token 数
+        """
+        now = time.monotonic()
+        wait = 0.0
+        if self._request_bucket is not None:
+            wait = max(wait, self._request_bucket.take(1, now))
+        if self._token_bucket is not None:
+            wait = max(wait, self._token_bucket.take(tokens, now))
+        if wait > 0:
+            self._throttled += wait
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # 取消的调用归还预留的额度
+                if self._request_bucket is not None:
+                    self._request_bucket.give(1)
+                if self._token_bucket is not None:
+                    self._token_bucket.give(tokens)
+                raise
+        self._requests += 1
+        self._tokens += tokens
+        record = [time.monotonic(), tokens]
+        self._window.append(record)
+        return record
+
+    def adjust(self, record: list, actual_tokens: int):
+        """按实际 token 数修正预留的额度：多退少补"""
+        delta = actual_tokens - record[1]
+        record[1] = actual_tokens
+        self._tokens += delta
+        if self._token_bucket is not None:
+            if delta > 0:
+                self._token_bucket.take(delta, time.monotonic())
+            elif delta < 0:
+                self._token_bucket.give(-delta)
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        while self._window and self._window[0][0] < now - 60:
+            self._window.popleft()
+        span = 60.0
+        if self._window:
+            span = min(60.0, max(1.0, now - self._window[0][0]))
+        return {
+            "rpm_limit": self.rpm,
+            "tpm_limit": self.tpm,
+            # 最近 60 秒内的实际速率
+            "achieved_rpm": len(self._window) * 60 / span,
+            "achieved_tpm": sum(r[1] for r in self._window) * 60 / span,
+            "requests": self._requests,
+            "tokens": self._tokens,
+            "throttled_seconds": self._throttled,
+        }
+
+
+# 按模型或服务端点共享的限速器，多个 LightRAG 实例使用同一端点时共用配额
+_RATE_LIMITERS: dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(key: str, rpm: int = None, tpm: int = None) -> RateLimiter:
+    """获取 key 对应的限速器，不存在时创建；已存在时以新的配额为准"""
+    limiter = _RATE_LIMITERS.get(key)
+    if limiter is None:
+        limiter = _RATE_LIMITERS[key] = RateLimiter(rpm, tpm)
+    elif (limiter.rpm, limiter.tpm) != (rpm, tpm):
+        limiter.configure(rpm, tpm)
+    return limiter
+
+
+# 当前调用的限速闸门，由 rate_limit_async_func_call 设置
+_rate_limit_gate: ContextVar[Optional[Callable]] = ContextVar(
+    "rate_limit_gate", default=None
+)
+
+
+async def wait_for_rate_limit():
+    """
+    LLM 与 embedding 实现在发出网络请求之前调用，按当前调用的限速配置等待额度；
+    未配置限速时立即返回。命中缓存而没有发出请求的调用不占用额度，重试的每次请求都会占用额度。
+    不调用本函数的自定义模型函数由 rate_limit_async_func_call 在调用前统一等待额度。
+    """
+    gate = _rate_limit_gate.get()
+    if gate is not None:
+        await gate()
+
+
+def _llm_call_texts(args: tuple, kwargs: dict) -> list[str]:
+    prompt = args[0] if args else kwargs.get("prompt", "")
+    system_prompt = args[1] if len(args) > 1 else kwargs.get("system_prompt")
+    history_messages = args[2] if len(args) > 2 else kwargs.get("history_messages", [])
+    texts = [prompt, system_prompt or ""]
+    texts.extend(
+        m["content"] for m in history_messages or [] if isinstance(m.get("content"), str)
+    )
+    return texts
+
+
+def rate_limit_async_func_call(
+    limiter: RateLimiter, kind: str = "llm", tiktoken_model_name: str = "qwen-plus"
+):
+    """
+    为 LLM（kind="llm"）或 embedding（kind="embedding"）函数加上 RPM/TPM 限速。
+
+    LLM 调用按 prompt、system_prompt、history_messages 的 token 数加上 max_tokens 预留额度，
+    返回后按 prompt 与回复的实际 token 数修正，流式回复在结束后修正；embedding 调用按输入文本的 token 数计算。
+
+    被包装的函数在发出请求前调用 wait_for_rate_limit 时按实际请求占用额度；在观察到这样的调用之前，
+    每次调用前先预留一次额度（被包装函数随后的第一次 wait_for_rate_limit 使用这份额度），
+    保证不调用 wait_for_rate_limit 的自定义函数同样受限速约束。
+    """
+    # 被包装的函数是否调用过 wait_for_rate_limit
+    gate_used = False
+
+    def count_tokens(texts: list[str]) -> int:
+        if limiter.tpm is None:
+            return 0
+        return sum(
+            len(encode_string_by_tiktoken(t, model_name=tiktoken_model_name))
+            for t in texts
+            if t
+        )
+
+    def final_decro(func):
         @wraps(func)
         async def wait_func(*args, **kwargs):
-            nonlocal __current_size
-            while __current_size >= max_size:
-                await asyncio.sleep(waitting_time)
-            __current_size += 1
-            result = await func(*args, **kwargs)
-            __current_size -= 1
+            if kind == "llm":
+                prompt_tokens = count_tokens(_llm_call_texts(args, kwargs))
+                estimated = prompt_tokens + (kwargs.get("max_tokens") or 0)
+            else:
+                texts = args[0] if args else kwargs.get("texts", [])
+                prompt_tokens = estimated = count_tokens(list(texts))
+            records = []
+            outer_gate = _rate_limit_gate.get()
+            prepaid = []
+
+            async def acquire():
+                if outer_gate is not None:
+                    await outer_gate()
+                records.append(await limiter.acquire(estimated))
+
+            async def gate():
+                nonlocal gate_used
+                gate_used = True
+                if prepaid:
+                    prepaid.pop()
+                    return
+                await acquire()
+
+            if not gate_used:
+                await acquire()
+                prepaid.append(True)
+            token = _rate_limit_gate.set(gate)
+            try:
+                result = await func(*args, **kwargs)
+            finally:
+                _rate_limit_gate.reset(token)
+            if records and kind == "llm":
+                if isinstance(result, str):
+                    limiter.adjust(records[-1], prompt_tokens + count_tokens([result]))
+                elif hasattr(result, "__aiter__"):
+                    return _WatchedStream(
+                        result,
+                        lambda text: limiter.adjust(
+                            records[-1], prompt_tokens + count_tokens([text])
+                        ),
+                    )
             return result
 
+        wait_func.rate_limiter = limiter
         return wait_func
 
     return final_decro
 
 
+@dataclass
+class BatchedEmbeddingFunc(EmbeddingFunc):
+    """
+    合并并发调用的 EmbeddingFunc。max_wait 秒内到达的小批量调用合并为一次最多
+    max_batch_size 条文本的请求，返回的向量按调用拆分给各调用方。
+    文本数不少于 max_batch_size 或带有额外参数的调用直接转发给 func。
+    """
+
+    max_batch_size: int = 32
+    max_wait: float = 0.005
+
+    def __post_init__(self):
+        # 等待合并的调用：(文本列表, future, 优先级)
+        self._pending: list[tuple[list[str], asyncio.Future, int]] = []
+        self._pending_size = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+        self._calls = 0
+        self._direct_calls = 0
+        self._batches = 0
+        self._batched_texts = 0
+
+    async def __call__(self, texts: list[str], *args, **kwargs) -> np.ndarray:
+        texts = list(texts)
+        if args or kwargs or not texts or len(texts) >= self.max_batch_size:
+            self._direct_calls += 1
+            return await self.func(texts, *args, **kwargs)
+
+        self._calls += 1
+        if self._pending_size + len(texts) > self.max_batch_size:
+            self._flush()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((texts, future, call_priority.get()))
+        self._pending_size += len(texts)
+        if self._pending_size >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.max_wait, self._flush
+            )
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        # 跳过已取消的调用
+        batch = [p for p in self._pending if not p[1].done()]
+        self._pending = []
+        self._pending_size = 0
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list[tuple[list[str], asyncio.Future, int]]):
+        texts = [text for item_texts, _, _ in batch for text in item_texts]
+        self._batches += 1
+        self._batched_texts += len(texts)
+        # 合并请求不继承触发它的调用的限速闸门，以批内最高的优先级排队
+        _rate_limit_gate.set(None)
+        try:
+            with priority_scope(min(priority for _, _, priority in batch)):
+                embeddings = await self.func(texts)
+        except BaseException as e:
+            for _, future, _ in batch:
+                if future.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        offset = 0
+        for item_texts, future, _ in batch:
+            if not future.done():
+                future.set_result(embeddings[offset : offset + len(item_texts)])
+            offset += len(item_texts)
+
+    def metrics(self) -> dict:
+        """
+        合并情况统计：batch_fill 为合并请求的平均填充率（平均文本数 / max_batch_size）。
+        """
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait": self.max_wait,
+            "batched_calls": self._calls,
+            "direct_calls": self._direct_calls,
+            "batches": self._batches,
+            "avg_batch_size": self._batched_texts / self._batches if self._batches else 0.0,
+            "batch_fill": (
+                self._batched_texts / (self._batches * self.max_batch_size)
+                if self._batches
+                else 0.0
+            ),
+        }
+
+
 def wrap_embedding_func_with_attrs(**kwargs):
     """Wrap a function with attributes"""
 
@@ -120,38 +630,135 @@ def write_json(json_obj, file_name):
         json.dump(json_obj, f, indent=2, ensure_ascii=False)
 
 
-def encode_string_by_tiktoken(content: str, model_name: str = "qwen-plus"):
+def current_rss_bytes() -> int:
+    """Resident set size of this process, 0 where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _get_tokenizer(model_name: str):
     if model_name.startswith("qwen"):
         global QWEN_TOKENIZER
         if QWEN_TOKENIZER is None:
             QWEN_TOKENIZER = get_tokenizer(model_name)
-            
-        tokens = QWEN_TOKENIZER.encode(content)
-        return tokens
-    
+        return QWEN_TOKENIZER
+
     global ENCODER
     if ENCODER is None:
         ENCODER = tiktoken.encoding_for_model(model_name)
-    tokens = ENCODER.encode(content)
+    return ENCODER
+
+
+def encode_string_by_tiktoken(content: str, model_name: str = "qwen-plus"):
+    tokens = _get_tokenizer(model_name).encode(content)
     return tokens
 
 
+def tokenizer_split_size(model_name: str = "qwen-plus") -> Optional[int]:
+    """Length in characters of the pieces a tokenizer splits long input into before encoding.
+
+    dashscope's QwenTokenizer groups the lines of inputs longer than this into
+    pieces of at most this many characters and encodes every piece on its own,
+    so its tokens depend on where those pieces end. None when the tokenizer
+    encodes its whole input at once (tiktoken, older dashscope versions).
+    """
+    split_text = getattr(_get_tokenizer(model_name), "_split_text", None)
+    if split_text is None:
+        return None
+    return inspect.signature(split_text).parameters["chunk_size"].default
+
+
 def decode_tokens_by_tiktoken(tokens: list[int], model_name: str = "qwen-plus"):
-    if model_name.startswith("qwen"):
-        global QWEN_TOKENIZER
-        if QWEN_TOKENIZER is None:
-            QWEN_TOKENIZER = get_tokenizer(model_name)
-            
-        content = QWEN_TOKENIZER.decode(tokens)
-        return content
-    
-    global ENCODER
-    if ENCODER is None:
-        ENCODER = tiktoken.encoding_for_model(model_name)
-    content = ENCODER.decode(tokens)
+    content = _get_tokenizer(model_name).decode(tokens)
     return content
 
 
+_TOKEN_BYTE_LENGTHS: dict[str, np.ndarray] = {}
+_OFFSET_BLOCK_SIZE = 1 << 18
+
+
+def _token_byte_lengths(encoding: tiktoken.Encoding) -> np.ndarray:
+    """Lookup table of the UTF-8 byte length of every token id, built once per encoding"""
+    if encoding.name not in _TOKEN_BYTE_LENGTHS:
+        lengths = np.zeros(encoding.max_token_value + 1, dtype=np.int32)
+        for token in range(encoding.max_token_value + 1):
+            try:
+                lengths[token] = len(encoding.decode_single_token_bytes(token))
+            except KeyError:
+                # sparse vocabularies leave holes in the id space
+                continue
+        _TOKEN_BYTE_LENGTHS[encoding.name] = lengths
+    return _TOKEN_BYTE_LENGTHS[encoding.name]
+
+
+def encode_string_with_offsets(
+    content: str, model_name: str = "qwen-plus"
+) -> tuple[list[int], Union[np.ndarray, None], str]:
+    """Encode a string and map every token boundary back to a character offset.
+
+    Returns ``(tokens, offsets, content)``. ``offsets`` has ``len(tokens) + 1``
+    entries, so the text of ``tokens[i:j]`` is ``content[offsets[i]:offsets[j]]``.
+    The returned ``content`` is the string the offsets refer to: the Qwen
+    tokenizer NFC-normalizes its input before encoding. ``offsets`` is None when
+    the tokenizer does not expose per-token bytes, callers should then fall back
+    to ``decode_tokens_by_tiktoken``.
+
+    A character split across two tokens belongs to the token holding its first byte.
+    """
+    if model_name.startswith("qwen"):
+        content = unicodedata.normalize("NFC", content)
+    tokenizer = _get_tokenizer(model_name)
+    tokens = tokenizer.encode(content)
+
+    # dashscope's QwenTokenizer wraps a tiktoken.Encoding, the attribute name
+    # differs between dashscope versions
+    encoding = tokenizer
+    for attr in ("_tokenizer", "tokenizer"):
+        if isinstance(encoding, tiktoken.Encoding):
+            break
+        encoding = getattr(tokenizer, attr, None)
+    if not isinstance(encoding, tiktoken.Encoding):
+        return tokens, None, content
+
+    # work in blocks of tokens so the temporary arrays stay small for huge documents
+    table = _token_byte_lengths(encoding)
+    raw = None if content.isascii() else content.encode("utf-8")
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    byte_pos = 0
+    char_pos = 0
+    for block_start in range(0, len(tokens), _OFFSET_BLOCK_SIZE):
+        block = tokens[block_start : block_start + _OFFSET_BLOCK_SIZE]
+        byte_lengths = table[np.asarray(block, dtype=np.int32)]
+        if raw is None:
+            char_lengths = byte_lengths
+        else:
+            # count the UTF-8 lead bytes (anything but 0b10xxxxxx) inside every token
+            block_bytes = int(byte_lengths.sum(dtype=np.int64))
+            if byte_pos + block_bytes > len(raw):
+                return tokens, None, content
+            token_starts = np.zeros(len(block), dtype=np.int64)
+            np.cumsum(byte_lengths[:-1], out=token_starts[1:])
+            block_raw = np.frombuffer(
+                raw, dtype=np.uint8, count=block_bytes, offset=byte_pos
+            )
+            char_lengths = np.add.reduceat(
+                (block_raw & 0xC0) != 0x80, token_starts, dtype=np.int64
+            )
+            byte_pos += block_bytes
+        block_offsets = offsets[block_start + 1 : block_start + 1 + len(block)]
+        np.cumsum(char_lengths, out=block_offsets)
+        block_offsets += char_pos
+        char_pos = int(block_offsets[-1])
+
+    if char_pos != len(content):
+        # special tokens or a lossy tokenizer, offsets would not line up
+        return tokens, None, content
+    return tokens, offsets, content
+
+
 def pack_user_ass_to_openai_messages(*args: str):
     roles = ["user", "assistant"]
     return [
@@ -0,0 +1,488 @@
+"""
+二进制快照加增量日志的 NetworkX 图存储。
+
+图数据保存在 graph_{namespace}/ 目录下：
+
+    snapshot.bin  某一时刻整张图的二进制快照
+    delta.log     快照之后变更的节点与边，只追加写入
+
+快照按列保存：节点 id 表、节点属性列、边的两端（节点 id 表中的下标）、边属性列。
+字符串列保存为 字符数组 + 一整块 UTF-8 文本，加载时整块解码后按字符偏移切片；
+int、float、bool 列以 numpy 数组保存；类型不一致的列退化为逐个值的 JSON。
+
+delta.log 的记录格式与 WALKVStorage 相同，每条记录是一个节点或一条边在落盘时的完整状态
+（存在则为全部属性，不存在则为删除），重放顺序与结果无关。日志第一条记录是快照的代号，
+代号与快照不一致的日志是压缩之前的旧日志，加载时被丢弃。
+
+index_done_callback 只追加上次落盘后改动过的节点与边；delta.log 超过快照大小的
+compaction_ratio 倍（且不小于 compaction_min_bytes）时压缩：写出新快照后以新代号重建 delta.log。
+
+首次启动时若存在旧的 graph_{namespace}.graphml，其内容会被导入为快照，旧文件保留不变；
+export_graphml / import_graphml 用于与读取 GraphML 的工具交换数据。
+"""
+
+import asyncio
+import json
+import os
+import struct
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import networkx as nx
+import numpy as np
+
+from .storage import NetworkXStorage
+from .utils import logger
+from .wal_kv import _append_records, _decode, _encode, _pack, _read_records
+
+_MAGIC = b"LRGRAPH1"
+# 代号、是否有向、节点数、边数
+_HEADER = struct.Struct("<QBII")
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+# 列中缺失的值
+_MISSING = object()
+# delta.log 中编码后不小于该长度的记录以 zlib 压缩保存
+_COMPRESS_BYTES = 1024
+
+# delta.log 的记录类型
+_GENERATION = "G"
+_NODE = "N"
+_NODE_DELETED = "n"
+_EDGE = "E"
+_EDGE_DELETED = "e"
+
+
+# ---------------------------------------------------------------- 快照编码
+
+
+def _encode_strings(values: list[str]) -> bytes:
+    lengths = np.fromiter((len(v) for v in values), dtype=np.uint32, count=len(values))
+    text = "".join(values).encode("utf-8", "surrogatepass")
+    return lengths.tobytes() + _U64.pack(len(text)) + text
+
+
+def _column_type(values: list) -> str:
+    types = {type(v) for v in values if v is not _MISSING}
+    if types == {str}:
+        return "s"
+    if types == {bool}:
+        return "b"
+    if types == {float}:
+        return "f"
+    if types == {int} and all(-(2**63) <= v < 2**63 for v in values if v is not _MISSING):
+        return "i"
+    return "j"
+
+
+def _encode_column(name: str, values: list) -> bytes:
+    kind = _column_type(values)
+    present = np.fromiter(
+        (v is not _MISSING for v in values), dtype=bool, count=len(values)
+    )
+    parts = [_encode_strings([name]), kind.encode("ascii")]
+    if present.all():
+        parts.append(b"\x01")
+    else:
+        parts.append(b"\x00")
+        parts.append(np.packbits(present).tobytes())
+        values = [v for v in values if v is not _MISSING]
+    if kind == "s":
+        parts.append(_encode_strings(values))
+    elif kind == "j":
+        parts.append(
+            _encode_strings(
+                [json.dumps(v, ensure_ascii=False, separators=(",", ":")) for v in values]
+            )
+        )
+    else:
+        dtype = {"b": np.uint8, "f": np.float64, "i": np.int64}[kind]
+        parts.append(np.asarray(values, dtype=dtype).tobytes())
+    return b"".join(parts)
+
+
+def _encode_columns(attrs: list[dict]) -> bytes:
+    names = list(dict.fromkeys(name for data in attrs for name in data))
+    parts = [_U32.pack(len(names))]
+    for name in names:
+        parts.append(_encode_column(name, [data.get(name, _MISSING) for data in attrs]))
+    return b"".join(parts)
+
+
+def _encode_graph(
+    generation: int, directed: bool, nodes: list[tuple[str, dict]], edges: list[tuple]
+) -> bytes:
+    position = {node: i for i, (node, _) in enumerate(nodes)}
+    sources = np.fromiter((position[e[0]] for e in edges), dtype=np.uint32, count=len(edges))
+    targets = np.fromiter((position[e[1]] for e in edges), dtype=np.uint32, count=len(edges))
+    return b"".join(
+        [
+            _MAGIC,
+            _HEADER.pack(generation, directed, len(nodes), len(edges)),
+            _encode_strings([node for node, _ in nodes]),
+            # 图在其他协程中可能被修改，复制属性时不遍历正在变化的字典
+            _encode_columns([dict(data) for _, data in nodes]),
+            sources.tobytes(),
+            targets.tobytes(),
+            _encode_columns([dict(e[2]) for e in edges]),
+        ]
+    )
+
+
+def _graph_items(graph: nx.Graph) -> tuple[list, list]:
+    """(节点, 属性) 与 (起点, 终点, 属性) 列表，无向图直接遍历邻接表，比 graph.edges(data=True) 快"""
+    nodes = list(graph.nodes(data=True))
+    if graph.is_directed():
+        return nodes, list(graph.edges(data=True))
+    edges = []
+    seen = set()
+    for source, neighbors in graph.adjacency():
+        for target, data in neighbors.items():
+            if target not in seen:
+                edges.append((source, target, data))
+        seen.add(source)
+    return nodes, edges
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def take(self, size: int) -> memoryview:
+        start = self.offset
+        self.offset += size
+        if self.offset > len(self.data):
+            raise ValueError("Truncated graph snapshot")
+        return self.data[start : self.offset]
+
+    def array(self, dtype, count: int) -> np.ndarray:
+        return np.frombuffer(self.take(np.dtype(dtype).itemsize * count), dtype=dtype)
+
+    def strings(self, count: int) -> list[str]:
+        ends = np.cumsum(self.array(np.uint32, count), dtype=np.int64).tolist()
+        (size,) = _U64.unpack(self.take(_U64.size))
+        text = str(self.take(size), "utf-8", "surrogatepass")
+        starts = [0] + ends[:-1]
+        return [text[start:end] for start, end in zip(starts, ends)]
+
+
+def _decode_columns(reader: _Reader, count: int) -> list[dict]:
+    (column_count,) = _U32.unpack(reader.take(_U32.size))
+    names, columns = [], []
+    complete = True
+    for _ in range(column_count):
+        name = reader.strings(1)[0]
+        kind = bytes(reader.take(1)).decode("ascii")
+        present = None
+        if reader.take(1)[0] == 0:
+            present = np.unpackbits(reader.array(np.uint8, (count + 7) // 8), count=count)
+            present = present.astype(bool)
+            complete = False
+        size = count if present is None else int(present.sum())
+        if kind == "s":
+            values = reader.strings(size)
+        elif kind == "j":
+            values = [json.loads(v) for v in reader.strings(size)]
+        elif kind == "b":
+            values = reader.array(np.uint8, size).astype(bool).tolist()
+        else:
+            values = reader.array(np.float64 if kind == "f" else np.int64, size).tolist()
+        if present is not None:
+            column = [_MISSING] * count
+            for i, value in zip(np.flatnonzero(present).tolist(), values):
+                column[i] = value
+            values = column
+        names.append(name)
+        columns.append(values)
+    if not names:
+        return [{} for _ in range(count)]
+    if complete:
+        return [dict(zip(names, row)) for row in zip(*columns)]
+    return [
+        {name: value for name, value in zip(names, row) if value is not _MISSING}
+        for row in zip(*columns)
+    ]
+
+
+def _decode_graph(data: bytes) -> tuple[int, nx.Graph]:
+    """解码快照，返回 (代号, 图)"""
+    reader = _Reader(data)
+    if bytes(reader.take(len(_MAGIC))) != _MAGIC:
+        raise ValueError("Not a graph snapshot")
+    generation, directed, node_count, edge_count = _HEADER.unpack(
+        reader.take(_HEADER.size)
+    )
+    nodes = reader.strings(node_count)
+    node_attrs = _decode_columns(reader, node_count)
+    sources = reader.array(np.uint32, edge_count).tolist()
+    targets = reader.array(np.uint32, edge_count).tolist()
+    edge_attrs = _decode_columns(reader, edge_count)
+
+    graph = nx.DiGraph() if directed else nx.Graph()
+    graph.add_nodes_from(zip(nodes, node_attrs))
+    graph.add_edges_from(
+        (nodes[source], nodes[target], data)
+        for source, target, data in zip(sources, targets, edge_attrs)
+    )
+    return generation, graph
+
+
+def write_graph_snapshot(graph: nx.Graph, file_name: str, generation: int = 0):
+    """把整张图写成二进制快照（先写临时文件再替换）"""
+    nodes, edges = _graph_items(graph)
+    _write_file(file_name, _encode_graph(generation, graph.is_directed(), nodes, edges))
+
+
+def read_graph_snapshot(file_name: str) -> Optional[nx.Graph]:
+    if not os.path.exists(file_name):
+        return None
+    with open(file_name, "rb") as f:
+        return _decode_graph(f.read())[1]
+
+
+def _write_file(path: str, data: bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _record(kind: str, value: list) -> bytes:
+    return _pack(kind, _encode(value, _COMPRESS_BYTES))
+
+
+def _reset_log(path: str, generation: int):
+    _write_file(path, _pack(_GENERATION, str(generation).encode("ascii")))
+
+
+# ---------------------------------------------------------------- 存储
+
+
+@dataclass
+class WALNetworkXStorage(NetworkXStorage):
+    """
+    接口与 NetworkXStorage 相同，可作为 graph_storage 直接替换；落盘时不再重写整个 GraphML 文件。
+    """
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._dir = os.path.join(working_dir, f"graph_{self.namespace}")
+        os.makedirs(self._dir, exist_ok=True)
+        self._snapshot_file = os.path.join(self._dir, "snapshot.bin")
+        self._log_file = os.path.join(self._dir, "delta.log")
+        self._graphml_xml_file = os.path.join(
+            working_dir, f"graph_{self.namespace}.graphml"
+        )
+        self.compaction_ratio = self.global_config.get(
+            "graph_wal_compaction_ratio", 1.0
+        )
+        self.compaction_min_bytes = self.global_config.get(
+            "graph_wal_compaction_min_bytes", 64 * 1024 * 1024
+        )
+        self._node_embed_algorithms = {
+            "node2vec": self._node2vec_embed,
+        }
+
+        self._graph = nx.Graph()
+        self._generation = 0
+        self._snapshot_bytes = 0
+        self._log_bytes = 0
+        # 上次落盘后改动过的节点与边（无向图的边两端按字典序排列）
+        self._dirty_nodes: set[str] = set()
+        self._dirty_edges: set[tuple[str, str]] = set()
+        self._lock = asyncio.Lock()
+
+        self._load()
+        logger.info(
+            f"Loaded graph {self.namespace} with {self._graph.number_of_nodes()} nodes, "
+            f"{self._graph.number_of_edges()} edges (snapshot {self._snapshot_bytes} bytes, "
+            f"delta {self._log_bytes} bytes)"
+        )
+
+    # ---------------------------------------------------------------- 加载
+
+    def _load(self):
+        if not os.path.exists(self._snapshot_file):
+            self._migrate_graphml()
+            return
+        with open(self._snapshot_file, "rb") as f:
+            data = f.read()
+        self._snapshot_bytes = len(data)
+        self._generation, self._graph = _decode_graph(data)
+
+        records, self._log_bytes, size = _read_records(self._log_file)
+        if not records or records[0] != (_GENERATION, str(self._generation).encode("ascii")):
+            # 压缩时写完新快照、重建日志之前中断，旧日志中的变更已包含在快照中
+            if records:
+                logger.warning(f"Discarding stale graph delta log {self._log_file}")
+            _reset_log(self._log_file, self._generation)
+            self._log_bytes = os.path.getsize(self._log_file)
+            return
+        for kind, value in records[1:]:
+            self._replay(kind, _decode(value))
+        if self._log_bytes < size:
+            logger.warning(f"Truncating incomplete graph record in {self._log_file}")
+            with open(self._log_file, "r+b") as f:
+                f.truncate(self._log_bytes)
+
+    def _replay(self, kind: str, value: list):
+        graph = self._graph
+        if kind == _NODE:
+            node, data = value
+            graph.add_node(node)
+            graph.nodes[node].clear()
+            graph.nodes[node].update(data)
+        elif kind == _NODE_DELETED:
+            if graph.has_node(value[0]):
+                graph.remove_node(value[0])
+        elif kind == _EDGE:
+            source, target, data = value
+            graph.add_edge(source, target)
+            graph.edges[source, target].clear()
+            graph.edges[source, target].update(data)
+        elif kind == _EDGE_DELETED:
+            if graph.has_edge(value[0], value[1]):
+                graph.remove_edge(value[0], value[1])
+
+    def _migrate_graphml(self):
+        graph = NetworkXStorage.load_nx_graph(self._graphml_xml_file)
+        if graph is not None:
+            logger.info(
+                f"Migrating graph with {graph.number_of_nodes()} nodes, "
+                f"{graph.number_of_edges()} edges from {self._graphml_xml_file}"
+            )
+            self._graph = graph
+        nodes, edges = _graph_items(self._graph)
+        data = _encode_graph(self._generation, self._graph.is_directed(), nodes, edges)
+        self._write_snapshot_sync(data, self._generation)
+
+    # ---------------------------------------------------------------- 落盘
+
+    def _write_snapshot_sync(self, data: bytes, generation: int):
+        _write_file(self._snapshot_file, data)
+        _reset_log(self._log_file, generation)
+        self._generation = generation
+        self._snapshot_bytes = len(data)
+        self._log_bytes = os.path.getsize(self._log_file)
+
+    def _edge_key(self, source: str, target: str) -> tuple[str, str]:
+        if not self._graph.is_directed() and target < source:
+            return target, source
+        return source, target
+
+    def _pending_records(self) -> list[bytes]:
+        """改动过的节点与边在当前的完整状态"""
+        graph = self._graph
+        records = []
+        for node in self._dirty_nodes:
+            if graph.has_node(node):
+                records.append(_record(_NODE, [node, graph.nodes[node]]))
+            else:
+                records.append(_record(_NODE_DELETED, [node]))
+        for source, target in self._dirty_edges:
+            if graph.has_edge(source, target):
+                data = graph.edges[source, target]
+                records.append(_record(_EDGE, [source, target, data]))
+            else:
+                records.append(_record(_EDGE_DELETED, [source, target]))
+        self._dirty_nodes = set()
+        self._dirty_edges = set()
+        return records
+
+    async def index_done_callback(self):
+        async with self._lock:
+            if not self._dirty_nodes and not self._dirty_edges:
+                return
+            loop = asyncio.get_running_loop()
+            records = self._pending_records()
+            self._log_bytes += sum(len(record) for record in records)
+            if self._log_bytes > max(
+                self.compaction_min_bytes, self._snapshot_bytes * self.compaction_ratio
+            ):
+                await self._compact()
+                return
+            await loop.run_in_executor(None, _append_records, self._log_file, records)
+
+    async def _compact(self):
+        """把整张图写成新快照，并以新代号重建 delta.log"""
+        loop = asyncio.get_running_loop()
+        generation = self._generation + 1
+        nodes, edges = _graph_items(self._graph)
+        # 编码期间的改动记在新的 dirty 集合中，下次落盘写入新日志
+        data = await loop.run_in_executor(
+            None, _encode_graph, generation, self._graph.is_directed(), nodes, edges
+        )
+        await loop.run_in_executor(None, self._write_snapshot_sync, data, generation)
+        logger.info(
+            f"Compacted graph {self.namespace}: {len(nodes)} nodes, {len(edges)} edges, "
+            f"snapshot {self._snapshot_bytes} bytes"
+        )
+
+    # ---------------------------------------------------------------- 图存储接口
+
+    async def upsert_node(self, node_id: str, node_data: dict[str, str]):
+        self._graph.add_node(node_id, **node_data)
+        self._dirty_nodes.add(node_id)
+
+    async def upsert_edge(
+        self, source_node_id: str, target_node_id: str, edge_data: dict[str, str]
+    ):
+        # add_edge 会创建不存在的端点
+        for node_id in (source_node_id, target_node_id):
+            if not self._graph.has_node(node_id):
+                self._dirty_nodes.add(node_id)
+        self._graph.add_edge(source_node_id, target_node_id, **edge_data)
+        self._dirty_edges.add(self._edge_key(source_node_id, target_node_id))
+
+    async def delete_node(self, node_id: str):
+        """
+        删除节点及其所有边。
+
+        :param node_id: 要删除的节点 id
+        """
+        if self._graph.has_node(node_id):
+            for source, target in list(self._graph.edges(node_id)):
+                self._dirty_edges.add(self._edge_key(source, target))
+            self._graph.remove_node(node_id)
+            self._dirty_nodes.add(node_id)
+            logger.info(f"Node {node_id} deleted from the graph.")
+        else:
+            logger.warning(f"Node {node_id} not found in the graph for deletion.")
+
+    # ---------------------------------------------------------------- GraphML
+
+    async def export_graphml(self, file_name: Optional[str] = None) -> str:
+        """把当前图写成 GraphML，默认写到 NetworkXStorage 使用的 graph_{namespace}.graphml"""
+        file_name = file_name or self._graphml_xml_file
+        graph = self._graph.copy()
+        await asyncio.get_running_loop().run_in_executor(
+            None, NetworkXStorage.write_nx_graph, graph, file_name
+        )
+        return file_name
+
+    async def import_graphml(self, file_name: str):
+        """用 GraphML 文件的内容替换当前图，并立即写出新快照"""
+        graph = await asyncio.get_running_loop().run_in_executor(
+            None, NetworkXStorage.load_nx_graph, file_name
+        )
+        if graph is None:
+            raise FileNotFoundError(file_name)
+        async with self._lock:
+            self._graph = graph
+            self._dirty_nodes = set()
+            self._dirty_edges = set()
+            await self._compact()
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "nodes": self._graph.number_of_nodes(),
+            "edges": self._graph.number_of_edges(),
+            "pending_nodes": len(self._dirty_nodes),
+            "pending_edges": len(self._dirty_edges),
+            "snapshot_bytes": self._snapshot_bytes,
+            "delta_bytes": self._log_bytes,
+            "generation": self._generation,
+        }
@@ -0,0 +1,308 @@
+"""
+基于预写日志（WAL）的 KV 存储。
+
+数据保存在 kv_store_{namespace}/ 目录下：
+
+    snapshot.bin  某一时刻全部数据的快照
+    wal.log       快照之后的变更，只追加写入
+
+两个文件的记录格式相同：
+
+    key 长度 (uint32) | value 长度 (uint32) | CRC32 (uint32) | key | value
+
+value 以紧凑编码保存：首字节为 b"j" 时其后是无缩进的 JSON，为 b"z" 时其后是 zlib 压缩的 JSON。
+快照以 mmap 方式打开，加载时只读取记录头部建立 key 到 value 位置的索引，get_by_id 按位置读出单个 value；
+快照之后写入的 value 以编码后的 bytes 保存在内存中，落盘时直接写出，无需重新序列化。
+
+index_done_callback 只把上次落盘后新增的 key 追加到 wal.log；wal.log 超过快照大小的
+compaction_ratio 倍（且不小于 compaction_min_bytes）时压缩：写出新快照后清空 wal.log。
+文件读写在线程池中执行，不阻塞事件循环。加载时索引快照并重放 wal.log，wal.log 末尾不完整或校验失败的记录被截断。
+
+首次启动时若存在旧的 kv_store_{namespace}.json，其内容会被导入为快照，旧文件保留不变。
+"""
+
+import asyncio
+import json
+import mmap
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Optional, Union
+
+from .base import BaseKVStorage
+from .utils import load_json, logger
+
+_HEADER = struct.Struct("<III")
+
+
+def _encode(value: dict, compress_bytes: int) -> bytes:
+    data = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(data) >= compress_bytes:
+        compressed = zlib.compress(data, 1)
+        if len(compressed) < len(data):
+            return b"z" + compressed
+    return b"j" + data
+
+
+def _decode(data: bytes) -> dict:
+    if data[:1] == b"z":
+        return json.loads(zlib.decompress(data[1:]))
+    return json.loads(data[1:])
+
+
+def _pack(key: str, value: bytes) -> bytes:
+    key_bytes = key.encode("utf-8")
+    body = key_bytes + value
+    return _HEADER.pack(len(key_bytes), len(value), zlib.crc32(body)) + body
+
+
+def _read_records(path: str) -> tuple[list[tuple[str, bytes]], int, int]:
+    """
+    读取文件中的全部记录。
+
+    Returns:
+        tuple[list, int, int]: (key, value) 列表、有效数据的长度与文件长度
+    """
+    if not os.path.exists(path):
+        return [], 0, 0
+    with open(path, "rb") as f:
+        data = f.read()
+    records = []
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        key_len, value_len, crc = _HEADER.unpack_from(data, offset)
+        start = offset + _HEADER.size
+        end = start + key_len + value_len
+        if end > len(data):
+            break
+        body = data[start:end]
+        if zlib.crc32(body) != crc:
+            break
+        key = body[:key_len].decode("utf-8")
+        records.append((key, body[key_len:]))
+        offset = end
+    return records, offset, len(data)
+
+
+def _append_records(path: str, records: list[bytes]):
+    with open(path, "ab") as f:
+        f.write(b"".join(records))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _index_snapshot(snapshot: mmap.mmap) -> dict[str, tuple[int, int]]:
+    """
+    读取快照中所有记录的头部，返回 key -> (value 偏移, value 长度)。
+    快照写完并 fsync 后才替换旧快照，不会出现不完整的记录，因此不校验 CRC。
+    """
+    index = {}
+    offset = 0
+    size = len(snapshot)
+    while offset + _HEADER.size <= size:
+        key_len, value_len, _ = _HEADER.unpack_from(snapshot, offset)
+        start = offset + _HEADER.size
+        index[snapshot[start : start + key_len].decode("utf-8")] = (
+            start + key_len,
+            value_len,
+        )
+        offset = start + key_len + value_len
+    return index
+
+
+def _write_snapshot(
+    path: str, items: list[tuple[str, Union[bytes, tuple]]], source: Optional[mmap.mmap]
+) -> list[int]:
+    """
+    写出新快照，value 为 (偏移, 长度) 时从旧快照 source 中读取。
+
+    Returns:
+        list[int]: 各 value 在新快照中的偏移
+    """
+    tmp_path = path + ".tmp"
+    offsets = []
+    offset = 0
+    with open(tmp_path, "wb") as f:
+        for i in range(0, len(items), 4096):
+            records = []
+            for key, value in items[i : i + 4096]:
+                if isinstance(value, tuple):
+                    value = source[value[0] : value[0] + value[1]]
+                record = _pack(key, value)
+                offset += len(record)
+                offsets.append(offset - len(value))
+                records.append(record)
+            f.write(b"".join(records))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return offsets
+
+
+def _open_snapshot(path: str) -> Optional[mmap.mmap]:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+@dataclass
+class WALKVStorage(BaseKVStorage):
+    """
+    日志结构的 KV 存储，接口与 JsonKVStorage 相同，可作为 kv_storage 直接替换。
+    """
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._dir = os.path.join(working_dir, f"kv_store_{self.namespace}")
+        os.makedirs(self._dir, exist_ok=True)
+        self._snapshot_file = os.path.join(self._dir, "snapshot.bin")
+        self._wal_file = os.path.join(self._dir, "wal.log")
+        self.compaction_ratio = self.global_config.get("kv_wal_compaction_ratio", 1.0)
+        self.compaction_min_bytes = self.global_config.get(
+            "kv_wal_compaction_min_bytes", 64 * 1024 * 1024
+        )
+        self.compress_bytes = self.global_config.get("kv_wal_compress_bytes", 1024)
+
+        # key -> 快照中的 (value 偏移, value 长度)，或快照之后写入的编码后的 value
+        self._data: dict[str, Union[tuple[int, int], bytes]] = {}
+        self._snapshot: Optional[mmap.mmap] = None
+        # 上次落盘后新增的 key -> 编码后的 value
+        self._pending: dict[str, bytes] = {}
+        self._snapshot_bytes = 0
+        self._wal_bytes = 0
+        # drop 之后下次落盘重写快照
+        self._rewrite = False
+        self._lock = asyncio.Lock()
+
+        self._load()
+        logger.info(
+            f"Load KV {self.namespace} with {len(self._data)} data "
+            f"(snapshot {self._snapshot_bytes} bytes, wal {self._wal_bytes} bytes)"
+        )
+
+    def _load(self):
+        if not os.path.exists(self._snapshot_file) and not os.path.exists(
+            self._wal_file
+        ):
+            self._migrate_json()
+            return
+        self._snapshot = _open_snapshot(self._snapshot_file)
+        if self._snapshot is not None:
+            self._data = _index_snapshot(self._snapshot)
+            self._snapshot_bytes = len(self._snapshot)
+        records, self._wal_bytes, size = _read_records(self._wal_file)
+        for key, value in records:
+            self._data[key] = value
+        if self._wal_bytes < size:
+            logger.warning(f"Truncating incomplete KV record in {self._wal_file}")
+            with open(self._wal_file, "r+b") as f:
+                f.truncate(self._wal_bytes)
+
+    def _migrate_json(self):
+        json_file = os.path.join(
+            self.global_config["working_dir"], f"kv_store_{self.namespace}.json"
+        )
+        data = load_json(json_file)
+        if not data:
+            return
+        logger.info(f"Migrating {len(data)} KV {self.namespace} entries from {json_file}")
+        items = [(key, _encode(value, self.compress_bytes)) for key, value in data.items()]
+        offsets = _write_snapshot(self._snapshot_file, items, None)
+        self._snapshot = _open_snapshot(self._snapshot_file)
+        self._snapshot_bytes = len(self._snapshot)
+        self._data = {
+            key: (offset, len(value)) for (key, value), offset in zip(items, offsets)
+        }
+
+    async def all_keys(self) -> list[str]:
+        return list(self._data.keys())
+
+    async def index_done_callback(self):
+        async with self._lock:
+            if not self._pending and not self._rewrite:
+                return
+            loop = asyncio.get_running_loop()
+            pending, self._pending = self._pending, {}
+            records = [_pack(key, value) for key, value in pending.items()]
+            self._wal_bytes += sum(len(record) for record in records)
+
+            if self._rewrite or self._wal_bytes > max(
+                self.compaction_min_bytes, self._snapshot_bytes * self.compaction_ratio
+            ):
+                await self._compact()
+                return
+            await loop.run_in_executor(None, _append_records, self._wal_file, records)
+
+    async def _compact(self):
+        """把当前全部数据写成新快照并清空 wal.log"""
+        loop = asyncio.get_running_loop()
+        items = list(self._data.items())
+        offsets = await loop.run_in_executor(
+            None, _write_snapshot, self._snapshot_file, items, self._snapshot
+        )
+        # 快照已包含 wal.log 中的全部变更，清空前崩溃时重放 wal.log 结果不变
+        with open(self._wal_file, "wb"):
+            pass
+        old_snapshot, self._snapshot = self._snapshot, _open_snapshot(self._snapshot_file)
+        for (key, value), offset in zip(items, offsets):
+            # 只替换仍指向本次写出的 value 的 key
+            if self._data.get(key) is value:
+                self._data[key] = (offset, len(value) if isinstance(value, bytes) else value[1])
+        if old_snapshot is not None:
+            old_snapshot.close()
+        self._snapshot_bytes = 0 if self._snapshot is None else len(self._snapshot)
+        self._wal_bytes = 0
+        self._rewrite = False
+        logger.info(
+            f"Compacted KV {self.namespace}: {len(items)} data, "
+            f"snapshot {self._snapshot_bytes} bytes"
+        )
+
+    def _value(self, value: Union[tuple[int, int], bytes]) -> bytes:
+        if isinstance(value, tuple):
+            return self._snapshot[value[0] : value[0] + value[1]]
+        return value
+
+    async def get_by_id(self, id: str) -> Union[dict, None]:
+        value = self._data.get(id)
+        return None if value is None else _decode(self._value(value))
+
+    async def get_by_ids(self, ids, fields=None):
+        results = []
+        for id in ids:
+            value = await self.get_by_id(id)
+            if value is not None and fields is not None:
+                value = {k: v for k, v in value.items() if k in fields}
+            results.append(value)
+        return results
+
+    async def filter_keys(self, data: list[str]) -> set[str]:
+        return set([s for s in data if s not in self._data])
+
+    async def upsert(self, data: dict[str, dict]):
+        left_data = {k: v for k, v in data.items() if k not in self._data}
+        for key, value in left_data.items():
+            encoded = _encode(value, self.compress_bytes)
+            self._data[key] = encoded
+            self._pending[key] = encoded
+        return left_data
+
+    async def drop(self):
+        # 等待进行中的落盘完成，否则压缩结束时会清除 _rewrite，旧快照中的数据在重启后恢复
+        async with self._lock:
+            self._data = {}
+            self._pending = {}
+            self._rewrite = True
+
+    def metrics(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "memory_bytes": sum(
+                len(value) for value in self._data.values() if isinstance(value, bytes)
+            ),
+            "pending": len(self._pending),
+            "snapshot_bytes": self._snapshot_bytes,
+            "wal_bytes": self._wal_bytes,
+        }
@@ -1,6 +1,5 @@
 import re
 import json
-import asyncio
 from lightrag import LightRAG, QueryParam
 from tqdm import tqdm
 
@@ -16,27 +15,12 @@ def extract_queries(file_path):
     return queries
 
 
-async def process_query(query_text, rag_instance, query_param):
-    try:
-        result = await rag_instance.aquery(query_text, param=query_param)
-        return {"query": query_text, "result": result}, None
-    except Exception as e:
-        return None, {"query": query_text, "error": str(e)}
-
-
-def always_get_an_event_loop() -> asyncio.AbstractEventLoop:
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    return loop
-
-
 def run_queries_and_save_to_json(
-    queries, rag_instance, query_param, output_file, error_file
+    queries, rag_instance, query_param, output_file, error_file, max_concurrency=8
 ):
-    loop = always_get_an_event_loop()
+    # 结果按完成顺序返回；按问题顺序写入，前面的问题都已完成的结果立即写出
+    done = {}
+    next_index = 0
 
     with open(output_file, "a", encoding="utf-8") as result_file, open(
         error_file, "a", encoding="utf-8"
@@ -44,19 +28,36 @@ def run_queries_and_save_to_json(
         result_file.write("[\n")
         first_entry = True
 
-        for query_text in tqdm(queries, desc="Processing queries", unit="query"):
-            result, error = loop.run_until_complete(
-                process_query(query_text, rag_instance, query_param)
-            )
-
-            if result:
-                if not first_entry:
-                    result_file.write(",\n")
-                json.dump(result, result_file, ensure_ascii=False, indent=4)
-                first_entry = False
-            elif error:
-                json.dump(error, err_file, ensure_ascii=False, indent=4)
-                err_file.write("\n")
+        for index, result, error in tqdm(
+            rag_instance.query_batch(queries, query_param, max_concurrency),
+            total=len(queries),
+            desc="Processing queries",
+            unit="query",
+        ):
+            done[index] = (result, error)
+            while next_index in done:
+                result, error = done.pop(next_index)
+                if error is None:
+                    if not first_entry:
+                        result_file.write(",\n")
+                    json.dump(
+                        {"query": queries[next_index], "result": result},
+                        result_file,
+                        ensure_ascii=False,
+                        indent=4,
+                    )
+                    first_entry = False
+                else:
+                    json.dump(
+                        {"query": queries[next_index], "error": str(error)},
+                        err_file,
+                        ensure_ascii=False,
+                        indent=4,
+                    )
+                    err_file.write("\n")
+                result_file.flush()
+                err_file.flush()
+                next_index += 1
 
         result_file.write("\n]")
 
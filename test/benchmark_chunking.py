@@ -0,0 +1,117 @@
+"""
+对比文本切分的三种实现：逐窗口解码（旧实现）、偏移切片、流式切片。
+
+分别测试 tiktoken（gpt-4o-mini）和 dashscope 的 Qwen 分词器，输出耗时与峰值内存，
+并检查流式切分的结果与一次性切分是否相同。
+
+    python test/benchmark_chunking.py --size-mb 20
+"""
+
+import argparse
+import io
+import random
+import time
+import tracemalloc
+
+from lightrag.operate import chunking_by_token_size, chunking_by_token_size_stream
+from lightrag.utils import decode_tokens_by_tiktoken, encode_string_by_tiktoken
+
+
+def legacy_chunking_by_token_size(
+    content: str, overlap_token_size=128, max_token_size=1024, tiktoken_model="gpt-4o"
+):
+    tokens = encode_string_by_tiktoken(content, model_name=tiktoken_model)
+    for index, start in enumerate(
+        range(0, len(tokens), max_token_size - overlap_token_size)
+    ):
+        chunk_content = decode_tokens_by_tiktoken(
+            tokens[start : start + max_token_size], model_name=tiktoken_model
+        )
+        yield {
+            "tokens": min(max_token_size, len(tokens) - start),
+            "content": chunk_content.strip(),
+            "chunk_order_index": index,
+        }
+
+
+def make_document(size_mb: float, seed: int = 0) -> str:
+    random.seed(seed)
+    words = [
+        "LightRAG", "retrieval", "augmented", "generation", "graph", "entity",
+        "知识图谱", "检索增强生成", "实体", "关系", "数据", "naïve", "2024", ",", ".",
+    ]  # fmt: skip
+    lines = []
+    size = 0
+    while size < size_mb * 1024 * 1024:
+        line = " ".join(random.choice(words) for _ in range(random.randint(5, 40)))
+        lines.append(line)
+        size += len(line.encode("utf-8")) + 1
+    return "\n".join(lines)
+
+
+def run(name, make_chunks):
+    # 耗时与内存分两次测量，tracemalloc 本身会拖慢 Python 层面的分配
+    start = time.perf_counter()
+    count = sum(1 for _ in make_chunks())
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for _ in make_chunks():
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {name:<8} {count:>7} chunks {elapsed:>8.3f}s  peak {peak / 2**20:>8.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=float, default=20)
+    parser.add_argument("--chunk-token-size", type=int, default=1200)
+    parser.add_argument("--overlap-token-size", type=int, default=100)
+    parser.add_argument(
+        "--models", nargs="+", default=["gpt-4o-mini", "qwen-plus"]
+    )
+    args = parser.parse_args()
+
+    document = make_document(args.size_mb)
+    print(f"document: {len(document)} chars, {args.size_mb} MB")
+    kwargs = dict(
+        overlap_token_size=args.overlap_token_size,
+        max_token_size=args.chunk_token_size,
+    )
+    for model in args.models:
+        try:
+            # 预热分词器，避免把加载词表的时间算进第一个实现
+            list(chunking_by_token_size("warm up", tiktoken_model=model))
+        except Exception as e:
+            print(f"{model}: tokenizer unavailable ({e})")
+            continue
+        print(model)
+        run(
+            "legacy",
+            lambda: legacy_chunking_by_token_size(
+                document, tiktoken_model=model, **kwargs
+            ),
+        )
+        run(
+            "offsets",
+            lambda: chunking_by_token_size(document, tiktoken_model=model, **kwargs),
+        )
+        run(
+            "stream",
+            lambda: chunking_by_token_size_stream(
+                io.StringIO(document), tiktoken_model=model, **kwargs
+            ),
+        )
+        same = list(
+            chunking_by_token_size(document, tiktoken_model=model, **kwargs)
+        ) == list(
+            chunking_by_token_size_stream(
+                io.StringIO(document), tiktoken_model=model, **kwargs
+            )
+        )
+        print(f"  stream output identical to offsets: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+对比 ollama_embedding 与 bedrock_embedding 的旧实现（逐条、同步或串行请求）与批量异步实现的吞吐。
+
+在子进程中启动一个模拟 Ollama /api/embed 与 Bedrock invoke_model 接口的本地服务，
+服务端按请求模拟固定延迟与按文本数增长的计算时间。输出每秒向量数与事件循环的最大卡顿时间。
+
+    python test/benchmark_embedding_providers.py --texts 2048 --callers 8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+import aioboto3
+import numpy as np
+import ollama
+from aiohttp import web
+
+from lightrag.llm import bedrock_embedding, close_provider_clients, ollama_embedding
+
+EMBEDDING_DIM = 256
+
+
+def run_mock_server(port: int, ready, request_latency: float, per_text_latency: float):
+    async def ollama_embed(request):
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(request_latency + per_text_latency * len(texts))
+        return web.json_response(
+            {"model": body["model"], "embeddings": [[0.1] * EMBEDDING_DIM] * len(texts)}
+        )
+
+    async def bedrock_invoke(request):
+        body = json.loads(await request.read())
+        if "texts" in body:
+            await asyncio.sleep(request_latency + per_text_latency * len(body["texts"]))
+            return web.json_response(
+                {"embeddings": [[0.1] * EMBEDDING_DIM] * len(body["texts"])}
+            )
+        await asyncio.sleep(request_latency + per_text_latency)
+        return web.json_response({"embedding": [0.1] * EMBEDDING_DIM})
+
+    app = web.Application()
+    app.router.add_post("/api/embed", ollama_embed)
+    app.router.add_post("/model/{model_id}/invoke", bedrock_invoke)
+
+    async def main():
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+async def legacy_ollama_embedding(texts: list[str], embed_model, **kwargs) -> np.ndarray:
+    # 旧实现：同步客户端逐条请求
+    embed_text = []
+    ollama_client = ollama.Client(**kwargs)
+    for text in texts:
+        data = ollama_client.embed(model=embed_model, input=text)
+        embed_text.append(data["embeddings"][0])
+    return np.array(embed_text)
+
+
+async def legacy_bedrock_embedding(texts: list[str], model: str) -> np.ndarray:
+    # 旧实现：每次调用新建会话，Titan 模型逐条串行请求
+    session = aioboto3.Session()
+    async with session.client("bedrock-runtime") as bedrock_async_client:
+        embed_texts = []
+        for text in texts:
+            response = await bedrock_async_client.invoke_model(
+                modelId=model,
+                body=json.dumps({"inputText": text, "embeddingTypes": ["float"]}),
+                accept="application/json",
+                contentType="application/json",
+            )
+            embed_texts.append(json.loads(await response["body"].read())["embedding"])
+        return np.array(embed_texts)
+
+
+async def run(name, embed, texts: list[str], batch_size: int, callers: int):
+    batches = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+    queue = asyncio.Queue()
+    for batch in batches:
+        queue.put_nowait(batch)
+
+    max_lag = 0.0
+    done = False
+
+    async def heartbeat():
+        # 事件循环被阻塞时心跳会延迟
+        nonlocal max_lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            max_lag = max(max_lag, time.perf_counter() - start - 0.001)
+
+    async def caller():
+        while not queue.empty():
+            batch = queue.get_nowait()
+            result = await embed(batch)
+            assert result.shape == (len(batch), EMBEDDING_DIM)
+
+    heartbeat_task = asyncio.ensure_future(heartbeat())
+    start = time.perf_counter()
+    await asyncio.gather(*[caller() for _ in range(callers)])
+    elapsed = time.perf_counter() - start
+    done = True
+    await heartbeat_task
+    print(
+        f"{name:<18} {len(texts) / elapsed:>10.1f} texts/s {elapsed:>8.2f} s "
+        f"{max_lag * 1000:>10.1f} ms"
+    )
+
+
+async def main(args):
+    host = f"http://127.0.0.1:{args.port}"
+    texts = [f"text {i}" for i in range(args.texts)]
+    cases = [
+        (
+            "ollama legacy",
+            lambda batch: legacy_ollama_embedding(batch, "mock", host=host),
+        ),
+        ("ollama batched", lambda batch: ollama_embedding(batch, "mock", host=host)),
+        (
+            "bedrock legacy",
+            lambda batch: legacy_bedrock_embedding(batch, "amazon.titan-embed-text-v2:0"),
+        ),
+        (
+            "bedrock batched",
+            lambda batch: bedrock_embedding(
+                batch, "amazon.titan-embed-text-v2:0", max_concurrency=args.bedrock_concurrency
+            ),
+        ),
+    ]
+    print(f"{'case':<18} {'throughput':>16} {'elapsed':>10} {'max loop lag':>13}")
+    for name, embed in cases:
+        await run(name, embed, texts, args.batch_size, args.callers)
+    await close_provider_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, default=2048)
+    parser.add_argument("--batch-size", type=int, default=32, help="texts per embedding call")
+    parser.add_argument("--callers", type=int, default=8, help="concurrent embedding calls")
+    parser.add_argument("--bedrock-concurrency", type=int, default=8)
+    parser.add_argument("--request-latency", type=float, default=0.005)
+    parser.add_argument("--per-text-latency", type=float, default=0.0005)
+    parser.add_argument("--port", type=int, default=18924)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    # botocore 读取服务专属的 endpoint 环境变量，把 bedrock-runtime 请求发往本地服务
+    os.environ["AWS_ENDPOINT_URL_BEDROCK_RUNTIME"] = f"http://127.0.0.1:{args.port}"
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "mock")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "mock")
+    os.environ.setdefault("AWS_SESSION_TOKEN", "mock")
+
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=run_mock_server,
+        args=(args.port, ready, args.request_latency, args.per_text_latency),
+        daemon=True,
+    )
+    server.start()
+    ready.wait()
+    try:
+        asyncio.run(main(args))
+    finally:
+        server.terminate()
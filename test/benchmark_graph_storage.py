@@ -0,0 +1,131 @@
+"""
+对比 NetworkXStorage（GraphML）与 WALNetworkXStorage（二进制快照 + 增量日志）的落盘与加载耗时。
+
+生成 --nodes 个节点、--edges 条边、属性与 LightRAG 抽取结果相似的随机图，分别计时：
+
+    全量写出 / 加载    write_nx_graph、load_nx_graph 与 write_graph_snapshot、read_graph_snapshot
+    打开存储          NetworkXStorage 解析 GraphML，WALNetworkXStorage 读取已导入的快照
+    增量落盘          改动 --delta 个节点与边后的 index_done_callback
+    落盘后重新打开     WALNetworkXStorage 读取快照并重放 delta.log
+
+    python test/benchmark_graph_storage.py --nodes 500000 --edges 1500000 --delta 1000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+
+import networkx as nx
+
+from lightrag.storage import NetworkXStorage
+from lightrag.wal_graph import WALNetworkXStorage, read_graph_snapshot, write_graph_snapshot
+
+
+def make_graph(nodes: int, edges: int, rng: random.Random) -> nx.Graph:
+    words = [f"词{i}" for i in range(2000)] + [f"word{i}" for i in range(2000)]
+
+    def text(n: int) -> str:
+        return " ".join(rng.choices(words, k=n))
+
+    graph = nx.Graph()
+    names = [f'"ENTITY {i}"' for i in range(nodes)]
+    for name in names:
+        graph.add_node(
+            name,
+            entity_type='"PERSON"',
+            description=text(30),
+            source_id=f"chunk-{rng.getrandbits(64):016x}",
+        )
+    # 重复的边会被合并，实际边数可能略少于 edges
+    for _ in range(edges):
+        graph.add_edge(
+            rng.choice(names),
+            rng.choice(names),
+            weight=float(rng.randint(1, 10)),
+            description=text(20),
+            keywords=text(3),
+            source_id=f"chunk-{rng.getrandbits(64):016x}",
+        )
+    return graph
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+async def apply_delta(storage, graph: nx.Graph, count: int, rng: random.Random):
+    names = list(graph.nodes)
+    for i in range(count):
+        if i % 2:
+            await storage.upsert_node(rng.choice(names), {"description": f"updated {i}"})
+        else:
+            await storage.upsert_edge(
+                rng.choice(names), rng.choice(names), {"weight": 1.0, "description": f"new {i}"}
+            )
+
+
+async def main(args):
+    rng = random.Random(0)
+    graph = make_graph(args.nodes, args.edges, rng)
+    working_dir = tempfile.mkdtemp()
+    graphml_file = os.path.join(working_dir, "graph_bench.graphml")
+    snapshot_file = os.path.join(working_dir, "graph_bench.bin")
+
+    print(f"{graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges")
+    print(f"{'':<28} {'GraphML':>12} {'WAL':>12}")
+    _, graphml_write = timed(NetworkXStorage.write_nx_graph, graph, graphml_file)
+    _, snapshot_write = timed(write_graph_snapshot, graph, snapshot_file)
+    print(f"{'full write':<28} {graphml_write:>10.2f} s {snapshot_write:>10.2f} s")
+    _, graphml_load = timed(NetworkXStorage.load_nx_graph, graphml_file)
+    _, snapshot_load = timed(read_graph_snapshot, snapshot_file)
+    print(f"{'full load':<28} {graphml_load:>10.2f} s {snapshot_load:>10.2f} s")
+    print(
+        f"{'file size':<28} {os.path.getsize(graphml_file) / 1024**2:>9.1f} MB "
+        f"{os.path.getsize(snapshot_file) / 1024**2:>9.1f} MB"
+    )
+
+    def open_storage(cls):
+        return cls(
+            namespace="bench", global_config={"working_dir": working_dir}, embedding_func=None
+        )
+
+    # WALNetworkXStorage 首次启动时把 GraphML 导入为快照，之后的启动只读取快照
+    open_storage(WALNetworkXStorage)
+    storages, opened = {}, {}
+    for cls in (NetworkXStorage, WALNetworkXStorage):
+        storages[cls], opened[cls] = timed(open_storage, cls)
+    print(
+        f"{'open storage':<28} {opened[NetworkXStorage]:>10.2f} s "
+        f"{opened[WALNetworkXStorage]:>10.2f} s"
+    )
+
+    flushed = {}
+    for cls, storage in storages.items():
+        await apply_delta(storage, graph, args.delta, random.Random(1))
+        start = time.perf_counter()
+        await storage.index_done_callback()
+        flushed[cls] = time.perf_counter() - start
+    print(
+        f"{f'flush {args.delta} changes':<28} {flushed[NetworkXStorage]:>10.2f} s "
+        f"{flushed[WALNetworkXStorage]:>10.3f} s"
+    )
+
+    # NetworkXStorage 每次落盘都重写完整文件，重新打开的耗时与 open storage 相同
+    _, reopened = timed(open_storage, WALNetworkXStorage)
+    print(f"{'reopen after flush':<28} {opened[NetworkXStorage]:>10.2f} s {reopened:>10.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--edges", type=int, default=300000)
+    parser.add_argument("--delta", type=int, default=1000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(main(args))
@@ -0,0 +1,119 @@
+"""
+对比 JsonKVStorage、WALKVStorage 与 SQLiteKVStorage 的写入耗时、加载耗时、加载后的内存占用与 get_by_ids 延迟。
+
+写入 --records 条模拟文本块（约 --content-bytes 字节的 content 与若干元数据字段），落盘后重新创建存储实例计时加载。
+内存为 tracemalloc 统计的加载后 Python 堆占用（SQLite 自身的页缓存不计入，默认约 2 MB）。
+get_by_ids 每次随机读取 --batch 个 id，分别测试读取整条记录与只读取元数据字段。
+
+    python test/benchmark_kv_storage.py --records 100000 --batch 20
+"""
+
+import argparse
+import asyncio
+import gc
+import logging
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from lightrag.kg.sqlite_impl import SQLiteKVStorage
+from lightrag.storage import JsonKVStorage
+from lightrag.wal_kv import WALKVStorage
+
+STORAGES = {
+    "JsonKVStorage": JsonKVStorage,
+    "WALKVStorage": WALKVStorage,
+    "SQLiteKVStorage": SQLiteKVStorage,
+}
+
+
+def make_records(n: int, content_bytes: int) -> dict[str, dict]:
+    rng = random.Random(0)
+    words = ["graph", "entity", "relation", "retrieval", "chunk", "query", "vector", "keyword"]
+    records = {}
+    for i in range(n):
+        content = []
+        size = 0
+        while size < content_bytes:
+            word = rng.choice(words)
+            content.append(word)
+            size += len(word) + 1
+        records[f"chunk-{i:08d}"] = {
+            "tokens": len(content),
+            "content": " ".join(content),
+            "chunk_order_index": i % 16,
+            "full_doc_id": f"doc-{i // 16:08d}",
+        }
+    return records
+
+
+def make_storage(name: str, working_dir: str):
+    return STORAGES[name](
+        namespace="text_chunks",
+        global_config={"working_dir": working_dir},
+        embedding_func=None,
+    )
+
+
+async def get_latencies(storage, ids: list[str], batch: int, rounds: int, fields):
+    rng = random.Random(1)
+    latencies = []
+    for _ in range(rounds):
+        sample = rng.sample(ids, batch)
+        start = time.perf_counter()
+        await storage.get_by_ids(sample, fields=fields)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def main(args):
+    records = make_records(args.records, args.content_bytes)
+    ids = list(records)
+    print(
+        f"{'storage':<18} {'write':>9} {'load':>9} {'memory':>10} "
+        f"{'get_by_ids p50':>15} {'fields p50':>12}"
+    )
+    for name in args.storages:
+        working_dir = tempfile.mkdtemp()
+        storage = make_storage(name, working_dir)
+        start = time.perf_counter()
+        for i in range(0, len(ids), args.insert_batch):
+            await storage.upsert({k: records[k] for k in ids[i : i + args.insert_batch]})
+            await storage.index_done_callback()
+        write = time.perf_counter() - start
+        del storage
+        gc.collect()
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        storage = make_storage(name, working_dir)
+        load = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        full = await get_latencies(storage, ids, args.batch, args.rounds, None)
+        projected = await get_latencies(
+            storage, ids, args.batch, args.rounds, {"full_doc_id", "chunk_order_index"}
+        )
+        print(
+            f"{name:<18} {write:>7.2f} s {load:>7.2f} s {memory / 1024**2:>7.1f} MB "
+            f"{statistics.median(full) * 1000:>12.3f} ms "
+            f"{statistics.median(projected) * 1000:>9.3f} ms"
+        )
+        del storage
+        gc.collect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--content-bytes", type=int, default=4000)
+    parser.add_argument("--insert-batch", type=int, default=1000, help="records per upsert + index_done_callback")
+    parser.add_argument("--batch", type=int, default=20, help="ids per get_by_ids")
+    parser.add_argument("--rounds", type=int, default=500)
+    parser.add_argument("--storages", nargs="+", default=list(STORAGES))
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(main(args))
@@ -0,0 +1,138 @@
+"""
+对比 NanoVectorDBStorage 与 MmapVectorDBStorage（float32、float16、int8）的加载耗时、内存占用、QPS 与 recall@k。
+
+先在主进程中写入 --vectors 个随机向量，再为每种存储启动一个新进程计时加载、查询，
+RSS 为加载后与执行全部查询后相对进程启动时的增量（mmap 的页面属于页缓存，可由多个进程共享）。
+recall@k 以 NanoVectorDBStorage 的精确结果为准。
+
+    python test/benchmark_mmap_vector_storage.py --vectors 200000 --dim 768 --queries 200
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from lightrag.kg.mmap_impl import MmapVectorDBStorage
+from lightrag.storage import NanoVectorDBStorage
+from lightrag.utils import EmbeddingFunc, current_rss_bytes
+
+STORAGES = {
+    "NanoVectorDBStorage": (NanoVectorDBStorage, None),
+    "Mmap float32": (MmapVectorDBStorage, "float32"),
+    "Mmap float16": (MmapVectorDBStorage, "float16"),
+    "Mmap int8": (MmapVectorDBStorage, "int8"),
+}
+
+
+def make_vectors(n: int, dim: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def make_storage(name: str, working_dir: str, dim: int, vectors: dict):
+    cls, dtype = STORAGES[name]
+
+    async def embed(texts: list[str]) -> np.ndarray:
+        return np.stack([vectors[text] for text in texts])
+
+    return cls(
+        namespace="bench",
+        global_config={
+            "working_dir": working_dir,
+            "embedding_batch_num": 4096,
+            "cosine_better_than_threshold": -1.0,
+            "mmap_vector_dtype": dtype,
+        },
+        embedding_func=EmbeddingFunc(embedding_dim=dim, max_token_size=8192, func=embed),
+    )
+
+
+def measure(name: str, working_dir: str, args, output):
+    logging.disable(logging.INFO)
+    query_vectors = make_vectors(args.queries, args.dim, seed=1)
+    vectors = {f"q{i}": v for i, v in enumerate(query_vectors)}
+    rss = current_rss_bytes()
+    start = time.perf_counter()
+    storage = make_storage(name, working_dir, args.dim, vectors)
+    load = time.perf_counter() - start
+    load_rss = current_rss_bytes() - rss
+
+    async def run():
+        results, latencies = [], []
+        for i in range(args.queries):
+            start = time.perf_counter()
+            found = await storage.query(f"q{i}", top_k=args.top_k)
+            latencies.append(time.perf_counter() - start)
+            results.append([r["id"] for r in found])
+        return results, latencies
+
+    results, latencies = asyncio.run(run())
+    output.put(
+        {
+            "load": load,
+            "load_rss": load_rss,
+            "query_rss": current_rss_bytes() - rss,
+            "qps": len(latencies) / sum(latencies),
+            "p50": statistics.median(latencies),
+            "results": results,
+        }
+    )
+
+
+async def build(name: str, working_dir: str, args):
+    data_vectors = make_vectors(args.vectors, args.dim, seed=0)
+    vectors = {f"v{i}": v for i, v in enumerate(data_vectors)}
+    storage = make_storage(name, working_dir, args.dim, vectors)
+    await storage.upsert({key: {"content": key} for key in vectors})
+    await storage.index_done_callback()
+
+
+def main(args):
+    context = multiprocessing.get_context("spawn")
+    print(
+        f"{'storage':<20} {'files':>10} {'load':>10} {'RSS load':>10} {'RSS query':>10} "
+        f"{'QPS':>8} {'p50':>10} {'recall@' + str(args.top_k):>10}"
+    )
+    exact = None
+    for name in args.storages:
+        working_dir = tempfile.mkdtemp()
+        asyncio.run(build(name, working_dir, args))
+        files = sum(
+            os.path.getsize(os.path.join(working_dir, f)) for f in os.listdir(working_dir)
+        )
+        output = context.Queue()
+        process = context.Process(target=measure, args=(name, working_dir, args, output))
+        process.start()
+        stats = output.get()
+        process.join()
+        if exact is None:
+            exact = stats["results"]
+        recall = statistics.mean(
+            len(set(found) & set(truth)) / len(truth)
+            for found, truth in zip(stats["results"], exact)
+        )
+        print(
+            f"{name:<20} {files / 1024**2:>7.1f} MB {stats['load'] * 1000:>7.1f} ms "
+            f"{stats['load_rss'] / 1024**2:>7.1f} MB {stats['query_rss'] / 1024**2:>7.1f} MB "
+            f"{stats['qps']:>8.1f} {stats['p50'] * 1000:>7.2f} ms {recall:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument(
+        "--storages", nargs="+", default=list(STORAGES), help="the first one is the recall baseline"
+    )
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    main(args)
@@ -0,0 +1,173 @@
+"""
+对比每次调用新建 provider 客户端（旧实现）与共享连接池客户端的吞吐。
+
+在子进程中启动一个模拟 OpenAI 接口的本地 HTTP 服务，分别用两种方式并发调用
+chat completions 与 embeddings，输出每秒请求数与服务端看到的 TCP 连接数。
+
+    python test/benchmark_provider_clients.py --requests 2000 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import time
+
+from aiohttp import web
+from openai import AsyncOpenAI
+
+from lightrag.llm import (
+    close_provider_clients,
+    configure_provider_clients,
+    openai_complete_if_cache,
+    openai_embedding,
+    provider_clients,
+)
+
+EMBEDDING_DIM = 256
+
+
+def run_mock_server(port: int, ready):
+    connections = set()
+
+    async def chat_completions(request):
+        connections.add(request.transport.get_extra_info("peername"))
+        await request.json()
+        return web.json_response(
+            {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "mock",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "ok"},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            }
+        )
+
+    async def embeddings(request):
+        connections.add(request.transport.get_extra_info("peername"))
+        body = await request.json()
+        return web.json_response(
+            {
+                "object": "list",
+                "model": "mock",
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": [0.1] * EMBEDDING_DIM}
+                    for i in range(len(body["input"]))
+                ],
+                "usage": {"prompt_tokens": 1, "total_tokens": 1},
+            }
+        )
+
+    async def stats(request):
+        count = len(connections)
+        connections.clear()
+        return web.json_response({"connections": count})
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/embeddings", embeddings)
+    app.router.add_get("/stats", stats)
+
+    async def main():
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+async def legacy_complete(base_url: str, prompt: str) -> str:
+    # 旧实现：每次调用新建客户端
+    client = AsyncOpenAI(api_key="mock", base_url=base_url)
+    response = await client.chat.completions.create(
+        model="mock", messages=[{"role": "user", "content": prompt}]
+    )
+    return response.choices[0].message.content
+
+
+async def legacy_embedding(base_url: str, texts: list[str]):
+    client = AsyncOpenAI(api_key="mock", base_url=base_url)
+    response = await client.embeddings.create(
+        model="mock", input=texts, encoding_format="float"
+    )
+    return [dp.embedding for dp in response.data]
+
+
+async def pooled_complete(base_url: str, prompt: str) -> str:
+    return await openai_complete_if_cache(
+        "mock", prompt, base_url=base_url, api_key="mock"
+    )
+
+
+async def pooled_embedding(base_url: str, texts: list[str]):
+    return await openai_embedding.func(texts, base_url=base_url, api_key="mock")
+
+
+async def run(name, call, base_url, stats_url, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await call(base_url, i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    elapsed = time.perf_counter() - start
+    client = AsyncOpenAI(api_key="mock", base_url=base_url)
+    connections = (await client.get(stats_url, cast_to=object))["connections"]
+    await client.close()
+    print(
+        f"{name:<22} {requests / elapsed:>10.1f} req/s {elapsed:>8.2f} s "
+        f"{connections:>6} connections"
+    )
+
+
+async def main(args):
+    base_url = f"http://127.0.0.1:{args.port}/v1"
+    stats_url = f"http://127.0.0.1:{args.port}/stats"
+    configure_provider_clients(
+        max_connections=args.concurrency, max_keepalive_connections=args.concurrency
+    )
+    texts = [f"text {i}" for i in range(args.batch)]
+    cases = [
+        ("chat per-call client", lambda url, i: legacy_complete(url, f"prompt {i}")),
+        ("chat pooled client", lambda url, i: pooled_complete(url, f"prompt {i}")),
+        ("embed per-call client", lambda url, i: legacy_embedding(url, texts)),
+        ("embed pooled client", lambda url, i: pooled_embedding(url, texts)),
+    ]
+    print(f"{'case':<22} {'throughput':>14} {'elapsed':>10} {'server':>18}")
+    for name, call in cases:
+        await run(name, call, base_url, stats_url, args.requests, args.concurrency)
+    print(f"pooled clients: {provider_clients.metrics()}")
+    await close_provider_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--batch", type=int, default=8, help="texts per embedding call")
+    parser.add_argument("--port", type=int, default=18923)
+    args = parser.parse_args()
+    # 逐请求的 HTTP 日志会主导耗时
+    logging.disable(logging.INFO)
+
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=run_mock_server, args=(args.port, ready), daemon=True
+    )
+    server.start()
+    ready.wait()
+    try:
+        asyncio.run(main(args))
+    finally:
+        server.terminate()
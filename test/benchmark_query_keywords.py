@@ -0,0 +1,105 @@
+"""
+对比查询关键词提取在无缓存、冷缓存与热缓存下的延迟，以及同一查询并发请求时的 LLM 调用次数。
+
+模拟的 LLM 每次调用固定延迟 --llm-latency 秒。cold 为每个查询首次提取，warm 为缓存命中，
+concurrent 为 --concurrency 个相同查询同时到达，cross-mode 为同一查询依次执行 local、global、hybrid 三种模式的关键词提取。
+
+    python test/benchmark_query_keywords.py --queries 50 --llm-latency 0.3
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import tempfile
+import time
+
+from lightrag.keyword_cache import QueryKeywordCache
+from lightrag.operate import extract_query_keywords
+
+
+def make_llm(latency: float, calls: dict):
+    async def llm(prompt, **kwargs):
+        calls["n"] += 1
+        await asyncio.sleep(latency)
+        return '{"high_level_keywords": ["topic"], "low_level_keywords": ["entity"]}'
+
+    return llm
+
+
+async def timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return time.perf_counter() - start
+
+
+def report(name: str, latencies: list[float], calls: int):
+    print(
+        f"{name:<22} {statistics.median(latencies) * 1000:>10.2f} ms "
+        f"{max(latencies) * 1000:>10.2f} ms {calls:>10}"
+    )
+
+
+async def main(args):
+    queries = [f"What does entity {i} have to do with topic {i % 7}?" for i in range(args.queries)]
+    calls = {"n": 0}
+    global_config = {
+        "working_dir": tempfile.mkdtemp(),
+        "llm_model_func": make_llm(args.llm_latency, calls),
+    }
+    cache = QueryKeywordCache(namespace="query_keywords_cache", global_config=global_config)
+
+    print(f"{'case':<22} {'p50':>13} {'max':>13} {'LLM calls':>10}")
+
+    calls["n"] = 0
+    latencies = [await timed(extract_query_keywords(q, global_config)) for q in queries]
+    report("no cache", latencies, calls["n"])
+
+    calls["n"] = 0
+    latencies = [await timed(extract_query_keywords(q, global_config, cache)) for q in queries]
+    report("cold cache", latencies, calls["n"])
+
+    calls["n"] = 0
+    # 大小写与空白不同的查询规范化后命中同一条缓存
+    latencies = [
+        await timed(extract_query_keywords(f"  {q.upper()} ", global_config, cache))
+        for q in queries
+    ]
+    report("warm cache", latencies, calls["n"])
+
+    for name, keywords_cache in [("concurrent no cache", None), ("concurrent cache", cache)]:
+        calls["n"] = 0
+        latencies = []
+        for i in range(args.queries):
+            query = f"fresh query {name} {i}"
+            latencies += await asyncio.gather(
+                *[
+                    timed(extract_query_keywords(query, global_config, keywords_cache))
+                    for _ in range(args.concurrency)
+                ]
+            )
+        report(name, latencies, calls["n"])
+
+    for name, keywords_cache in [("cross-mode no cache", None), ("cross-mode cache", cache)]:
+        calls["n"] = 0
+        latencies = []
+        for i in range(args.queries):
+            query = f"cross mode query {name} {i}"
+            # local、global、hybrid 各提取一次
+            latencies += [
+                await timed(extract_query_keywords(query, global_config, keywords_cache))
+                for _ in range(3)
+            ]
+        report(name, latencies, calls["n"])
+
+    print(f"cache metrics: {cache.metrics()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8, help="identical queries in flight")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds per LLM call")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(main(args))
@@ -0,0 +1,184 @@
+"""
+对比 aquery 与 aquery_stream 的首字延迟（time to first token）与完整回答耗时。
+
+在子进程中启动一个模拟 OpenAI chat completions 接口的本地服务：实体提取与关键词提取请求立即返回，
+回答请求按 --tokens 个 token、每个 token 间隔 --token-latency 秒生成，流式请求以 SSE 逐块返回。
+aquery 的首字延迟即完整回答耗时。
+
+    python test/benchmark_query_stream.py --queries 5 --tokens 200 --token-latency 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from aiohttp import web
+
+from lightrag import LightRAG, QueryParam
+from lightrag.llm import close_provider_clients, openai_complete_if_cache
+from lightrag.utils import EmbeddingFunc
+
+EMBEDDING_DIM = 64
+
+
+def run_mock_server(port: int, ready, tokens: int, token_latency: float):
+    def completion(content: str) -> dict:
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "mock",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+        }
+
+    def chunk(content: str) -> bytes:
+        data = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "mock",
+            "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+        }
+        return f"data: {json.dumps(data)}\n\n".encode()
+
+    async def chat_completions(request):
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        if body["messages"][0]["role"] != "system":
+            if "高级和低级关键词" in prompt:
+                content = '{"high_level_keywords": ["topic"], "low_level_keywords": ["ALICE"]}'
+            else:
+                # 实体提取
+                content = (
+                    '("entity"<|>"ALICE"<|>"PERSON"<|>"Alice is a person")##'
+                    '("entity"<|>"BOB"<|>"PERSON"<|>"Bob is a person")##'
+                    '("relationship"<|>"ALICE"<|>"BOB"<|>"friends"<|>"topic"<|>2)<|COMPLETE|>'
+                )
+            return web.json_response(completion(content))
+
+        if not body.get("stream"):
+            await asyncio.sleep(tokens * token_latency)
+            return web.json_response(completion("word " * tokens))
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for _ in range(tokens):
+            await asyncio.sleep(token_latency)
+            await response.write(chunk("word "))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+
+    async def main():
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+async def embed(texts: list[str]) -> np.ndarray:
+    # 所有向量共享一个分量，保证向量检索能命中
+    vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    vectors[:, 0] = 1.0
+    for i, text in enumerate(texts):
+        for word in text.lower().split():
+            vectors[i, 1 + hash(word) % (EMBEDDING_DIM - 1)] += 1.0
+    return vectors
+
+
+async def main(args):
+    base_url = f"http://127.0.0.1:{args.port}/v1"
+
+    async def llm(prompt, system_prompt=None, history_messages=[], **kwargs):
+        return await openai_complete_if_cache(
+            "mock",
+            prompt,
+            system_prompt=system_prompt,
+            history_messages=history_messages,
+            base_url=base_url,
+            api_key="mock",
+            **kwargs,
+        )
+
+    rag = LightRAG(
+        working_dir=tempfile.mkdtemp(),
+        llm_model_func=llm,
+        tiktoken_model_name="qwen-plus",
+        enable_llm_cache=False,
+        embedding_func=EmbeddingFunc(
+            embedding_dim=EMBEDDING_DIM, max_token_size=8192, func=embed
+        ),
+    )
+    await rag.ainsert(["Alice and Bob are friends who talk about the topic."])
+
+    print(f"{'case':<24} {'first token p50':>16} {'full answer p50':>16}")
+    for mode in args.modes:
+        param = QueryParam(mode=mode)
+        full = []
+        for i in range(args.queries):
+            start = time.perf_counter()
+            await rag.aquery(f"who is alice {i}", param)
+            full.append(time.perf_counter() - start)
+        # 非流式查询的首字即完整回答
+        print(
+            f"{'aquery ' + mode:<24} {statistics.median(full) * 1000:>13.1f} ms "
+            f"{statistics.median(full) * 1000:>13.1f} ms"
+        )
+
+        first, full = [], []
+        for i in range(args.queries):
+            start = time.perf_counter()
+            first_token = None
+            async for _ in rag.aquery_stream(f"who is alice stream {i}", param):
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+            first.append(first_token)
+            full.append(time.perf_counter() - start)
+        print(
+            f"{'aquery_stream ' + mode:<24} {statistics.median(first) * 1000:>13.1f} ms "
+            f"{statistics.median(full) * 1000:>13.1f} ms"
+        )
+    await close_provider_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=5)
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per answer")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="seconds per token")
+    parser.add_argument(
+        "--modes", nargs="+", default=["naive", "local", "global", "hybrid"]
+    )
+    parser.add_argument("--port", type=int, default=18925)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=run_mock_server,
+        args=(args.port, ready, args.tokens, args.token_latency),
+        daemon=True,
+    )
+    server.start()
+    ready.wait()
+    try:
+        asyncio.run(main(args))
+    finally:
+        server.terminate()
@@ -0,0 +1,95 @@
+"""
+对比向量存储逐条 query 与不同批大小 query_batch 的 QPS。
+
+模拟的 embedding 函数每次调用固定延迟 --embedding-latency 秒（与文本条数无关），
+批量查询只调用一次 embedding，并用一次矩阵乘法（或一次 knn_query）检索整批查询。
+
+    python test/benchmark_vector_query_batch.py --vectors 100000 --queries 512 --batch-sizes 1 8 64
+"""
+
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+
+import numpy as np
+
+from lightrag.kg.hnsw_impl import HNSWVectorDBStorage
+from lightrag.kg.mmap_impl import MmapVectorDBStorage
+from lightrag.storage import NanoVectorDBStorage
+from lightrag.utils import EmbeddingFunc
+
+STORAGES = {
+    "NanoVectorDBStorage": NanoVectorDBStorage,
+    "MmapVectorDBStorage": MmapVectorDBStorage,
+    "HNSWVectorDBStorage": HNSWVectorDBStorage,
+}
+
+
+async def main(args):
+    rng = np.random.default_rng(0)
+    vectors = {
+        f"v{i}": v
+        for i, v in enumerate(rng.standard_normal((args.vectors, args.dim)).astype(np.float32))
+    }
+    vectors.update(
+        {
+            f"q{i}": v
+            for i, v in enumerate(rng.standard_normal((args.queries, args.dim)).astype(np.float32))
+        }
+    )
+    loading = {"done": False}
+
+    async def embed(texts: list[str]) -> np.ndarray:
+        if loading["done"]:
+            await asyncio.sleep(args.embedding_latency)
+        return np.stack([vectors[text] for text in texts])
+
+    embedding_func = EmbeddingFunc(embedding_dim=args.dim, max_token_size=8192, func=embed)
+    queries = [f"q{i}" for i in range(args.queries)]
+
+    print(f"{'storage':<22} {'mode':<16} {'QPS':>10}")
+    for name in args.storages:
+        loading["done"] = False
+        storage = STORAGES[name](
+            namespace="bench",
+            global_config={
+                "working_dir": tempfile.mkdtemp(),
+                "embedding_batch_num": 4096,
+                "mmap_vector_dtype": "float32",
+            },
+            embedding_func=embedding_func,
+        )
+        await storage.upsert(
+            {f"v{i}": {"content": f"v{i}"} for i in range(args.vectors)}
+        )
+        loading["done"] = True
+
+        start = time.perf_counter()
+        for query in queries:
+            await storage.query(query, top_k=args.top_k)
+        print(f"{name:<22} {'query':<16} {len(queries) / (time.perf_counter() - start):>10.1f}")
+
+        for batch_size in args.batch_sizes:
+            start = time.perf_counter()
+            for i in range(0, len(queries), batch_size):
+                await storage.query_batch(queries[i : i + batch_size], top_k=args.top_k)
+            qps = len(queries) / (time.perf_counter() - start)
+            print(f"{name:<22} {f'query_batch {batch_size}':<16} {qps:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=512)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument(
+        "--embedding-latency", type=float, default=0.005, help="seconds per embedding call"
+    )
+    parser.add_argument("--storages", nargs="+", default=list(STORAGES))
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(main(args))
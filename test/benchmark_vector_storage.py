@@ -0,0 +1,118 @@
+"""
+对比 HNSWVectorDBStorage 与精确检索的 NanoVectorDBStorage 的 recall@k 与查询延迟。
+
+生成 --vectors 个带聚类结构的随机向量写入两种存储，随机取 --queries 个查询，
+以 NanoVectorDBStorage 的结果为准计算 HNSW 在不同 ef 下的 recall@k。
+
+    python test/benchmark_vector_storage.py --vectors 100000 --dim 128 --top-k 20 --ef 32 64 128 256
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from lightrag.kg.hnsw_impl import HNSWVectorDBStorage
+from lightrag.storage import NanoVectorDBStorage
+from lightrag.utils import EmbeddingFunc
+
+
+def make_vectors(n: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)]
+    return vectors + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def make_storage(cls, working_dir: str, embedding_func: EmbeddingFunc, **config):
+    return cls(
+        namespace="bench",
+        global_config={
+            "working_dir": working_dir,
+            "embedding_batch_num": 1024,
+            # 不按相似度过滤，只比较排序
+            "cosine_better_than_threshold": -1.0,
+            **config,
+        },
+        embedding_func=embedding_func,
+    )
+
+
+async def timed_queries(storage, queries: list[str], top_k: int):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append([r["id"] for r in await storage.query(query, top_k=top_k)])
+        latencies.append(time.perf_counter() - start)
+    return results, latencies
+
+
+async def main(args):
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.vectors, args.dim, args.clusters, rng)
+    query_vectors = make_vectors(args.queries, args.dim, args.clusters, rng)
+    lookup = {f"v{i}": v for i, v in enumerate(vectors)}
+    lookup.update({f"q{i}": v for i, v in enumerate(query_vectors)})
+
+    async def embed(texts: list[str]) -> np.ndarray:
+        return np.stack([lookup[text] for text in texts])
+
+    embedding_func = EmbeddingFunc(embedding_dim=args.dim, max_token_size=8192, func=embed)
+    data = {f"v{i}": {"content": f"v{i}"} for i in range(args.vectors)}
+    queries = [f"q{i}" for i in range(args.queries)]
+
+    print(f"{'storage':<28} {'build':>9} {'recall@' + str(args.top_k):>10} {'p50':>10} {'p99':>10}")
+
+    nano = make_storage(NanoVectorDBStorage, tempfile.mkdtemp(), embedding_func)
+    start = time.perf_counter()
+    await nano.upsert(data)
+    build = time.perf_counter() - start
+    exact, latencies = await timed_queries(nano, queries, args.top_k)
+    latencies.sort()
+    print(
+        f"{'NanoVectorDBStorage (exact)':<28} {build:>7.2f} s {1.0:>10.3f} "
+        f"{statistics.median(latencies) * 1000:>7.2f} ms "
+        f"{latencies[int(len(latencies) * 0.99)] * 1000:>7.2f} ms"
+    )
+
+    hnsw = make_storage(
+        HNSWVectorDBStorage,
+        tempfile.mkdtemp(),
+        embedding_func,
+        hnsw_m=args.m,
+        hnsw_ef_construction=args.ef_construction,
+    )
+    start = time.perf_counter()
+    await hnsw.upsert(data)
+    build = time.perf_counter() - start
+    for ef in args.ef:
+        hnsw.ef_search = ef
+        results, latencies = await timed_queries(hnsw, queries, args.top_k)
+        recall = statistics.mean(
+            len(set(found) & set(truth)) / len(truth)
+            for found, truth in zip(results, exact)
+        )
+        latencies.sort()
+        print(
+            f"{f'HNSW M={args.m} ef={ef}':<28} {build:>7.2f} s {recall:>10.3f} "
+            f"{statistics.median(latencies) * 1000:>7.2f} ms "
+            f"{latencies[int(len(latencies) * 0.99)] * 1000:>7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef", type=int, nargs="+", default=[32, 64, 128, 256])
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(main(args))
@@ -0,0 +1,83 @@
+"""
+流式切分与一次性切分的一致性测试，覆盖 tiktoken 与 dashscope Qwen 分词器两条路径。
+
+    python -m pytest test/test_chunking.py
+"""
+
+import io
+import random
+
+import pytest
+import tiktoken
+
+import lightrag.utils as utils
+from lightrag.operate import chunking_by_token_size, chunking_by_token_size_stream
+
+# cl100k_base 的预分词规则
+CL100K_PAT_STR = (
+    r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*"""
+    r"""|\s*[\r\n]|\s+(?!\S)|\s+"""
+)
+
+
+def make_document(chars: int, seed: int = 0) -> str:
+    """超过 Qwen 分词器分段长度的文档：短行、空行、超长无换行的行、组合字符与中文"""
+    rng = random.Random(seed)
+    words = [
+        "LightRAG", "retrieval", "graph", "知识图谱", "检索增强生成", "实体", "2024",
+        ",", ".", "naïve", "naïve", "é", "́", "  ", "\t", "\r\n", "\n\n",
+    ]  # fmt: skip
+    lines = []
+    size = 0
+    while size < chars:
+        count = rng.choice([0, 3, 20, 60, 30000])
+        line = " ".join(rng.choice(words) for _ in range(count))
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+
+def pieces(text: str, size: int):
+    for start in range(0, len(text), size):
+        yield text[start : start + size]
+
+
+def assert_stream_matches(document: str, model: str, **stream_kwargs):
+    kwargs = dict(overlap_token_size=100, max_token_size=1200, tiktoken_model=model)
+    expected = list(chunking_by_token_size(document, **kwargs))
+    for size in (61, 4093, 1 << 16):
+        actual = list(
+            chunking_by_token_size_stream(pieces(document, size), **kwargs, **stream_kwargs)
+        )
+        assert actual == expected
+    assert list(chunking_by_token_size_stream(io.StringIO(document), **kwargs)) == expected
+
+
+@pytest.fixture
+def tiktoken_encoder(monkeypatch):
+    """gpt-4o 的词表需要联网下载，不可用时用 Qwen 的词表与 cl100k 的预分词规则构造编码器"""
+    try:
+        encoder = tiktoken.encoding_for_model("gpt-4o")
+    except Exception:
+        qwen = utils._get_tokenizer("qwen-plus")
+        encoder = tiktoken.Encoding(
+            "cl100k_test",
+            pat_str=CL100K_PAT_STR,
+            mergeable_ranks=qwen._mergeable_ranks,
+            special_tokens={},
+        )
+    monkeypatch.setattr(utils, "ENCODER", encoder)
+    return encoder
+
+
+def test_stream_matches_one_shot_tiktoken(tiktoken_encoder):
+    document = make_document(300_000)
+    assert_stream_matches(
+        document, "gpt-4o", min_segment_chars=2000, max_pending_chars=1 << 20
+    )
+
+
+def test_stream_matches_one_shot_qwen():
+    assert utils.tokenizer_split_size("qwen-plus") is not None
+    assert_stream_matches(make_document(300_000, seed=1), "qwen-plus")
+    assert_stream_matches(make_document(5_000, seed=2), "qwen-plus")
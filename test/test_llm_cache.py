@@ -0,0 +1,49 @@
+"""
+SegmentedLLMCacheStorage 的回归测试。
+
+    python -m pytest test/test_llm_cache.py
+"""
+
+import asyncio
+import os
+import tempfile
+
+from lightrag.llm_cache import SegmentedLLMCacheStorage
+
+
+def make_cache(working_dir: str, **config) -> SegmentedLLMCacheStorage:
+    return SegmentedLLMCacheStorage(
+        namespace="llm_response_cache",
+        global_config={"working_dir": working_dir, **config},
+        embedding_func=None,
+    )
+
+
+def test_compact_dead_segments_after_restart():
+    """重启后没有打开的写入文件时，压缩完全失效的已封存段"""
+    working_dir = tempfile.mkdtemp()
+    config = {"llm_cache_segment_bytes": 256, "llm_cache_max_bytes": 400}
+
+    async def fill():
+        cache = make_cache(working_dir, **config)
+        for i in range(20):
+            await cache.upsert({f"key-{i}": {"return": "x" * 40, "model": "m"}})
+        # 只落盘，不触发压缩
+        cache._writer.flush()
+        return len(cache._segments)
+
+    async def restart_and_compact():
+        cache = make_cache(working_dir, **config)
+        assert cache._writer is None
+        await cache.index_done_callback()
+        assert cache._compaction_task is not None
+        await cache._compaction_task
+        return cache
+
+    segments = asyncio.run(fill())
+    assert segments > 2
+    cache = asyncio.run(restart_and_compact())
+    assert len(cache._segments) < segments
+    assert asyncio.run(cache.get_by_id("key-19")) == {"return": "x" * 40, "model": "m"}
+    assert asyncio.run(cache.get_by_id("key-0")) is None
+    assert len(os.listdir(cache._dir)) == len(cache._segments)